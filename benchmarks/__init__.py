@@ -0,0 +1,6 @@
+'''
+基准测试套件和确定性的合成mod生成器，用于比较不同提交的性能
+python -m benchmarks [-h]
+'''
+from benchmarks.generate import generate_mod,generate_texts,make_text,unit_text
+from benchmarks.suite import BENCHMARKS,BYTES,Regression,compare,measure,measure_memory,run
@@ -0,0 +1,50 @@
+'''
+命令行入口：python -m benchmarks [--sizes 10 100 1000] [--output results.json] [--baseline old.json]
+结果以JSON写入--output指定的文件(默认输出到标准输出)，进度输出到标准错误
+指定--baseline时与之前的结果比较，存在退化时返回1
+'''
+import argparse
+import json
+import sys
+from typing import List,Optional
+
+from benchmarks.suite import BENCHMARKS,REPEAT_DEFAULT,SIZES_DEFAULT,THRESHOLD_DEFAULT,Regression,compare,run
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(prog='python -m benchmarks',description='rwpy基准测试')
+    parser.add_argument('-s','--sizes',type=int,nargs='+',default=SIZES_DEFAULT,help='单位数')
+    parser.add_argument('-r','--repeat',type=int,default=REPEAT_DEFAULT,help='每项测量次数')
+    parser.add_argument('-b','--bench',nargs='+',choices=list(BENCHMARKS),help='只运行指定的基准')
+    parser.add_argument('-o','--output',help='结果JSON文件')
+    parser.add_argument('--baseline',help='用于比较的之前的结果JSON文件')
+    parser.add_argument('--threshold',type=float,default=THRESHOLD_DEFAULT,help='视为退化的耗时(或内存)倍数')
+    args = parser.parse_args(argv)
+
+    def progress(result: dict):
+        print('{0:<12}{1:>8}  best {2:10.6f}{4}  median {3:10.6f}{4}'.format(result['name'],result['size'],
+        result['best'],result['median'],result['unit']),file=sys.stderr)
+
+    results: dict = run(args.bench,args.sizes,args.repeat,progress)
+
+    if args.output is None:
+        json.dump(results,sys.stdout,indent=1)
+        sys.stdout.write('\n')
+    else:
+        with open(args.output,'w',encoding='utf-8') as f:
+            json.dump(results,f,indent=1)
+
+    if args.baseline is None:
+        return 0
+
+    with open(args.baseline,'r',encoding='utf-8') as f:
+        regressions: List[Regression] = compare(json.load(f),results,args.threshold)
+
+    for regression in regressions:
+        print('退化: {0} size={1} {2:.6f}{5} -> {3:.6f}{5} (x{4:.2f})'.format(*regression),file=sys.stderr)
+
+    return 1 if len(regressions) > 0 else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
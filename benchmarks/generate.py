@@ -0,0 +1,171 @@
+'''
+确定性的合成mod生成器
+每个单位的内容只由种子和单位序号决定，不同规模的mod中同一序号的单位完全相同，便于比较不同规模下的结果
+'''
+import os
+from random import Random
+from typing import Dict,List,Optional
+
+
+TIERS: int = 4
+GROUP_SIZE: int = 50
+
+MOD_INFO: str = '''[mod]
+title: benchmark
+description: 生成的基准测试mod
+tags: units
+'''
+
+_MOVEMENT: List[str] = ['LAND','AIR','HOVER','WATER','BUILDING']
+_ACTIONS: List[str] = ['upgrade','convert','repair','cloak','deploy']
+
+
+def template_path(tier: int) -> str:
+    '''第tier级模板的相对路径，tier级模板copyFrom第tier-1级，形成copyFrom链'''
+    return os.path.join('units','templates','tier_{0}.template'.format(tier))
+
+
+def unit_path(i: int) -> str:
+    '''第i个单位的相对路径，每GROUP_SIZE个单位一个文件夹'''
+    return os.path.join('units','group_{0}'.format(i // GROUP_SIZE),'unit_{0}.ini'.format(i))
+
+
+def template_text(tier: int) -> str:
+    '''第tier级模板的文本'''
+    parts: List[str] = ['# 第{0}级模板'.format(tier),'[core]']
+    if tier > 0:
+        parts.append('copyFrom: tier_{0}.template'.format(tier - 1))
+    parts.extend([
+    'techLevel: {0}'.format(tier + 1),
+    'maxHp: {0}'.format(200 * (tier + 1)),
+    'fogOfWarSightRange: {0}'.format(10 + tier),
+    '',
+    '[graphics]',
+    'teamColorsUseHue: true',
+    'shadowOffsetX: {0}'.format(tier),
+    '',
+    '[attack]',
+    'canAttack: true',
+    'turretMultiTargeting: {0}'.format('true' if tier % 2 == 0 else 'false'),
+    '',
+    '[movement]',
+    'movementType: {0}'.format(_MOVEMENT[tier % len(_MOVEMENT)]),
+    'moveSpeed: {0:.2f}'.format(1.0 + tier * 0.25),
+    ''])
+    return '\n'.join(parts)
+
+
+def unit_text(i: int,seed: int = 0,copy_from: Optional[str] = None) -> str:
+    '''
+    第i个单位的文本：core、graphics、attack、若干turret_、projectile_和action_段落，
+    含注释、空行和多行文本；copy_from不为None时作为[core]的copyFrom
+    '''
+    rng: Random = Random(seed * 1000003 + i)
+    turrets: int = rng.randint(1,4)
+    projectiles: int = rng.randint(1,3)
+    actions: int = rng.randint(0,3)
+    parts: List[str] = ['# 单位{0}'.format(i),'[core]','name: unit_{0}'.format(i)]
+
+    if copy_from is not None:
+        parts.append('copyFrom: ' + copy_from)
+
+    parts.extend([
+    'price: credits={0}'.format(rng.randrange(100,5000,10)),
+    'maxHp: {0}'.format(rng.randrange(100,8000,50)),
+    'mass: {0}'.format(rng.randrange(100,10000,100)),
+    'radius: {0}'.format(rng.randint(8,60)),
+    'buildSpeed: {0:.2f}'.format(rng.uniform(0.1,2.0)),
+    'displayText: Unit {0}'.format(i),
+    'displayDescription: """',
+    '生成的单位{0}'.format(i),
+    '第{0}行说明'.format(rng.randint(1,9)),
+    '"""',
+    '',
+    '[graphics]',
+    'image: unit_{0}.png'.format(i),
+    'total_frames: {0}'.format(rng.randint(1,8)),
+    'scaleImagesTo: {0}'.format(rng.randint(20,120)),
+    '# 动画',
+    'animation_moving_start: 0',
+    'animation_moving_end: {0}'.format(rng.randint(1,7)),
+    '',
+    '[attack]',
+    'canAttack: true',
+    'canAttackFlyingUnits: {0}'.format(rng.choice(['true','false'])),
+    'maxAttackRange: {0}'.format(rng.randrange(100,800,10)),
+    'shootDelay: {0}'.format(rng.randint(10,120)),
+    ''])
+
+    for t in range(1,turrets + 1):
+        parts.extend([
+        '[turret_{0}]'.format(t),
+        'x: {0}'.format(rng.randint(-20,20)),
+        'y: {0}'.format(rng.randint(-20,20)),
+        'projectile: {0}'.format(rng.randint(1,projectiles)),
+        'turnSpeed: {0:.1f}'.format(rng.uniform(0.5,8.0)),
+        ''])
+
+    for p in range(1,projectiles + 1):
+        parts.extend([
+        '[projectile_{0}]'.format(p),
+        'directDamage: {0}'.format(rng.randrange(5,500,5)),
+        'speed: {0}'.format(rng.randint(2,20)),
+        'life: {0}'.format(rng.randint(20,200)),
+        'frame: {0}'.format(rng.randint(0,5)),
+        ''])
+
+    for a in range(1,actions + 1):
+        parts.extend([
+        '[action_{0}]'.format(a),
+        'text: {0} {1}'.format(rng.choice(_ACTIONS),a),
+        'price: credits={0}'.format(rng.randrange(50,2000,50)),
+        'description: """',
+        '动作{0}的说明'.format(a),
+        '"""',
+        '# 动作{0}结束'.format(a),
+        ''])
+
+    return '\n'.join(parts)
+
+
+def make_text(units: int,seed: int = 0) -> str:
+    '''units个单位连接而成的单个ini文本，大致每个单位40行'''
+    return '\n'.join(unit_text(i,seed) for i in range(0,units))
+
+
+def generate_texts(units: int,seed: int = 0) -> Dict[str,str]:
+    '''
+    合成mod中全部文件的相对路径和文本，按生成顺序排列
+    每个单位copyFrom自己等级的模板；每5个单位中有1个再copyFrom同一文件夹中的前一个单位，
+    最长的copyFrom链为单位->前一个单位->各级模板
+    '''
+    texts: Dict[str,str] = {'mod-info.txt': MOD_INFO}
+
+    for tier in range(0,TIERS):
+        texts[template_path(tier)] = template_text(tier)
+
+    for i in range(0,units):
+        copy_from: str = 'ROOT:units/templates/tier_{0}.template'.format(i % TIERS)
+        if i % 5 == 4:
+            copy_from += ', unit_{0}.ini'.format(i - 1)
+        texts[unit_path(i)] = unit_text(i,seed,copy_from)
+
+    return texts
+
+
+def generate_mod(dir: str,units: int,seed: int = 0) -> List[str]:
+    '''
+    在dir下写入含units个单位的合成mod，返回各ini(含模板)的相对路径
+    抛出IOError异常
+    '''
+    paths: List[str] = []
+
+    for relpath,text in generate_texts(units,seed).items():
+        path: str = os.path.join(dir,relpath)
+        os.makedirs(os.path.dirname(path),exist_ok=True)
+        with open(path,'w',encoding='utf-8') as f:
+            f.write(text)
+        if relpath != 'mod-info.txt':
+            paths.append(relpath)
+
+    return paths
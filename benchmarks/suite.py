@@ -0,0 +1,512 @@
+'''
+基准测试套件：在合成mod上测量解析、输出、编辑、合并、mod读取、打包、索引查询、校验、监视、事务、补全和查找，结果为可保存为JSON的字典
+不同提交的结果由compare比较，耗时增加超过阈值的项目视为性能退化
+'''
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+import zipfile
+from typing import Callable,Dict,Iterable,List,NamedTuple,Optional,Set
+
+import rwpy.compiled as compiled
+from rwpy.code import Attribute,Ini
+from rwpy.codelist import Validator
+from rwpy.completion import CompletionIndex
+from rwpy.diff import diff
+from rwpy.index import ModIndex
+from rwpy.lazy import LazyIni
+from rwpy.lsp import Document
+from rwpy.mod import ArchiveMod,Mod
+from rwpy.parser import ATTRIBUTE,iter_events
+from rwpy.resolver import CopyFromResolver
+from rwpy.values import column
+from rwpy.watch import Watcher
+
+from benchmarks.generate import generate_mod,generate_texts,make_text,unit_path
+
+
+FORMAT_VERSION: int = 1
+SIZES_DEFAULT: List[int] = [10,100,1000]
+REPEAT_DEFAULT: int = 5
+THRESHOLD_DEFAULT: float = 1.2
+# 每次测量至少持续的时间(秒)，过短的项目重复执行多次后取平均
+MIN_TIME: float = 0.02
+
+_ROOT: str = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# 新进程中import rwpy并查找第一个代码：预编译的代码表(argv[1]为缓存文件夹)与解析codelist.json
+_STARTUP_COMPILED: str = '''
+import sys
+import rwpy
+import rwpy.compiled
+rwpy.compiled.load('codelist.json',sys.argv[1]).value_type('core','price')
+'''
+_STARTUP_JSON: str = '''
+import rwpy
+from rwpy.util import load_codelist
+next(x['value_type'] for x in load_codelist()['attributes'] if x['key'] == 'price:')
+'''
+
+# 基准(规模,工作目录) -> 被计时的函数；准备工作在返回之前完成，不计入耗时
+Benchmark = Callable[[int,str],Callable[[],object]]
+
+
+class Regression(NamedTuple):
+    '''比较两次结果时发现的退化，ratio为新旧最小值之比，unit为s(耗时)或bytes(内存)'''
+    name: str
+    size: int
+    old: float
+    new: float
+    ratio: float
+    unit: str = 's'
+
+
+def _mod_dir(size: int,workdir: str) -> str:
+    '''工作目录下含size个单位的合成mod，同一规模只生成一次'''
+    dir: str = os.path.join(workdir,'mod_{0}'.format(size))
+    if not os.path.isdir(dir):
+        generate_mod(dir,size)
+    return dir
+
+
+def _inis(size: int,workdir: str) -> List[Ini]:
+    return Mod(_mod_dir(size,workdir)).getinis('units')
+
+
+def bench_create_ini(size: int,workdir: str) -> Callable[[],object]:
+    '''Ini.create_ini解析size个单位连接而成的文本'''
+    text: str = make_text(size)
+    return lambda: Ini.create_ini(text)
+
+
+def bench_iter_events(size: int,workdir: str) -> Callable[[],object]:
+    '''以iter_events流式查找全部image键，不构建Ini'''
+    text: str = make_text(size)
+    return lambda: [event.value for event in iter_events(text) if event.kind == ATTRIBUTE and event.key == 'image']
+
+
+def bench_lazy_core(size: int,workdir: str) -> Callable[[],object]:
+    '''LazyIni只读取第一个[core]的price和name'''
+    data: bytes = make_text(size).encode('utf-8')
+
+    def read() -> tuple:
+        core = LazyIni('bench.ini',data).core
+        return core['price'].value,core['name'].value
+
+    return read
+
+
+def bench_str(size: int,workdir: str) -> Callable[[],object]:
+    '''str(ini)'''
+    ini: Ini = Ini.create_ini(make_text(size))
+    return lambda: str(ini)
+
+
+def bench_write(size: int,workdir: str) -> Callable[[],object]:
+    '''Ini.write写入文件'''
+    ini: Ini = Ini.create_ini(make_text(size),os.path.join(workdir,'write_{0}.ini'.format(size)))
+    return ini.write
+
+
+def bench_patch(size: int,workdir: str) -> Callable[[],object]:
+    '''保留源的ini修改一个值后以iter_patch_chunks输出最小修改的文本'''
+    ini: Ini = Ini.create_ini(make_text(size),keep_source=True)
+    ini.sections[0].elements[1].value = '1'
+    return lambda: ''.join(ini.iter_patch_chunks())
+
+
+def bench_text_edit(size: int,workdir: str) -> Callable[[],object]:
+    '''在文本中间插入一行再删除，apply_text_edit只重新解析受影响的段落'''
+    text: str = make_text(size)
+    ini: Ini = Ini.create_ini(text,'bench.ini',True)
+    line: int = text.count('\n') // 2 + 1
+
+    def edit():
+        ini.apply_text_edit(line,line,'x: 1\n')
+        ini.apply_text_edit(line,line + 1,'')
+
+    return edit
+
+
+def bench_merge(size: int,workdir: str) -> Callable[[],object]:
+    '''将mod中全部单位依次合并到一个空ini'''
+    inis: List[Ini] = _inis(size,workdir)
+
+    def merge() -> Ini:
+        target: Ini = Ini()
+        for ini in inis:
+            target.merge(ini)
+        return target
+
+    return merge
+
+
+def bench_getini(size: int,workdir: str) -> Callable[[],object]:
+    '''Mod.getini逐个读取并解析全部单位(无解析缓存)'''
+    mod: Mod = Mod(_mod_dir(size,workdir))
+    files: List[str] = mod.getfiles('units')
+    return lambda: [mod.getini(file) for file in files]
+
+
+def bench_getinis(size: int,workdir: str) -> Callable[[],object]:
+    '''Mod.getinis读取并解析全部单位(无解析缓存)'''
+    mod: Mod = Mod(_mod_dir(size,workdir))
+    return lambda: mod.getinis('units')
+
+
+def bench_getinis_threads(size: int,workdir: str) -> Callable[[],object]:
+    '''Mod.getinis以每个CPU一个线程读取并解析全部单位'''
+    mod: Mod = Mod(_mod_dir(size,workdir))
+    return lambda: mod.getinis('units',workers=os.cpu_count() or 1)
+
+
+def bench_getinis_process(size: int,workdir: str) -> Callable[[],object]:
+    '''Mod.getinis以每个CPU一个进程解析全部单位，含进程池的启动'''
+    mod: Mod = Mod(_mod_dir(size,workdir))
+    return lambda: mod.getinis('units',workers=os.cpu_count() or 1,executor='process')
+
+
+def bench_getinis_cached(size: int,workdir: str) -> Callable[[],object]:
+    '''
+    Mod.getinis从已写满的解析缓存读取全部单位
+    文件的修改时间先移到一分钟之前，测量的是只比较修改时间的命中，而不是刚写入的文件的摘要校验
+    '''
+    dir: str = _mod_dir(size,workdir)
+    past: float = time.time() - 60
+    for root,dirs,files in os.walk(dir):
+        for file in files:
+            os.utime(os.path.join(root,file),(past,past))
+    mod: Mod = Mod(dir,cache_dir=os.path.join(workdir,'cache_{0}'.format(size)))
+    mod.getinis('units')
+    return lambda: mod.getinis('units')
+
+
+def bench_getfile(size: int,workdir: str) -> Callable[[],object]:
+    '''新建Mod(建立文件索引)后逐个getfile全部单位'''
+    dir: str = _mod_dir(size,workdir)
+    paths: List[str] = [unit_path(i) for i in range(0,size)]
+
+    def getfile() -> list:
+        mod: Mod = Mod(dir)
+        return [mod.getfile(path) for path in paths]
+
+    return getfile
+
+
+def bench_resolve(size: int,workdir: str) -> Callable[[],object]:
+    '''CopyFromResolver解析全部单位的copyFrom链，每次使用新的解析器'''
+    mod: Mod = Mod(_mod_dir(size,workdir))
+    return lambda: CopyFromResolver(mod).resolve_all('units')
+
+
+def bench_query(size: int,workdir: str) -> Callable[[],object]:
+    '''ModIndex按过滤表达式查询，建立索引不计入耗时'''
+    index: ModIndex = ModIndex(Mod(_mod_dir(size,workdir)),'units')
+    return lambda: index.query('attack.maxAttackRange > 400 and core.name ~ 1$')
+
+
+def bench_columns(size: int,workdir: str) -> Callable[[],object]:
+    '''Mod.to_columns导出全部单位的4个字段(无解析缓存)'''
+    mod: Mod = Mod(_mod_dir(size,workdir))
+    fields: List[str] = ['core.maxHp','core.mass','attack.maxAttackRange','attack.shootDelay']
+    return lambda: mod.to_columns(fields,'units')
+
+
+def bench_archive(size: int,workdir: str) -> Callable[[],object]:
+    '''打开合成mod的.rwmod并以ArchiveMod.getinis读取全部单位，不解压到磁盘'''
+    path: str = os.path.join(workdir,'archive_{0}.rwmod'.format(size))
+    if not os.path.isfile(path):
+        with zipfile.ZipFile(path,'w',zipfile.ZIP_DEFLATED) as f:
+            for relpath,text in generate_texts(size).items():
+                f.writestr(relpath.replace(os.sep,'/'),text)
+
+    def read() -> List[Ini]:
+        with ArchiveMod(path) as mod:
+            return mod.getinis('units')
+
+    return read
+
+
+def bench_pack(size: int,workdir: str) -> Callable[[],object]:
+    '''修改一个单位后以Mod.pack增量打包，其余文件沿用上次输出中的压缩数据'''
+    dir: str = os.path.join(workdir,'pack_{0}'.format(size))
+    generate_mod(dir,size)
+    path: str = os.path.join(dir,unit_path(0))
+    output: str = os.path.join(workdir,'pack_{0}.rwmod'.format(size))
+    with open(path,encoding='utf-8') as f:
+        texts: List[str] = [f.read()]
+    texts.append(texts[0] + '\n# changed')
+    Mod(dir).pack(output)
+    count: List[int] = [0]
+
+    def pack():
+        count[0] += 1
+        with open(path,'w',encoding='utf-8') as f:
+            f.write(texts[count[0] % 2])
+        return Mod(dir).pack(output)
+
+    return pack
+
+
+def bench_diff(size: int,workdir: str) -> Callable[[],object]:
+    '''diff比较合成mod与修改了一个单位的副本，只解析哈希不同的文件'''
+    dir: str = os.path.join(workdir,'diff_{0}'.format(size))
+    generate_mod(dir,size)
+    path: str = os.path.join(dir,unit_path(0))
+    with open(path,encoding='utf-8') as f:
+        text: str = f.read()
+    with open(path,'w',encoding='utf-8') as f:
+        f.write(text.replace('canAttack: true','canAttack: false',1))
+    old: Mod = Mod(_mod_dir(size,workdir))
+    new: Mod = Mod(dir)
+    return lambda: diff(old,new,'units')
+
+
+def bench_validate(size: int,workdir: str) -> Callable[[],object]:
+    '''按ncodelist.json校验全部单位'''
+    validator: Validator = Validator.load(os.path.join(_ROOT,'ncodelist.json'))
+    inis: List[Ini] = _inis(size,workdir)
+    return lambda: [validator.validate(ini) for ini in inis]
+
+
+def bench_typed(size: int,workdir: str) -> Callable[[],object]:
+    '''读取全部单位[core]中maxHp和mass的typed，第一次之后由每个属性的缓存返回'''
+    attrs: List[Attribute] = [attr for ini in _inis(size,workdir) for attr in (ini.core['maxHp'],ini.core['mass'])
+    if attr is not None]
+    return lambda: [attr.typed for attr in attrs]
+
+
+def bench_column(size: int,workdir: str) -> Callable[[],object]:
+    '''rwpy.values.column取出全部单位的maxHp'''
+    inis: List[Ini] = _inis(size,workdir)
+    return lambda: column(inis,'core','maxHp')
+
+
+def bench_watch(size: int,workdir: str) -> Callable[[],object]:
+    '''修改一个单位后Watcher.poll按修改时间找出并重新解析它'''
+    dir: str = os.path.join(workdir,'watch_{0}'.format(size))
+    generate_mod(dir,size)
+    path: str = os.path.join(dir,unit_path(0))
+    watcher: Watcher = Watcher(Mod(dir),'units',backend='poll')
+    count: List[int] = [0]
+
+    def poll() -> list:
+        count[0] += 1
+        with open(path,'a',encoding='utf-8') as f:
+            f.write('\n# changed {0}'.format(count[0]))
+        return watcher.poll()
+
+    return poll
+
+
+def bench_transaction(size: int,workdir: str) -> Callable[[],object]:
+    '''Mod.transaction中已读取全部单位，修改其中每10个中的1个后提交，只写入修改过的文件'''
+    dir: str = os.path.join(workdir,'transaction_{0}'.format(size))
+    generate_mod(dir,size)
+    tx = Mod(dir).transaction()
+    inis: List[Ini] = [tx.getini(unit_path(i)) for i in range(0,size)]
+    count: List[int] = [0]
+
+    def commit() -> List[str]:
+        count[0] += 1
+        for ini in inis[::10]:
+            ini.core['maxHp'].value = str(count[0])
+        return tx.commit()
+
+    return commit
+
+
+def bench_completion(size: int,workdir: str) -> Callable[[],object]:
+    '''[projectile_1]中逐字输入lightColor时每次按键的前缀和模糊补全，与规模无关'''
+    index: CompletionIndex = CompletionIndex.load(cache_dir=os.path.join(workdir,'compiled'))
+    typed: List[str] = ['lightColor'[0:i] for i in range(1,11)]
+    return lambda: [(index.complete('projectile_1',text),index.complete('projectile_1',text,fuzzy=True))
+    for text in typed]
+
+
+def bench_lsp(size: int,workdir: str) -> Callable[[],object]:
+    '''在size个单位的文档中间输入一个字符再删除，Document只重新解析修改所在的段落'''
+    text: str = make_text(size)
+    doc: Document = Document('file:///bench.ini',text)
+    line: int = text.count('\n') // 2
+
+    def type_key():
+        doc.apply_change((line,0),(line,0),'x')
+        doc.apply_change((line,0),(line,1),'')
+
+    return type_key
+
+
+def _startup(script: str,workdir: str) -> Callable[[],object]:
+    return lambda: subprocess.run([sys.executable,'-c',script,workdir],cwd=_ROOT,check=True)
+
+
+def bench_startup(size: int,workdir: str) -> Callable[[],object]:
+    '''新进程中import rwpy并由已编译的代码表查找[core]price的值类型，含解释器启动，与规模无关'''
+    cache_dir: str = os.path.join(workdir,'compiled')
+    compiled.load(os.path.join(_ROOT,'codelist.json'),cache_dir)
+    return _startup(_STARTUP_COMPILED,cache_dir)
+
+
+def bench_startup_json(size: int,workdir: str) -> Callable[[],object]:
+    '''与startup相同，但由load_codelist解析codelist.json后查找，作为对照'''
+    return _startup(_STARTUP_JSON,workdir)
+
+
+def bench_memory(size: int,workdir: str) -> Callable[[],object]:
+    '''构建size*40个Attribute，按每个属性占用的字节数计量(键和值在计量之前已经创建)'''
+    pairs: List[tuple] = [(''.join(['pri','ce']),str(i)) for i in range(0,size * 40)]
+    return lambda: [Attribute(key,value,i) for i,(key,value) in enumerate(pairs)]
+
+
+def bench_lookup(size: int,workdir: str) -> Callable[[],object]:
+    '''在每个单位中按名称查找段落和属性，含不存在的段落和属性'''
+    inis: List[Ini] = _inis(size,workdir)
+
+    def lookup() -> int:
+        found: int = 0
+        for ini in inis:
+            core = ini.core
+            if core is not None:
+                found += (core['price'] is not None) + (core['missing'] is not None)
+            found += ini.turret_1 is not None
+            found += ini.get_section('attack')['maxAttackRange'] is not None
+            found += getattr(ini,'projectile_9') is not None
+        return found
+
+    return lookup
+
+
+BENCHMARKS: Dict[str,Benchmark] = {
+'create_ini': bench_create_ini,
+'iter_events': bench_iter_events,
+'lazy_core': bench_lazy_core,
+'str': bench_str,
+'write': bench_write,
+'patch': bench_patch,
+'text_edit': bench_text_edit,
+'merge': bench_merge,
+'getini': bench_getini,
+'getinis': bench_getinis,
+'getinis_threads': bench_getinis_threads,
+'getinis_process': bench_getinis_process,
+'getinis_cached': bench_getinis_cached,
+'getfile': bench_getfile,
+'resolve': bench_resolve,
+'query': bench_query,
+'columns': bench_columns,
+'archive': bench_archive,
+'pack': bench_pack,
+'diff': bench_diff,
+'validate': bench_validate,
+'typed': bench_typed,
+'column': bench_column,
+'watch': bench_watch,
+'transaction': bench_transaction,
+'completion': bench_completion,
+'lsp': bench_lsp,
+'startup': bench_startup,
+'startup_json': bench_startup_json,
+'memory': bench_memory,
+'lookup': bench_lookup
+}
+
+
+# 以tracemalloc计量内存而不是计时的基准，被计量的函数返回构建的对象列表
+BYTES: Set[str] = {'memory'}
+
+
+def measure_memory(func: Callable[[],list],repeat: int = REPEAT_DEFAULT) -> List[float]:
+    '''func构建的列表中每个对象占用的内存(字节)，共repeat个样本'''
+    samples: List[float] = []
+    for _ in range(0,repeat):
+        tracemalloc.start()
+        try:
+            before: int = tracemalloc.get_traced_memory()[0]
+            built: list = func()
+            samples.append((tracemalloc.get_traced_memory()[0] - before) / max(len(built),1))
+        finally:
+            tracemalloc.stop()
+        del built
+    return samples
+
+
+def measure(func: Callable[[],object],repeat: int = REPEAT_DEFAULT) -> List[float]:
+    '''func每次执行的耗时(秒)，共repeat个样本；每个样本至少持续MIN_TIME'''
+    number: int = 1
+    while True:
+        start: float = time.perf_counter()
+        for _ in range(0,number):
+            func()
+        elapsed: float = time.perf_counter() - start
+        if elapsed >= MIN_TIME or number >= 1000:
+            break
+        number *= 10
+
+    samples: List[float] = [elapsed / number]
+    for _ in range(1,repeat):
+        start = time.perf_counter()
+        for _ in range(0,number):
+            func()
+        samples.append((time.perf_counter() - start) / number)
+    return samples
+
+
+def _commit() -> Optional[str]:
+    '''当前的git提交，不在git仓库中时为None'''
+    try:
+        return subprocess.run(['git','rev-parse','HEAD'],cwd=_ROOT,capture_output=True,text=True,
+        check=True).stdout.strip()
+    except (OSError,subprocess.CalledProcessError):
+        return None
+
+
+def run(names: Optional[Iterable[str]] = None,sizes: Iterable[int] = SIZES_DEFAULT,repeat: int = REPEAT_DEFAULT,
+progress: Optional[Callable[[dict],object]] = None) -> dict:
+    '''
+    运行names中的基准(默认全部)，每个基准在各规模(单位数)下测量repeat次
+    每得到一项结果调用一次progress
+    返回{'version','commit','python','platform','repeat','results'}，results中每项为
+    {'name','size','unit','best','median','samples'}，unit为s时是耗时(秒)，为bytes时是每个对象的内存(字节)
+    抛出KeyError(未知的基准)
+    '''
+    selected: List[str] = list(BENCHMARKS) if names is None else list(names)
+    benchmarks: List[Benchmark] = [BENCHMARKS[name] for name in selected]
+    results: List[dict] = []
+
+    with tempfile.TemporaryDirectory() as workdir:
+        for name,benchmark in zip(selected,benchmarks):
+            for size in sizes:
+                unit: str = 'bytes' if name in BYTES else 's'
+                samples: List[float] = (measure_memory if unit == 'bytes' else measure)(benchmark(size,workdir),repeat)
+                result: dict = {'name': name,'size': size,'unit': unit,'best': min(samples),
+                'median': statistics.median(samples),'samples': len(samples)}
+                results.append(result)
+                if progress is not None:
+                    progress(result)
+
+    return {'version': FORMAT_VERSION,'commit': _commit(),'python': platform.python_version(),
+    'platform': platform.platform(),'repeat': repeat,'results': results}
+
+
+def compare(old: dict,new: dict,threshold: float = THRESHOLD_DEFAULT) -> List[Regression]:
+    '''
+    比较两次run的结果，返回最短耗时(或最小内存)增加到原来threshold倍以上的项目，按退化程度从大到小排列
+    只比较两次都测量过的(基准,规模)
+    '''
+    before: Dict[tuple,float] = dict(((result['name'],result['size']),result['best']) for result in old['results'])
+    regressions: List[Regression] = []
+
+    for result in new['results']:
+        key: tuple = (result['name'],result['size'])
+        if key in before and before[key] > 0 and result['best'] / before[key] > threshold:
+            regressions.append(Regression(key[0],key[1],before[key],result['best'],result['best'] / before[key],
+            result.get('unit','s')))
+
+    regressions.sort(key=lambda x: -x.ratio)
+    return regressions
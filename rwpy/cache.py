@@ -0,0 +1,202 @@
+'''
+持久化的解析缓存
+'''
+import hashlib
+import marshal
+import os
+import re
+import shutil
+import tempfile
+import threading
+import time
+from typing import Callable,List,Optional,Tuple,NoReturn
+
+from rwpy.code import Ini
+from rwpy.parser import PARSER_VERSION
+from rwpy.util import check
+
+
+CACHE_SIZE_DEFAULT: int = 256 * 1024 * 1024
+# 条目写入时文件的修改时间距写入时间不足此值(纳秒)时，之后同一修改时间内的改动无法由大小和修改时间发现
+RACY_NS: int = 2 * 10 ** 9
+# 各版本的缓存都放在缓存目录下的这个子目录中，清理旧版本时不会删除缓存目录中的其他数据
+CACHE_SUBDIR: str = 'rwpy-parse-cache'
+
+
+def read_text(data: bytes) -> str:
+    '''按UTF-8解码，并与文本模式的open一样转换换行符'''
+    return str(data,'utf-8').replace('\r\n','\n').replace('\r','\n')
+
+
+class ParseCache(object):
+    '''
+    以文件路径、大小、修改时间和内容哈希为键，在目录下的CACHE_SUBDIR中保存解析后ini的紧凑形式
+    大小和修改时间相同即视为未变化，但写入条目时刚修改过(RACY_NS之内)的文件总是比较内容哈希
+    解析器版本(PARSER_VERSION)变化后旧的缓存自动失效；总大小超过max_bytes时删除最久未用的条目
+    可以在多个线程中同时使用
+    '''
+    def __init__(self,directory: str,max_bytes: int = CACHE_SIZE_DEFAULT):
+        '''抛出IOError异常'''
+        check(directory,str)
+        check(max_bytes,int)
+        self.__root: str = directory
+        self.__dir: str = os.path.join(directory,CACHE_SUBDIR,'v{0}.{1}'.format(PARSER_VERSION,marshal.version))
+        self.__max_bytes: int = max_bytes
+        self.__hits: int = 0
+        self.__misses: int = 0
+        self.__lock: threading.Lock = threading.Lock()
+        os.makedirs(self.__dir,exist_ok=True)
+        self.__clear_stale()
+        self.__size: int = sum(entry.stat().st_size for entry in os.scandir(self.__dir) if entry.is_file())
+
+
+    @property
+    def directory(self) -> str:
+        '''缓存目录'''
+        return self.__root
+
+
+    @property
+    def hits(self) -> int:
+        '''命中次数'''
+        return self.__hits
+
+
+    @property
+    def misses(self) -> int:
+        '''未命中次数'''
+        return self.__misses
+
+
+    @property
+    def size(self) -> int:
+        '''当前缓存占用的字节数'''
+        return self.__size
+
+
+    def __clear_stale(self) -> NoReturn:
+        '''删除CACHE_SUBDIR中其他解析器版本的缓存'''
+        for entry in os.scandir(os.path.dirname(self.__dir)):
+            if entry.is_dir() and re.fullmatch(r'v\d+\.\d+',entry.name) and entry.path != self.__dir:
+                shutil.rmtree(entry.path,ignore_errors=True)
+
+
+    def __entry_path(self,path: str) -> str:
+        return os.path.join(self.__dir,hashlib.sha1(path.encode('utf-8')).hexdigest())
+
+
+    def __read_entry(self,entry_path: str) -> Optional[tuple]:
+        '''条目为(路径,大小,修改时间,内容哈希,紧凑形式,写入时间)，无法读取时返回None'''
+        try:
+            with open(entry_path,'rb') as f:
+                entry = marshal.loads(f.read())
+        except (OSError,EOFError,ValueError,TypeError):
+            return None
+        return entry if isinstance(entry,tuple) and len(entry) == 6 else None
+
+
+    def __write_entry(self,entry_path: str,entry: tuple) -> NoReturn:
+        data: bytes = marshal.dumps(entry)
+        old: int = os.path.getsize(entry_path) if os.path.exists(entry_path) else 0
+        fd,tmp = tempfile.mkstemp(dir=self.__dir,suffix='.tmp')
+
+        try:
+            with os.fdopen(fd,'wb') as f:
+                f.write(data)
+            os.replace(tmp,entry_path)
+        except OSError:
+            if os.path.exists(tmp):
+                os.remove(tmp)
+            return
+
+        with self.__lock:
+            self.__size += len(data) - old
+            if self.__size > self.__max_bytes:
+                self.__evict()
+
+
+    def __evict(self) -> NoReturn:
+        '''按最后使用时间删除条目，直到总大小低于上限的90%'''
+        entries: List[Tuple[int,int,str]] = []
+        for entry in os.scandir(self.__dir):
+            if entry.is_file():
+                stat = entry.stat()
+                entries.append((stat.st_mtime_ns,stat.st_size,entry.path))
+        entries.sort()
+        self.__size = sum(size for mtime,size,path in entries)
+        limit: int = self.__max_bytes * 9 // 10
+
+        for mtime,size,path in entries:
+            if self.__size <= limit:
+                break
+            try:
+                os.remove(path)
+                self.__size -= size
+            except OSError:
+                pass
+
+
+    def load(self,path: str,filename: Optional[str] = None,
+    parse: Optional[Callable[[str,str],tuple]] = None) -> Ini:
+        '''
+        读取并解析文件，文件未变化时从缓存中加载
+        filename为生成ini的文件名，默认为path
+        parse不为None时，未命中的文件由parse(text,filename)解析，返回Ini.to_compact的形式
+        抛出IOError、UnicodeDecodeError和IniSyntaxError异常
+        '''
+        check(path,str)
+        filename = path if filename is None else filename
+        abspath: str = os.path.abspath(path)
+        entry_path: str = self.__entry_path(abspath)
+        stat = os.stat(abspath)
+        entry: Optional[tuple] = self.__read_entry(entry_path)
+
+        # 写入条目时文件刚被修改过，同一修改时间内可能还有改动，只能由内容哈希确认
+        if entry is not None and entry[0] == abspath and entry[1] == stat.st_size and entry[2] == stat.st_mtime_ns \
+        and entry[5] - entry[2] >= RACY_NS:
+            self.__count(True)
+            os.utime(entry_path)
+            return self.__restore(entry[4],filename)
+
+        with open(abspath,'rb') as f:
+            data: bytes = f.read()
+        digest: str = hashlib.sha1(data).hexdigest()
+
+        if entry is not None and entry[0] == abspath and entry[3] == digest:
+            self.__count(True)
+            self.__write_entry(entry_path,(abspath,stat.st_size,stat.st_mtime_ns,digest,entry[4],time.time_ns()))
+            return self.__restore(entry[4],filename)
+
+        self.__count(False)
+
+        if parse is None:
+            ini: Ini = Ini.create_ini(read_text(data),filename)
+            compact: tuple = ini.to_compact()
+        else:
+            compact = parse(read_text(data),filename)
+            ini = Ini.from_compact(compact)
+
+        self.__write_entry(entry_path,(abspath,stat.st_size,stat.st_mtime_ns,digest,compact,time.time_ns()))
+        return ini
+
+
+    def __count(self,hit: bool) -> NoReturn:
+        with self.__lock:
+            if hit:
+                self.__hits += 1
+            else:
+                self.__misses += 1
+
+
+    def __restore(self,compact: tuple,filename: str) -> Ini:
+        ini: Ini = Ini.from_compact(compact)
+        if ini.filename != 'untitled.ini':
+            ini.filename = filename
+        return ini
+
+
+    def clear(self) -> NoReturn:
+        '''清空缓存'''
+        shutil.rmtree(self.__dir,ignore_errors=True)
+        os.makedirs(self.__dir,exist_ok=True)
+        self.__size = 0
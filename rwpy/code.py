@@ -1,10 +1,15 @@
-from typing import Callable, List,Dict,Optional,Union,NoReturn
-import re
+from typing import Callable, List,Dict,Optional,Union,NoReturn,Iterable,Iterator,TextIO,BinaryIO,FrozenSet,Set,Tuple
 from abc import ABC, abstractmethod
+from array import array
+from bisect import bisect_left,bisect_right
+from hashlib import blake2b
+from itertools import accumulate,compress
+from operator import attrgetter
+from sys import intern
 
 from rwpy.util import filterl,IBuilder,check
 from rwpy.errors import IniSyntaxError, SectionNotExistedError
-from rwpy.util import connect_strs
+from rwpy.parser import iter_lines,tokenize,SECTION,ATTRIBUTE,MULTILINE,COMMENT
 
 
 not_copied_keys =[
@@ -13,6 +18,7 @@ not_copied_keys =[
 ('core','dont_load'),
 ('#','@copyFrom_skipThisSection')
 ]
+_not_copied: FrozenSet[Tuple[str,str]] = frozenset(not_copied_keys)
 
 
 def to_multiline(text: str) -> str:
@@ -32,8 +38,123 @@ def to_list(lst: List[str]) -> str:
     return ', '.join(lst)
 
 
+def _adopt(obj,owner) -> NoReturn:
+    '''
+    记录obj(属性、段落或TrackedList)所属的段落或ini，obj被修改时由_notify通知owner
+    同一对象可以属于多个容器；owner只在建立索引或哈希时记录，记录之前owner不依赖obj的内容
+    '''
+    current = obj._owner
+    if current is None:
+        obj._owner = owner
+    elif current is not owner:
+        if type(current) is list:
+            if not any(x is owner for x in current):
+                current.append(owner)
+        else:
+            obj._owner = [current,owner]
+
+
+def _notify(obj,unit,renamed: bool) -> NoReturn:
+    '''
+    通知obj所属的容器unit被修改，renamed为True时表示名称(属性键或段落名)被修改
+    unit为None表示元素列表或段落列表本身被修改
+    '''
+    owner = obj._owner
+    if owner is None:
+        return
+    if type(owner) is list:
+        for x in owner:
+            x._edited(unit,renamed)
+    else:
+        owner._edited(unit,renamed)
+
+
+HASH_SIZE: int = 16
+
+
+class TrackedList(list):
+    '''
+    记录修改次数(version)的list，Section和Ini以此判断索引是否过期
+    修改时通知所属的段落或ini(参见_adopt)，以便ini知道源中的结构已经改变
+    '''
+    __slots__ = ('version','_owner')
+
+    def __init__(self,iterable: Iterable = ()):
+        list.__init__(self,iterable)
+        self.version: int = 0
+        self._owner = None
+
+
+    def __changed(self) -> NoReturn:
+        self.version += 1
+        if self._owner is not None:
+            _notify(self,None,False)
+
+
+    def append(self,obj):
+        self.__changed()
+        list.append(self,obj)
+
+
+    def extend(self,iterable):
+        self.__changed()
+        list.extend(self,iterable)
+
+
+    def insert(self,index,obj):
+        self.__changed()
+        list.insert(self,index,obj)
+
+
+    def pop(self,index = -1):
+        self.__changed()
+        return list.pop(self,index)
+
+
+    def remove(self,obj):
+        self.__changed()
+        list.remove(self,obj)
+
+
+    def clear(self):
+        self.__changed()
+        list.clear(self)
+
+
+    def sort(self,*args,**kwargs):
+        self.__changed()
+        list.sort(self,*args,**kwargs)
+
+
+    def reverse(self):
+        self.__changed()
+        list.reverse(self)
+
+
+    def __setitem__(self,index,obj):
+        self.__changed()
+        list.__setitem__(self,index,obj)
+
+
+    def __delitem__(self,index):
+        self.__changed()
+        list.__delitem__(self,index)
+
+
+    def __iadd__(self,other):
+        self.__changed()
+        return list.__iadd__(self,other)
+
+
+    def __imul__(self,n):
+        self.__changed()
+        return list.__imul__(self,n)
+
+
 class Element(object):
     '''元素，代码的基本单位'''
+    __slots__ = ('__content','__linenum')
+
     def __init__(self,content: str,linenum: int = -1):
 
         self.__content: str = content
@@ -50,6 +171,22 @@ class Element(object):
         '''特殊属性，标识元素的行号'''
         return self.__linenum
 
+
+    @property
+    def dirty(self) -> bool:
+        '''一般元素不可修改，总是为False'''
+        return False
+
+
+    @property
+    def content_hash(self) -> bytes:
+        '''与进程无关的稳定内容哈希(HASH_SIZE字节的BLAKE2b)'''
+        return blake2b(b'\x01' + self.__content.encode('utf-8'),digest_size=HASH_SIZE).digest()
+
+
+    def mark_clean(self) -> NoReturn:
+        pass
+
     
     def __eq__(self,other) -> bool:
 
@@ -65,12 +202,24 @@ class Element(object):
         
 
 class Attribute(Element):
-    '''属性，代码的主要内容'''
+    '''属性，代码的主要内容。文本由键和值即时拼接，键会被驻留(intern)'''
+    __slots__ = ('__key','__value','__typed','__dirty','__hash','_owner')
+
     def __init__(self,key: str,value: str,linenum: int = -1):
 
-        self.__key = key
-        self.__value = value
-        Element.__init__(self,key + ': ' + value,linenum)
+        self.__key: str = intern(key)
+        self.__value: str = value
+        self.__typed: Optional[tuple] = None
+        self.__dirty: bool = False
+        self.__hash: Optional[bytes] = None
+        # 所属的段落，参见_adopt
+        self._owner = None
+        self._Element__linenum = linenum
+    
+    
+    def __str__(self) -> str:
+
+        return self.__key + ': ' + self.__value
     
     
     @property
@@ -83,8 +232,11 @@ class Attribute(Element):
     def key(self,key: str): 
 
         check(key,str)
-        self.__key = key
-        self._Element__content = self.__key + ': ' + self.__value
+        self.__key = intern(key)
+        self.__typed = None
+        self.__dirty = True
+        self.__hash = None
+        _notify(self,self,True)
         
         
     @property
@@ -98,7 +250,55 @@ class Attribute(Element):
 
         check(value,str)
         self.__value = value
-        self._Element__content = self.__key + ': ' + self.__value
+        self.__typed = None
+        self.__dirty = True
+        self.__hash = None
+        _notify(self,self,False)
+
+
+    @property
+    def dirty(self) -> bool:
+        '''键或值在创建或上次mark_clean之后是否被修改'''
+        return self.__dirty
+
+
+    def mark_clean(self) -> NoReturn:
+        self.__dirty = False
+
+
+    @property
+    def content_hash(self) -> bytes:
+        '''由键和值得到的稳定内容哈希，缓存到键或值被修改为止'''
+        if self.__hash is None:
+            self.__hash = blake2b(self.__key.encode('utf-8') + b'\x00' + self.__value.encode('utf-8'),
+            digest_size=HASH_SIZE).digest()
+        return self.__hash
+
+
+    @property
+    def typed(self):
+        '''按代码表中该代码的值类型解码的值，参见get_typed'''
+        return self.get_typed()
+
+
+    def get_typed(self,value_type: Optional[str] = None):
+        '''
+        按值类型解码的值，value_type为None时按代码名在代码表中查找
+        结果缓存到值或键被修改为止
+        抛出ValueError
+        '''
+        typed: Optional[tuple] = self.__typed
+
+        # (参数,实际使用的值类型,解码结果)
+        if typed is not None and (typed[0] == value_type or typed[1] == value_type):
+            return typed[2]
+
+        from rwpy import values
+
+        resolved: Optional[str] = values.lookup_type(None,self.__key) if value_type is None else value_type
+        decoded = values.decode(self.__value,resolved)
+        self.__typed = (value_type,resolved,decoded)
+        return decoded
 
 
     def __eq__(self,other) -> bool:
@@ -114,8 +314,13 @@ class Attribute(Element):
         return True
 
 
+_get_dirty: Callable[[object],bool] = attrgetter('dirty')
+
+
 class ISection(ABC):
     '''ISection接口'''
+    __slots__ = ()
+
     @abstractmethod
     def __init__(self,name: str):
         pass
@@ -144,6 +349,11 @@ class ISection(ABC):
     @abstractmethod
     def __str__(self) -> str:
         pass
+
+
+    @abstractmethod
+    def iter_chunks(self) -> Iterator[str]:
+        pass
         
     
     @abstractmethod
@@ -157,14 +367,24 @@ class ISection(ABC):
 
 
 class Section(ISection):
-    '''段落，代码的组织单位'''
+    '''段落，代码的组织单位。段落名会被驻留(intern)'''
+    __slots__ = ('__name','__elements','__index','__indexed','__saved','__changed','__hash','_owner','linenum')
+
     def __init__(self,name: str,linenum: int = -1):
 
-        self.__name: str = name
-        self.__elements: List[Element] = []
-        self.__attributes: Dict[str,Attribute] = {}
+        self.__name: str = intern(name)
+        self.__elements: TrackedList = TrackedList()
+        self.__elements._owner = self
+        self.__index: Optional[Dict[str,List[int]]] = None
+        self.__indexed: int = 0
+        # 上次mark_clean时元素列表的修改次数，以及之后段落名或元素列表是否被替换
+        self.__saved: int = 0
+        self.__changed: bool = False
+        # (段落名,元素列表,元素列表的修改次数,哈希)，其中的属性被修改时由属性通知清除
+        self.__hash: Optional[tuple] = None
+        # 所属的ini，参见_adopt
+        self._owner = None
         self.linenum: int = linenum
-        self.__attributes: Dict[str,Attribute] = {}
     
     
     @property
@@ -175,11 +395,15 @@ class Section(ISection):
     
     @elements.setter
     def elements(self,elements: List[Element]) -> NoReturn:
-
+        '''普通list会被复制为TrackedList'''
         check(elements,list)
         if any(map(lambda x: not isinstance(x,Element),elements)):
             raise TypeError()
-        self.__elements = elements
+        self.__elements = elements if isinstance(elements,TrackedList) else TrackedList(elements)
+        _adopt(self.__elements,self)
+        self.__index = None
+        self.__changed = True
+        _notify(self,None,False)
 
         
     @property
@@ -192,21 +416,116 @@ class Section(ISection):
     def name(self,name: str) -> NoReturn:
 
         check(name,str)
-        self.__name = name
+        self.__name = intern(name)
+        self.__changed = True
+        _notify(self,self,True)
+
+
+    @property
+    def dirty(self) -> bool:
+        '''段落名、元素列表或其中的属性在创建或上次mark_clean之后是否被修改'''
+        if self.__changed or self.__elements.version != self.__saved:
+            return True
+        return any(map(_get_dirty,self.__elements))
+
+
+    def mark_clean(self) -> NoReturn:
+        '''将段落及其中的属性标记为未修改'''
+        for ele in self.__elements:
+            ele.mark_clean()
+        self.__saved = self.__elements.version
+        self.__changed = False
+
+
+    @property
+    def content_hash(self) -> bytes:
+        '''
+        由段落名和各元素的哈希得到的稳定内容哈希
+        缓存到段落名、元素列表或任一属性被修改为止，重新计算时复用未修改属性的哈希
+        '''
+        cached: Optional[tuple] = self.__hash
+        elements: TrackedList = self.__elements
+
+        if cached is not None and cached[0] is self.__name and cached[1] is elements \
+        and cached[2] == elements.version:
+            return cached[3]
+
+        h = blake2b(b'[' + self.__name.encode('utf-8') + b']',digest_size=HASH_SIZE)
+
+        for ele in elements:
+            if isinstance(ele,Attribute) and ele._owner is not self:
+                _adopt(ele,self)
+            h.update(ele.content_hash)
+
+        digest: bytes = h.digest()
+        self.__hash = (self.__name,elements,elements.version,digest)
+        return digest
+
+
+    def same_content(self,other: 'Section') -> bool:
+        '''段落名和全部元素的内容都相同，按内容哈希比较；==仍比较是否为同一个段落'''
+        check(other,Section)
+        return self.content_hash == other.content_hash
+
+
+    def _edited(self,unit: Optional[Element],renamed: bool) -> NoReturn:
+        '''
+        段落中的属性unit被修改时由属性通知，内容哈希过期；键被修改时索引也过期
+        unit为None时为元素列表被修改，索引和哈希由列表的修改次数判断；都转告所属的ini
+        '''
+        self.__hash = None
+        if renamed:
+            self.__index = None
+        _notify(self,unit,False)
+
+
+    def __fresh(self) -> bool:
+
+        return self.__index is not None and self.__indexed == self.__elements.version
+
+
+    def __keyindex(self) -> Dict[str,List[int]]:
+        '''属性键到位置的索引，元素列表或属性键变化后重建'''
+        if not self.__fresh():
+            index: Dict[str,List[int]] = {}
+
+            for i,ele in enumerate(self.__elements):
+
+                if isinstance(ele,Attribute):
+
+                    if ele._owner is not self:
+                        _adopt(ele,self)
+
+                    positions = index.get(ele.key)
+
+                    if positions is None:
+                        index[ele.key] = [i]
+                    else:
+                        positions.append(i)
+
+            self.__index = index
+            self.__indexed = self.__elements.version
+
+        return self.__index
 
     
     def append(self,ele: Element):
         '''向段落中追加元素'''
         check(ele,Element)
-        self.elements.append(ele)
+        fresh: bool = self.__fresh()
+        self.__elements.append(ele)
+
+        if fresh:
 
-        if isinstance(ele,Attribute):
+            if isinstance(ele,Attribute):
+                _adopt(ele,self)
+                self.__index.setdefault(ele.key,[]).append(len(self.__elements) - 1)
 
-            self.__attributes[ele.key] = ele
+            self.__indexed = self.__elements.version
     
     
     def insert(self,ele: Element,before: Union[int,str]) -> NoReturn:
-        '''在段落中指定位置插入元素，或向指定属性后插入元素'''
+        '''在段落中指定位置插入元素，或向指定属性(同名时为最后一个)后插入元素'''
         check(ele,Element)
 
         if isinstance(before,int):
@@ -215,13 +534,11 @@ class Section(ISection):
 
         elif isinstance(before,str):
 
-            for i in range(0,len(self.__elements)):
-
-                if isinstance(self.__elements[i],Attribute):
+            positions: Optional[List[int]] = self.__keyindex().get(before)
 
-                    if self.__elements[i].key == before:
+            if not positions is None:
 
-                        self.__elements.insert(ele)
+                self.__elements.insert(positions[-1] + 1,ele)
 
         else:
 
@@ -229,48 +546,81 @@ class Section(ISection):
                     
                         
     def remove_attribute(self,key: str) -> NoReturn:
-        '''删除指定键的属性'''
+        '''删除指定键的全部属性'''
         check(key,str)
-        for i in range(0,len(self.__elements)):
+        positions: Optional[List[int]] = self.__keyindex().get(key)
 
-            if isinstance(self.__elements[i],Attribute):
+        if not positions is None:
 
-                if self.__elements[i].key == key:
+            for pos in reversed(positions):
 
-                    self.__elements.pop(i)
-                    self.__attributes.pop(key)
-        
+                del self.__elements[pos]
         
     
     def __getitem__(self,item: str) -> Optional[Attribute]:
-        '''获取指定键的属性'''
+        '''获取指定键的属性，同名时为最后一个'''
         check(item,str)
+        positions: Optional[List[int]] = self.__keyindex().get(item)
 
-        if item in self.__attributes:
-
-            return self.__attributes[item]
-
-        else:
+        if positions is None:
 
             return None
+
+        return self.__elements[positions[-1]]
         
         
     def __str__(self) -> str:
         '''对应的文本'''
-        text = '[{0}]\n'.format(self.__name) + connect_strs(self.elements)
-        return text
+        return ''.join(self.iter_chunks())
+
+
+    def iter_chunks(self) -> Iterator[str]:
+        '''逐段产生对应的文本，连接后与str(self)相同'''
+        yield '[{0}]\n'.format(self.__name)
+        first: bool = True
+
+        for ele in self.__elements:
+
+            if first:
+                first = False
+            else:
+                yield '\n'
+
+            yield str(ele)
+
+
+    def write_to(self,stream: TextIO) -> NoReturn:
+        '''将对应的文本写入流'''
+        stream.writelines(self.iter_chunks())
         
     
     def get_attribute(self,key: str) -> Attribute:
         '''获取指定键的属性。如果不存在，则追加该属性'''
-        if not key in self.__attributes:
-            self.append(Attribute(key,''))
-        return self.__attributes[key]
+        attr: Optional[Attribute] = self[key]
+        if attr is None:
+            attr = Attribute(key,'')
+            self.append(attr)
+        return attr
         
     
     def getattrs(self) -> List[Attribute]:
         '''获取段落中全部属性'''
         return filterl(lambda x: isinstance(x,Attribute),self.elements)
+
+
+    def get_typed(self,key: str,default = None):
+        '''
+        按代码表中本段落下该代码的值类型解码指定键的属性值，不存在时返回default
+        抛出ValueError
+        '''
+        from rwpy import values
+
+        attr: Optional[Attribute] = self[key]
+
+        if attr is None:
+            return default
+
+        return attr.get_typed(values.lookup_type(self.__name,key))
     
 
     class SectionBuilder(IBuilder):
@@ -396,6 +746,16 @@ class IIni(ABC):
         pass
                 
     
+    @abstractmethod
+    def iter_chunks(self) -> Iterator[str]:
+        pass
+
+
+    @abstractmethod
+    def write_to(self,stream: TextIO) -> NoReturn:
+        pass
+
+    
     @abstractmethod
     def write(self):
         pass
@@ -411,20 +771,560 @@ class IIni(ABC):
         pass
     
 
+class _Source(object):
+    '''
+    Ini保留的源：原文、按源中顺序排列的元素和段落(owners)，以及各自在原文中的起始位置
+    第i个对象的起始位置为base[i]加上位移：marks递增，marks[k]及之后的对象移动shifts[k]
+    最小修改写入之后只追加位移而不重建起始位置，因此写入的开销与修改的数量成正比
+    '''
+    __slots__ = ('text','owners','base','marks','shifts','positions')
+    # 位移过多时重建起始位置
+    MAX_MARKS: int = 256
+
+    def __init__(self,text: str,owners: list,base: array,marks: Optional[List[int]] = None,
+    shifts: Optional[List[int]] = None,positions: Optional[Dict[int,int]] = None):
+        self.text: str = text
+        self.owners: list = owners
+        # 最后一项为len(text) + 1，即最后一个对象之后的位置
+        self.base: array = base
+        self.marks: List[int] = [] if marks is None else marks
+        self.shifts: List[int] = [] if shifts is None else shifts
+        # id(对象) -> 在owners中的位置，第一次查找时建立，之后的源共用
+        self.positions: Optional[Dict[int,int]] = positions
+
+
+    def start(self,i: int) -> int:
+        '''第i个对象的起始位置'''
+        k: int = bisect_right(self.marks,i) - 1
+        return self.base[i] if k < 0 else self.base[i] + self.shifts[k]
+
+
+    @property
+    def starts(self) -> array:
+        '''全部起始位置，没有位移时为base本身，调用者不应修改'''
+        if not self.marks:
+            return self.base
+        base: array = self.base
+        bounds: List[int] = self.marks + [len(base)]
+        starts: array = base[:bounds[0]]
+        for k,shift in enumerate(self.shifts):
+            starts.extend(base[i] + shift for i in range(bounds[k],bounds[k + 1]))
+        return starts
+
+
+    def index(self,obj) -> int:
+        '''obj在owners中的位置，不在源中时为-1'''
+        if self.positions is None:
+            self.positions = dict((id(owner),i) for i,owner in enumerate(self.owners))
+        return self.positions.get(id(obj),-1)
+
+
+    def rebased(self,text: str,patches: List[Tuple[int,int]]) -> '_Source':
+        '''
+        替换部分对象的文本之后的源，patches为按位置排列的(位置,长度变化)
+        长度变化使其后的对象移动，对象本身不变
+        '''
+        bounds: List[int] = sorted(set(self.marks).union(i + 1 for i,delta in patches if delta != 0))
+        marks: List[int] = []
+        shifts: List[int] = []
+        k: int = 0
+        p: int = 0
+        old: int = 0
+        added: int = 0
+
+        for bound in bounds:
+            while k < len(self.marks) and self.marks[k] <= bound:
+                old = self.shifts[k]
+                k += 1
+            while p < len(patches) and patches[p][0] < bound:
+                added += patches[p][1]
+                p += 1
+            marks.append(bound)
+            shifts.append(old + added)
+
+        source: _Source = _Source(text,self.owners,self.base,marks,shifts,self.positions)
+        if len(marks) > _Source.MAX_MARKS:
+            source.base = source.starts
+            source.marks = []
+            source.shifts = []
+        return source
+
+
 class Ini(IIni):
     '''代码文件'''
     def __init__(self,filename: str = 'untitled.ini'):
-        self.__elements: List[Element] = []
-        self.__sections: List[Section] = []
+        self.__elements: TrackedList = TrackedList()
+        self.__sections: TrackedList = TrackedList()
+        self.__elements._owner = self
+        self.__sections._owner = self
         self.__filename: str = filename
+        self.__index: Optional[Dict[str,List[int]]] = None
+        self.__indexed: int = 0
+        # 上次mark_clean时头部元素和段落列表的修改次数，以及之后列表是否被替换
+        self.__saved: Tuple[int,int] = (0,0)
+        self.__changed: bool = False
+        # 解析时保留的源：(原文,按源中顺序排列的元素和段落,各自在原文中的起始位置)，参见create_ini
+        self.__source: Optional[_Source] = None
+        self.__pending: Optional[_Source] = None
+        # 源之后被修改的属性和段落(id -> 对象)，头部元素或段落结构被修改后为None，此时逐个比对源中的对象
+        self.__touched: Optional[Dict[int,object]] = None
+        # apply_text_edit使用的源：当前的各行、按段落分块的元素(头部元素为第0块)及块内各元素相对块首的行号、
+        # 各块当前的起始行，以及分块时头部元素和段落列表的状态；第一次编辑时由源建立，之后源在需要时由此重新生成
+        self.__lines: Optional[List[str]] = None
+        self.__blocks: Optional[List[Tuple[list,array]]] = None
+        self.__block_starts: Optional[List[int]] = None
+        self.__synced: Optional[tuple] = None
+        # 此块及之后的段落中的行号尚未随编辑移动
+        self.__stale: Optional[int] = None
         
     
     def __str__(self) -> str:
         '''对应的文本'''
-        text: str = ''
-        text += connect_strs(self.elements) + '\n'
-        text += connect_strs(self.sections)
-        return text
+        return ''.join(self.iter_chunks())
+
+
+    def iter_chunks(self) -> Iterator[str]:
+        '''逐段产生对应的文本，连接后与str(self)相同'''
+        first: bool = True
+
+        for ele in self.__elements:
+
+            if first:
+                first = False
+            else:
+                yield '\n'
+
+            yield str(ele)
+
+        yield '\n'
+        first = True
+
+        for sec in self.__sections:
+
+            if first:
+                first = False
+            else:
+                yield '\n'
+
+            yield from sec.iter_chunks()
+
+
+    def write_to(self,stream: TextIO,minimal: bool = False) -> NoReturn:
+        '''
+        将对应的文本写入流，不在内存中拼接完整文本
+        minimal为True且保留了源时只重新生成修改过的部分，参见iter_patch_chunks
+        '''
+        if minimal and self.__sourced():
+            chunks,self.__pending = self.__patch(True)
+            stream.writelines(chunks)
+        else:
+            stream.writelines(self.iter_chunks())
+            self.__pending = None
+
+
+    @property
+    def content_hash(self) -> bytes:
+        '''由头部元素和各段落的哈希得到的稳定内容哈希，段落和属性的哈希被缓存，与文件名无关'''
+        h = blake2b(digest_size=HASH_SIZE)
+
+        for ele in self.__elements:
+            h.update(ele.content_hash)
+
+        h.update(b'\x00')
+
+        for sec in self.__sections:
+            h.update(sec.content_hash)
+
+        return h.digest()
+
+
+    @property
+    def source(self) -> Optional[str]:
+        '''以keep_source=True创建时的原文(或上次以minimal方式写入的文本)，未保留时为None'''
+        return self.__source.text if self.__sourced() else None
+
+
+    def __sourced(self) -> bool:
+        '''是否保留了源，源在apply_text_edit之后重新生成'''
+        if self.__source is None and self.__blocks is not None:
+            self.__source = self.__flatten()
+        return self.__source is not None
+
+
+    def __own(self,elements: Iterable[Element],sections: Iterable[Section]) -> NoReturn:
+        '''记录头部元素、段落及其中的属性的所属(参见_adopt)，之后对它们的修改记录在__touched中'''
+        for ele in elements:
+            if isinstance(ele,Attribute) and ele._owner is not self:
+                _adopt(ele,self)
+
+        for sec in sections:
+            if sec._owner is not self:
+                _adopt(sec,self)
+            for ele in sec.elements:
+                if isinstance(ele,Attribute) and ele._owner is not sec:
+                    _adopt(ele,sec)
+
+
+    def __forget(self) -> NoReturn:
+        '''源已经改变(写入后)，下一次apply_text_edit时重新分块'''
+        if self.__stale is not None:
+            self.__settle()
+        self.__lines = None
+        self.__blocks = None
+        self.__block_starts = None
+        self.__synced = None
+        self.__stale = None
+
+
+    def __in_sync(self) -> bool:
+        '''头部元素和段落列表是否与分块时相同，不同说明段落结构在文本之外被修改'''
+        elements,elements_version,sections,sections_version = self.__synced
+        return elements is self.__elements and elements_version == self.__elements.version \
+        and sections is self.__sections and sections_version == self.__sections.version
+
+
+    def __sync(self) -> NoReturn:
+        self.__synced = (self.__elements,self.__elements.version,self.__sections,self.__sections.version)
+
+
+    def __split(self) -> NoReturn:
+        '''
+        由源建立apply_text_edit使用的分块
+        源之后在文本之外的修改(属性、段落名或段落结构)先按最小修改写回源，再由新的源分块
+        抛出ValueError异常
+        '''
+        touched: Optional[Dict[int,object]] = self.__touched
+
+        if self.__blocks is not None and touched == {}:
+            return
+
+        rewritten: bool = self.__sourced() and touched != {}
+
+        if rewritten:
+            self.__source = self.__patch(True)[1]
+            self.__pending = None
+            self.__forget()
+            if touched is None:
+                self.__own(self.__elements,self.__sections)
+            self.__touched = {}
+
+        if self.__source is None:
+            raise ValueError('未保留源，应以keep_source=True创建ini')
+
+        text: str = self.__source.text
+        owners: list = self.__source.owners
+        starts: array = self.__source.starts
+        lines: List[str] = text.split('\n')
+        offsets: List[int] = [0]
+        offsets.extend(accumulate(len(line) + 1 for line in lines))
+        blocks: List[Tuple[list,array]] = [([],array('q'))]
+        block_starts: List[int] = [1]
+
+        for i,obj in enumerate(owners):
+            linenum: int = bisect_right(offsets,starts[i])
+
+            if isinstance(obj,Section):
+                blocks.append(([],array('q')))
+                block_starts.append(linenum)
+
+            blocks[-1][0].append(obj)
+            blocks[-1][1].append(linenum - block_starts[-1])
+
+        self.__lines = lines
+        self.__blocks = blocks
+        self.__block_starts = block_starts
+        self.__sync()
+
+        # 写回的文本可能插入或删除了行，原有元素的行号按新的源移动(段落中的在下次访问段落时)
+        if rewritten:
+            units,block = blocks[0]
+            for i in range(0,len(units)):
+                if units[i]._Element__linenum >= 0 or isinstance(units[i],Attribute):
+                    units[i]._Element__linenum = 1 + block[i]
+            self.__stale = 1 if len(blocks) > 1 else None
+
+
+    def __settle(self) -> NoReturn:
+        '''按各块当前的起始行移动编辑之后尚未更新的段落和元素的行号'''
+        stale: int = self.__stale
+        self.__stale = None
+
+        for (units,offsets),start in zip(self.__blocks[stale:],self.__block_starts[stale:]):
+            sec: Section = units[0]
+            sec.linenum = start
+
+            for i in range(1,len(units)):
+                ele: Element = units[i]
+                # 注释没有行号，在文本之外新增的属性写回之后才有行号
+                if ele._Element__linenum >= 0 or isinstance(ele,Attribute):
+                    ele._Element__linenum = start + offsets[i]
+
+
+    def __flatten(self) -> _Source:
+        '''由分块重新生成源'''
+        offsets: List[int] = [0]
+        offsets.extend(accumulate(len(line) + 1 for line in self.__lines))
+        owners: list = []
+        starts: array = array('q')
+
+        for (units,block),start in zip(self.__blocks,self.__block_starts):
+            owners.extend(units)
+            starts.extend(offsets[start + offset - 1] for offset in block)
+
+        starts.append(offsets[-1])
+        return _Source('\n'.join(self.__lines),owners,starts)
+
+
+    def apply_text_edit(self,start_line: int,end_line: int,new_text: str) -> List[Section]:
+        '''
+        将第start_line行到第end_line行之前(行号从1开始，不含end_line)替换为new_text中的各行，只重新解析受影响的段落
+        从修改之前的最后一个段落头开始重新解析，遇到修改之后原有的某个段落头即停止(段落头处不在多行文本之中，
+        之后的结果与原来相同)；其后的段落沿用原来的对象，其中的行号在下次访问段落时才移动
+        因此单次修改的开销与修改涉及的段落大小成正比，与文件大小无关；跨越段落的多行文本会使重新解析延续到其结束
+        需要以keep_source=True创建；编辑之间通过属性、段落等在文本之外的修改先按最小修改写回文本，再应用编辑
+        返回重新解析产生的段落
+        抛出ValueError和IniSyntaxError异常，语法错误时ini不变
+        '''
+        check(start_line,int)
+        check(end_line,int)
+        check(new_text,str)
+        self.__split()
+        lines: List[str] = self.__lines
+
+        if not 1 <= start_line <= end_line <= len(lines) + 1:
+            raise ValueError('行号超出范围')
+
+        new: List[str] = new_text.split('\n')
+        if new[-1] == '':
+            new.pop()
+        if len(new) == 0 and start_line == 1 and end_line == len(lines) + 1:
+            new.append('')
+
+        old: List[str] = lines[start_line - 1:end_line - 1]
+        lines[start_line - 1:end_line - 1] = new
+        delta: int = len(new) - len(old)
+        new_last: int = start_line + len(new) - 1
+        starts: List[int] = self.__block_starts
+        # 从修改之前最后一个段落头开始，修改的行本身可能是段落头；第0块为头部元素，从第1行开始
+        i: int = bisect_left(starts,start_line,1) - 1
+        after: int = bisect_right(starts,end_line - 1,i + 1)
+        stop: int = len(starts)
+        tokens: List[tuple] = []
+
+        try:
+            for token in tokenize((lines[n] for n in range(starts[i] - 1,len(lines))),starts[i] - 1):
+                if token[0] == SECTION and token[1] > new_last:
+                    k: int = bisect_left(starts,token[1] - delta,after)
+                    if k < len(starts) and starts[k] == token[1] - delta:
+                        stop = k
+                        break
+                tokens.append(token)
+        except IniSyntaxError:
+            lines[start_line - 1:start_line - 1 + len(new)] = old
+            raise
+
+        part: Ini = Ini.from_tokens(tokens,self.__filename)
+        blocks: List[Tuple[list,array]] = [([],array('q'))] if i == 0 else []
+        block_starts: List[int] = [1] if i == 0 else []
+
+        for obj,token in zip(part.__units(),tokens):
+
+            if isinstance(obj,Section):
+                blocks.append(([],array('q')))
+                block_starts.append(token[1])
+
+            blocks[-1][0].append(obj)
+            blocks[-1][1].append(token[1] - block_starts[-1])
+
+        if i == 0:
+            self.__elements[:] = part.__elements
+
+        self.__sections[max(i - 1,0):stop - 1] = part.__sections
+        self.__blocks[i:stop] = blocks
+        end: int = i + len(blocks)
+        starts[i:stop] = block_starts
+
+        if delta != 0:
+            for k in range(end,len(starts)):
+                starts[k] += delta
+
+        stale: Optional[int] = self.__stale
+        if stale is not None:
+            stale = stale if stale < i else end if stale < stop else stale + end - stop
+        if delta != 0 and end < len(starts):
+            stale = end if stale is None else min(stale,end)
+
+        self.__stale = stale
+        self.__sync()
+        self.__source = None
+        self.__pending = None
+        # 替换头部元素和段落时记录了结构修改，重新解析的部分与编辑后的文本一致
+        self.__own(part.__elements if i == 0 else (),part.__sections)
+        self.__touched = {}
+        return part.__sections
+
+
+    def section_at(self,linenum: int) -> Optional[Section]:
+        '''第linenum行(从1开始)所在的段落，在第一个段落之前时返回None'''
+        if self.__blocks is not None and self.__in_sync():
+            k: int = bisect_right(self.__block_starts,linenum) - 1
+            return None if k < 1 else self.__sections[k - 1]
+
+        found: Optional[Section] = None
+        for sec in self.sections:
+            if 0 <= sec.linenum <= linenum:
+                found = sec
+        return found
+
+
+    def __units(self) -> Iterator[Union[Element,Section]]:
+        '''按文本中的顺序产生头部元素、段落和段落中的元素'''
+        yield from self.__elements
+        for sec in self.__sections:
+            yield sec
+            yield from sec.elements
+
+
+    def __patched(self,obj: Union[Element,Section],span: str) -> Optional[str]:
+        '''源中的对象现在对应的文本，与源相同时返回None；保留原来的行尾(包括\r)'''
+        if isinstance(obj,Section):
+            header: str = span.strip()
+            if header[1:-1] == obj.name:
+                return None
+            start: int = span.find(header)
+            return span[:start] + '[{0}]'.format(obj.name) + span[start + len(header):]
+
+        if not isinstance(obj,Attribute):
+            return None
+
+        key,sep,rest = span.partition(':')
+
+        if key.strip() != obj.key:
+            return str(obj) + span[len(span.rstrip()):]
+
+        if rest.strip() == obj.value:
+            return None
+
+        # 保留原来的键、冒号前后的空白和行尾空白，只替换值
+        value: str = rest.strip()
+        start: int = rest.find(value)
+        rest = rest[:start] + obj.value + rest[start + len(value):]
+        # 冒号位于行尾时不会被解析为属性
+        return key + sep + (rest if rest.strip() != '' else ' ' + rest)
+
+
+    def __patch(self,rebase: bool) -> Tuple[List[str],Optional[_Source]]:
+        '''
+        生成最小修改的文本块，rebase为True时同时返回写入后对应的新源
+        结构未变时只查看__touched中记录的属性和段落头，其余文本整段复制，开销与修改的数量成正比；
+        否则逐个比对，连续未修改的元素合并为源中的一个切片，新增的元素使用源中的换行符
+        '''
+        src: _Source = self.__source
+        text: str = src.text
+
+        if self.__touched is not None:
+            indexes: List[int] = sorted(filter(lambda x: x >= 0,map(src.index,self.__touched.values())))
+            owners: list = src.owners
+            chunks: List[str] = []
+            patches: List[Tuple[int,int]] = []
+            pos: int = 0
+
+            for i in indexes:
+                start: int = src.start(i)
+                end: int = src.start(i + 1) - 1
+                patched: Optional[str] = self.__patched(owners[i],text[start:end])
+
+                if patched is None:
+                    continue
+
+                chunks.append(text[pos:start])
+                chunks.append(patched)
+                pos = end
+                patches.append((i,len(patched) - (end - start)))
+
+            chunks.append(text[pos:])
+
+            if not rebase:
+                return (chunks,None)
+            return (chunks,src.rebased(''.join(chunks),patches) if patches else src)
+
+        starts: array = src.starts
+        owners = src.owners
+        units: list = list(self.__units())
+        first: int = text.find('\n')
+        newline: str = '\r\n' if first > 0 and text[first - 1] == '\r' else '\n'
+        chunks = []
+        new_starts: array = array('q')
+        size: int = 0
+        run: int = -1
+        last: int = -1
+        expected: int = 0
+
+        def separate() -> NoReturn:
+            '''源中的切片以\r结尾时只需补上\n，否则使用源中的换行符'''
+            nonlocal size
+            if chunks:
+                sep: str = '\n' if chunks[-1].endswith('\r') else newline
+                chunks.append(sep)
+                size += len(sep)
+
+        def flush() -> NoReturn:
+            nonlocal size
+            separate()
+            base: int = size - starts[run]
+            new_starts.extend(starts[i] + base for i in range(run,last + 1))
+            chunk: str = text[starts[run]:starts[last + 1] - 1]
+            chunks.append(chunk)
+            size += len(chunk)
+
+        for obj in units:
+
+            if expected < len(owners) and owners[expected] is obj:
+                index: int = expected
+            else:
+                index = src.index(obj)
+
+            if index < 0:
+                patched = str(obj) if isinstance(obj,Element) else '[{0}]'.format(obj.name)
+            else:
+                expected = index + 1
+                patched = self.__patched(obj,text[starts[index]:starts[index + 1] - 1]) \
+                if isinstance(obj,Section) or obj.dirty else None
+
+            if patched is None:
+                if run >= 0 and index == last + 1:
+                    last = index
+                    continue
+                if run >= 0:
+                    flush()
+                run = last = index
+                continue
+
+            if run >= 0:
+                flush()
+                run = -1
+
+            separate()
+            new_starts.append(size)
+            chunks.append(patched)
+            size += len(patched)
+
+        if run >= 0:
+            flush()
+
+        new_starts.append(size + 1)
+        return (chunks,_Source(''.join(chunks),units,new_starts) if rebase else None)
+
+
+    def iter_patch_chunks(self) -> Iterator[str]:
+        '''
+        逐段产生与源相比修改最少的文本：未修改的元素和段落头原样复制源中的文本，
+        修改了值的属性保留原来的键和空白，只有新增或修改的部分重新生成
+        未保留源时与iter_chunks相同
+        '''
+        if not self.__sourced():
+            return self.iter_chunks()
+        return iter(self.__patch(False)[0])
     
     
     @property
@@ -447,54 +1347,144 @@ class Ini(IIni):
     
     @elements.setter
     def elements(self,eles: List[Element]) -> NoReturn:
-
+        '''普通list会被复制为TrackedList'''
         check(eles,list)
         if any(map(lambda x: not isinstance(x,Element),eles)):
             raise TypeError()
-        self.__elements = eles
+        self.__elements = eles if isinstance(eles,TrackedList) else TrackedList(eles)
+        _adopt(self.__elements,self)
+        self.__changed = True
+        self.__touched = None
 
 
     @property
     def sections(self) -> List[Section]:
-
+        '''apply_text_edit之后，第一次访问时才移动其后段落中的行号'''
+        if self.__stale is not None:
+            self.__settle()
         return self.__sections
 
 
     @sections.setter
     def sections(self,secs: List[Section]) -> NoReturn:
-
+        '''普通list会被复制为TrackedList'''
         check(secs,list)
         if any(map(lambda x: not isinstance(x,Section),secs)):
             raise TypeError()
-        self.__sections = secs
+        self.__sections = secs if isinstance(secs,TrackedList) else TrackedList(secs)
+        _adopt(self.__sections,self)
+        self.__index = None
+        self.__changed = True
+        self.__touched = None
+
+
+    @property
+    def dirty(self) -> bool:
+        '''
+        内容在创建、读取或上次mark_clean之后是否被修改(不含文件名)
+        只修改已有属性的值时不需要重新生成文本即可判断
+        '''
+        if self.__changed or (self.__elements.version,self.__sections.version) != self.__saved:
+            return True
+        return any(map(_get_dirty,self.__elements)) or any(map(_get_dirty,self.__sections))
+
+
+    def mark_clean(self) -> NoReturn:
+        '''
+        将全部内容标记为未修改，write之后自动调用
+        之前以minimal方式写入过时，写入的文本成为新的源
+        '''
+        for ele in self.__elements:
+            ele.mark_clean()
+        for sec in self.__sections:
+            sec.mark_clean()
+        if self.__pending is not None:
+            pending: _Source = self.__pending
+            # 结构未变时写入后的源由同样的对象组成，它们已经记录了所属
+            if self.__touched is None or pending.owners is not self.__source.owners:
+                self.__own(self.__elements,self.__sections)
+            self.__source = pending
+            self.__pending = None
+            self.__touched = {}
+            self.__forget()
+        self.__saved = (self.__elements.version,self.__sections.version)
+        self.__changed = False
+
+
+    def _edited(self,unit: Union[Section,Element,None],renamed: bool) -> NoReturn:
+        '''
+        段落或属性unit被修改时由段落或属性通知，段落名被修改时索引过期
+        unit为None时为头部元素或段落结构被修改；修改记录在__touched中，参见__patch
+        '''
+        if renamed:
+            self.__index = None
+        touched: Optional[Dict[int,object]] = self.__touched
+        if touched is not None:
+            if unit is None:
+                self.__touched = None
+            else:
+                touched[id(unit)] = unit
+
+
+    def __fresh(self) -> bool:
+
+        return self.__index is not None and self.__indexed == self.__sections.version
+
+
+    def __nameindex(self) -> Dict[str,List[int]]:
+        '''段落名到位置的索引，段落列表或段落名变化后重建'''
+        if not self.__fresh():
+            index: Dict[str,List[int]] = {}
+
+            for i,sec in enumerate(self.__sections):
+
+                if sec._owner is not self:
+                    _adopt(sec,self)
+
+                positions = index.get(sec.name)
+
+                if positions is None:
+                    index[sec.name] = [i]
+                else:
+                    positions.append(i)
+
+            self.__index = index
+            self.__indexed = self.__sections.version
+
+        return self.__index
         
     
     def __getattr__(self,attr: Optional[str] = None) -> Optional[Section]:
-        '''获取一个指定名称的段落'''
-        if self.sections is None:
+        '''获取第一个指定名称的段落'''
+        if attr.startswith('_Ini__') or attr.startswith('__'):
+            raise AttributeError(attr)
 
-            return self.sections
+        positions: Optional[List[int]] = self.__nameindex().get(attr)
 
-        for sec in self.sections:
+        if not positions is None:
 
-            if attr == sec.name:
+            if self.__stale is not None:
+                self.__settle()
 
-                return sec
+            return self.__sections[positions[0]]
             
             
     def get_section(self,name: str) -> Section:
-        '''获取一个指定名称的段落'''
-        finds = filterl(lambda x: x.name == name,self.sections)
+        '''获取最后一个指定名称的段落。如果不存在，则追加该段落'''
+        positions: Optional[List[int]] = self.__nameindex().get(name)
 
-        if len(finds) == 0:
+        if positions is None:
 
             sec = Section(name)
-            self.sections.append(sec)
+            self.append(sec)
             return sec
 
         else:
 
-            return finds[-1]
+            if self.__stale is not None:
+                self.__settle()
+
+            return self.__sections[positions[-1]]
 
     getsection = get_section
     
@@ -503,8 +1493,14 @@ class Ini(IIni):
         '''追加段落或头部元素'''
         if isinstance(obj,Section):
 
+            fresh: bool = self.__fresh()
             self.__sections.append(obj)
 
+            if fresh:
+                _adopt(obj,self)
+                self.__index.setdefault(obj.name,[]).append(len(self.__sections) - 1)
+                self.__indexed = self.__sections.version
+
         elif isinstance(obj,Element):
 
             self.__elements.append(obj)
@@ -518,17 +1514,16 @@ class Ini(IIni):
         
         
     def remove(self,name: str) -> bool:
-        '''删除指定名称的段落'''
+        '''删除第一个指定名称的段落'''
         check(name,str)
+        positions: Optional[List[int]] = self.__nameindex().get(name)
 
-        for i in range(0,len(self.sections)):
-
-            if self.sections[i].name == name:
+        if positions is None:
 
-                self.sections.pop(i)
-                return True
+            return False
 
-        return False
+        del self.__sections[positions[0]]
+        return True
             
     def removeat(self,pos: int) -> bool:
         '''删除指定位置的头部元素'''
@@ -543,25 +1538,37 @@ class Ini(IIni):
             self.__elements.pop(pos)
             
     def insert_section(self,sec: Section,before: str) -> NoReturn:
-        '''在指定的段落之前插入段落'''
+        '''
+        在第一个指定名称的段落之前插入段落
+        抛出SectionNotExistedError
+        '''
         check(sec,Section)
+        positions: Optional[List[int]] = self.__nameindex().get(before)
 
-        for i in range(0,len(self.__sections)):
-
-            if self.__sections[i].name == before:
+        if positions is None:
 
-                self.__sections.insert(i,sec)
+            raise SectionNotExistedError('段落不存在 -> ' + before)
 
-        raise SectionNotExistedError()
+        self.__sections.insert(positions[0],sec)
                 
     
-    def write(self):
+    def write(self,minimal: bool = False):
         '''
         输出ini内容到文件
+        minimal为True且保留了源时只改写修改过的部分，其余字节(包括换行符)与源相同
+        否则重新生成全部文本，并不再保留源
         抛出IOError异常
         '''
-        with open(self.__filename,'w',encoding='utf-8') as f:
-            f.write(str(self))
+        if minimal and self.__sourced():
+            with open(self.__filename,'w',encoding='utf-8',newline='') as f:
+                self.write_to(f,True)
+        else:
+            with open(self.__filename,'w',encoding='utf-8') as f:
+                self.write_to(f)
+            self.__source = None
+            self.__touched = None
+            self.__forget()
+        self.mark_clean()
 
 
     def merge(self,ini):
@@ -575,19 +1582,15 @@ class Ini(IIni):
 
             if not skip is None:
 
-                if skip.value == 'true':
+                if skip.value.strip().lower() == 'true':
                     continue
 
-            if not sec.name in map(lambda x: x.name,self.sections):
-                self.sections.append(Section(sec.name))
-
-            this_sec: Optional[Section] = self.getsection(sec.name)
-
-            if this_sec is None:
-                continue
+            this_sec: Section = self.get_section(sec.name)
+            keys: Set[str] = set(attr.key for attr in this_sec.getattrs())
 
             for attr in sec.getattrs():
-                if not attr.key in map(lambda x: x.key,this_sec.getattrs()) and not attr.key in not_copied_keys[1]:
+                if not attr.key in keys and not (sec.name,attr.key) in _not_copied and not ('#',attr.key) in _not_copied:
+                    keys.add(attr.key)
                     this_sec.append(Attribute(attr.key,attr.value))
     
 
@@ -645,70 +1648,119 @@ class Ini(IIni):
             return ini
 
     
+    def to_compact(self) -> tuple:
+        '''
+        转换为只含tuple、str、int的紧凑形式，可用marshal序列化
+        元素为(content,linenum)，属性为(key,value,linenum)，段落为(name,linenum,元素)
+        '''
+        def items(elements: List[Element]) -> tuple:
+            return tuple((ele.key,ele.value,ele.linenum) if isinstance(ele,Attribute) else (str(ele),ele.linenum)
+            for ele in elements)
+
+        if self.__stale is not None:
+            self.__settle()
+
+        return (self.__filename,items(self.__elements),
+        tuple((sec.name,sec.linenum,items(sec.elements)) for sec in self.__sections))
+
+
+    @classmethod
+    def from_compact(cls: type,compact: tuple) -> IIni:
+        '''从to_compact的结果重建ini'''
+        def items(compact_items: tuple) -> Iterator[Element]:
+            return (Attribute(*item) if len(item) == 3 else Element(*item) for item in compact_items)
+
+        filename,elements,sections = compact
+        ini: Ini = Ini(filename)
+        # 与from_tokens相同，跳过TrackedList的计数，重建的ini是未修改的
+        list.extend(ini.__elements,items(elements))
+
+        for name,linenum,compact_items in sections:
+            sec: Section = Section(name,linenum)
+            list.extend(sec.elements,items(compact_items))
+            list.append(ini.__sections,sec)
+
+        return ini
+
+
     @classmethod
-    def create_ini(cls: type,text: str,filename: str = 'untitled.ini') -> IIni:
+    def create_ini(cls: type,text: str,filename: str = 'untitled.ini',keep_source: bool = False) -> IIni:
         '''
-        从字符串创建ini，第二版
+        从字符串创建ini，第三版
+        由rwpy.parser的解析引擎单遍扫描，直接构造段落
+        keep_source为True时保留原文和每个元素在原文中的位置，供write(minimal=True)使用
         抛出IniSyntaxError
         '''
         check(text,str)
         check(filename,str)
         
-        if text.isspace() or text == '':
+        if (text.isspace() or text == '') and not keep_source:
             return Ini()
-            
-        inib: Ini.IniBuilder = Ini.IniBuilder().setfilename(filename)
-        ptr: IBuilder = inib
+
         lines: List[str] = text.split('\n')
-        linenum: int = 0
-        alinenum: int = 0
+
+        if not keep_source:
+            return Ini.from_tokens(tokenize(lines),filename)
+
+        linenums: array = array('q')
+
+        def record(tokens: Iterator[tuple]) -> Iterator[tuple]:
+            for token in tokens:
+                linenums.append(token[1])
+                yield token
+
+        ini: Ini = Ini.from_tokens(record(tokenize(lines)),filename)
+        # 每个元素占据源中连续的若干行，下一个元素的起始位置即为其结束位置
+        offsets: List[int] = [0]
+        offsets.extend(accumulate(len(line) + 1 for line in lines))
+        starts: array = array('q',(offsets[linenum - 1] for linenum in linenums))
+        starts.append(len(text) + 1)
+        ini.__source = _Source(text,list(ini.__units()),starts)
+        ini.__own(ini.__elements,ini.__sections)
+        ini.__touched = {}
+        return ini
+
+
+    @classmethod
+    def from_stream(cls: type,stream: Union[TextIO,BinaryIO],filename: str = 'untitled.ini') -> IIni:
+        '''
+        从文件对象按块流式创建ini，字节流按UTF-8解码，结果与create_ini(stream.read())相同
+        抛出IniSyntaxError和UnicodeDecodeError
+        '''
+        check(filename,str)
+        ini: Ini = Ini.from_tokens(tokenize(iter_lines(stream)),filename)
+
+        if len(ini.sections) == 0 and all(map(lambda x: str(x).isspace() or str(x) == '',ini.elements)):
+            return Ini()
+
+        return ini
+
+
+    @classmethod
+    def from_tokens(cls: type,tokens: Iterable[tuple],filename: str = 'untitled.ini') -> IIni:
+        '''
+        从rwpy.parser.tokenize产生的元组构建ini
+        抛出IniSyntaxError
+        '''
+        ini: Ini = Ini(filename)
+        # 构建期间还没有索引，直接调用list.append跳过TrackedList的计数
+        sec_append: Callable[[Section],None] = list.append.__get__(ini.__sections)
+        append: Callable[[Element],None] = list.append.__get__(ini.__elements)
         
-        while len(lines) > 0:
-            line = lines.pop(0)
-            linenum += 1
+        for kind,linenum,key,value,endline in tokens:
 
-            if line.lstrip().startswith('#'):
-                ptr.append_ele(line)
-                continue
-            
-            if not re.match(r'\s*\[.+\]',line.strip()) is None:
-            
-                if isinstance(ptr,Section.SectionBuilder):
-                    ptrs: Section = ptr.build()
-                    ptrs.linenum = alinenum
-                    inib.append_sec(ptrs)
-                    
-                ptr = Section.SectionBuilder().setname(line.strip()[1:-1])
-                alinenum = linenum
-                
-            elif not re.match(r'\s*[^#].*:.+',line) is None:
-                key,value = line.split(':',1)[0], line.split(':',1)[1]
-                clinenum = linenum
-                
-                if value.lstrip().startswith('\"\"\"'):
-                
-                    while True:
-                    
-                        if len(lines) == 0:
-                            raise IniSyntaxError('行号:{0}|意外终止的多行文本'.format(linenum))
-                            
-                        value += '\n' + lines.pop(0)
-                        linenum += 1
-                        
-                        if value.rstrip().endswith('\"\"\"'):
-                            break
-                            
-                ptr.append_attr(key.strip(),value.strip(),clinenum)
-                
-            else:
+            if kind == ATTRIBUTE or kind == MULTILINE:
+                append(Attribute(key,value,linenum))
 
-                ptr.append_ele(line,linenum)
-                
-        if isinstance(ptr,Section.SectionBuilder):
+            elif kind == SECTION:
+                sec: Section = Section(key,linenum)
+                sec_append(sec)
+                append = list.append.__get__(sec.elements)
 
-            ptrs: Section = ptr.build()
-            ptrs.linenum = alinenum
-            inib.append_sec(ptrs)
-            
-        ini: Ini = inib.build()
-        return ini
\ No newline at end of file
+            elif kind == COMMENT:
+                append(Element(value))
+
+            else:
+                append(Element(value,linenum))
+                
+        return ini
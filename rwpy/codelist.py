@@ -0,0 +1,224 @@
+'''
+代码表校验
+'''
+import json
+import re
+from typing import Dict,List,NamedTuple,Optional,Pattern,Set,Tuple
+
+from rwpy.code import IIni,Attribute,Section
+from rwpy.util import check
+
+
+_META = re.compile(r'[\\\[\]{}()|.+*?#/^$]')
+
+
+class Problem(NamedTuple):
+    '''校验发现的问题，key为None时表示段落本身的问题'''
+    filename: str
+    linenum: int
+    section: str
+    key: Optional[str]
+    message: str
+
+
+def _section_pattern(name: str) -> Optional[str]:
+    '''
+    将代码表中的段落名转为正则表达式，#代表数字
+    含有空白的名称(如Spawn units line)描述的是值格式而不是段落，返回None
+    '''
+    name = name.strip().split(']',1)[0]
+    if name == '' or re.search(r'\s',name):
+        return None
+    return name.replace('#',r'\d+')
+
+
+def _key_pattern(key: str) -> str:
+    '''
+    将代码表中的代码名转为正则表达式
+    忽略:之后的说明，{LANG}代表语言后缀，[time]代表时间，a_b/c代表a_b或a_c
+    '''
+    key = key.split(':',1)[0].strip()
+    key = key.replace('{LANG}',r'\w+').replace('[time]',r'[\d.]+').replace('#',r'\d+')
+    head,sep,tail = key.rpartition('_')
+    if '/' in tail:
+        key = head + sep + '(?:' + '|'.join(tail.split('/')) + ')'
+    return key
+
+
+class _Group(object):
+    '''一个段落模式下允许的代码，名称不含正则元字符的代码直接放入字典'''
+    __slots__ = ('name','exact','pattern','patterns','memo')
+
+    def __init__(self,name: str):
+        self.name: str = name
+        self.exact: Dict[str,str] = {}
+        self.patterns: List[Tuple[str,str]] = []
+        self.pattern: Optional[Pattern] = None
+        self.memo: Dict[str,Optional[str]] = {}
+
+
+    def add(self,key: str,value_type: str):
+        pattern: str = _key_pattern(key)
+        if _META.search(pattern) is None:
+            self.exact.setdefault(pattern,value_type)
+            return
+        try:
+            re.compile(pattern)
+        except re.error:
+            self.exact.setdefault(pattern,value_type)
+            return
+        self.patterns.append((pattern,value_type))
+
+
+    def compile(self):
+        if len(self.patterns) > 0:
+            self.pattern = re.compile('|'.join('(?P<k{0}>{1})'.format(i,p) for i,(p,t) in enumerate(self.patterns)))
+
+
+    def value_type(self,key: str) -> Optional[str]:
+        '''代码的值类型，未知代码返回None'''
+        value_type: Optional[str] = self.exact.get(key)
+        if value_type is not None:
+            return value_type
+        try:
+            return self.memo[key]
+        except KeyError:
+            pass
+        match = None if self.pattern is None else self.pattern.fullmatch(key)
+        value_type = None if match is None else self.patterns[int(match.lastgroup[1:])][1]
+        self.memo[key] = value_type
+        return value_type
+
+
+class Validator(object):
+    '''
+    由ncodelist.json格式的代码表编译的校验器
+    段落名先查字典，再由所有段落模式合成的一个正则表达式匹配；每个段落模式下的代码同理
+    以@开头的代码(如@define)是元代码，不做检查
+    '''
+    def __init__(self,codelist_src: dict):
+        check(codelist_src,dict)
+        self.__src: dict = codelist_src
+        self.__exact: Dict[str,_Group] = {}
+        self.__groups: List[_Group] = []
+        self.__memo: Dict[str,Optional[_Group]] = {}
+        self.__key_memo: Dict[str,Optional[str]] = {}
+        patterns: List[str] = []
+
+        for sec in codelist_src['sections']:
+            pattern: Optional[str] = _section_pattern(sec['name'])
+            if pattern is None:
+                continue
+            if _META.search(pattern) is None:
+                group: _Group = self.__exact.setdefault(pattern,_Group(sec['name']))
+            else:
+                group = _Group(sec['name'])
+                self.__groups.append(group)
+                patterns.append(pattern)
+            for attr in sec['attributes']:
+                group.add(attr['key'],attr['value_type'])
+
+        for group in list(self.__exact.values()) + self.__groups:
+            group.compile()
+
+        self.__pattern: Optional[Pattern] = None
+        if len(patterns) > 0:
+            self.__pattern = re.compile('|'.join('(?P<s{0}>{1})'.format(i,p) for i,p in enumerate(patterns)))
+
+
+    @property
+    def src(self) -> dict:
+        '''源'''
+        return self.__src
+
+
+    def __group(self,sec_name: str) -> Optional[_Group]:
+        group: Optional[_Group] = self.__exact.get(sec_name)
+        if group is not None:
+            return group
+        try:
+            return self.__memo[sec_name]
+        except KeyError:
+            pass
+        match = None if self.__pattern is None else self.__pattern.fullmatch(sec_name)
+        group = None if match is None else self.__groups[int(match.lastgroup[1:])]
+        self.__memo[sec_name] = group
+        return group
+
+
+    def has_section(self,sec_name: str) -> bool:
+        '''段落名是否在代码表中'''
+        return self.__group(sec_name) is not None
+
+
+    def section_of(self,sec_name: str) -> Optional[str]:
+        '''段落所属的代码表段落名(如projectile_1属于projectile_.+)，未知段落返回None'''
+        group: Optional[_Group] = self.__group(sec_name)
+        return None if group is None else group.name
+
+
+    def value_type(self,sec_name: str,key: str) -> Optional[str]:
+        '''代码的值类型，段落或代码未知时返回None'''
+        group: Optional[_Group] = self.__group(sec_name)
+        return None if group is None else group.value_type(key)
+
+
+    def key_type(self,key: str) -> Optional[str]:
+        '''不知道段落时代码的值类型，取第一个含有该代码的段落，未知时返回None'''
+        try:
+            return self.__key_memo[key]
+        except KeyError:
+            pass
+        value_type: Optional[str] = None
+        for group in list(self.__exact.values()) + self.__groups:
+            value_type = group.value_type(key)
+            if value_type is not None:
+                break
+        self.__key_memo[key] = value_type
+        return value_type
+
+
+    def validate_section(self,filename: str,sec: Section) -> List[Problem]:
+        '''校验一个段落，返回未知的段落或代码'''
+        group: Optional[_Group] = self.__group(sec.name)
+
+        if group is None:
+            return [Problem(filename,sec.linenum,sec.name,None,'未知的段落')]
+
+        return [Problem(filename,ele.linenum,sec.name,ele.key,'未知的代码') for ele in sec.elements
+        if isinstance(ele,Attribute) and not ele.key.startswith('@') and group.value_type(ele.key) is None]
+
+
+    def validate(self,ini: IIni) -> List[Problem]:
+        '''校验一个ini，返回未知的段落和代码'''
+        problems: List[Problem] = []
+        filename: str = ini.filename
+
+        for sec in ini.sections:
+            problems.extend(self.validate_section(filename,sec))
+
+        return problems
+
+
+    def validate_mod(self,mod,dir: Optional[str] = None,workers: Optional[int] = None,
+    executor: str = 'thread') -> List[Problem]:
+        '''
+        校验mod下某一文件夹下全部ini，文件的读取和解析按Mod.iter_inis并行
+        结果按文件名和行号排列
+        抛出IniSyntaxError
+        '''
+        problems: List[Problem] = []
+        for ini in mod.iter_inis(dir,workers,executor):
+            problems.extend(self.validate(ini))
+        problems.sort(key=lambda x: (x.filename,x.linenum))
+        return problems
+
+
+    @classmethod
+    def load(cls: type,filename: str = 'ncodelist.json'):
+        '''
+        从json文件加载校验器
+        抛出IOError异常
+        '''
+        with open(filename,'r',encoding='utf-8') as f:
+            return cls(json.load(f))
@@ -0,0 +1,239 @@
+'''
+按列导出mod中全部单位的数值
+'''
+import ast
+import csv
+import math
+import os
+import struct
+from array import array
+from typing import Dict,Iterable,Iterator,List,NoReturn,Optional,TextIO,Tuple,Union
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+from rwpy.code import IIni
+from rwpy.util import check
+import rwpy.values as values
+
+
+NPY_MAGIC: bytes = b'\x93NUMPY\x01\x00'
+
+
+def _is_true(value: Optional[str]) -> bool:
+    return value is not None and value.strip().lower() == 'true'
+
+
+def parse_field(field: str) -> Tuple[str,str]:
+    '''段落.代码 -> (段落,代码)'''
+    check(field,str)
+    section,sep,key = field.partition('.')
+    if sep == '' or section == '' or key == '':
+        raise ValueError('字段应为 段落.代码 -> ' + field)
+    return (section,key)
+
+
+def write_npy(path: str,descr: str,count: int,payload: bytes) -> NoReturn:
+    '''
+    写入一维.npy文件，payload为按descr排列的原始数据
+    抛出IOError异常
+    '''
+    header: str = "{{'descr': '{0}', 'fortran_order': False, 'shape': ({1},), }}".format(descr,count)
+    size: int = len(NPY_MAGIC) + 2 + len(header) + 1
+    header += ' ' * (-size % 64) + '\n'
+    with open(path,'wb') as f:
+        f.write(NPY_MAGIC)
+        f.write(struct.pack('<H',len(header)))
+        f.write(header.encode('latin1'))
+        f.write(payload)
+
+
+def read_npy(path: str) -> Tuple[str,int,bytes]:
+    '''
+    读取write_npy写入的文件，返回(descr,长度,原始数据)
+    抛出IOError和ValueError异常
+    '''
+    with open(path,'rb') as f:
+        data: bytes = f.read()
+    if not data.startswith(NPY_MAGIC):
+        raise ValueError('不是.npy文件 -> ' + path)
+    length: int = struct.unpack('<H',data[8:10])[0]
+    header: dict = ast.literal_eval(data[10:10 + length].decode('latin1'))
+    return (header['descr'],header['shape'][0],data[10 + length:])
+
+
+class Columns(object):
+    '''
+    按列存放的单位数值，每行对应files中的一个文件
+    数值类型的字段为float64数组(有NumPy时为numpy.ndarray，否则为array('d'))，缺失处为nan
+    其他字段为字符串列表(有NumPy时为object数组)，缺失处为None
+    mask(field)为布尔数组，值存在且能解码的位置为True
+    '''
+    def __init__(self,fields: List[str],files: List[str],data: Dict[str,object],masks: Dict[str,object],
+    numeric: Dict[str,bool]):
+        self.__fields: List[str] = fields
+        self.__files: List[str] = files
+        self.__data: Dict[str,object] = data
+        self.__masks: Dict[str,object] = masks
+        self.__numeric: Dict[str,bool] = numeric
+
+
+    @property
+    def fields(self) -> List[str]:
+        return self.__fields[:]
+
+
+    @property
+    def files(self) -> List[str]:
+        '''每一行对应的文件，相对于mod根目录'''
+        return self.__files[:]
+
+
+    def __len__(self) -> int:
+        return len(self.__files)
+
+
+    def __getitem__(self,field: str):
+        return self.__data[field]
+
+
+    def mask(self,field: str):
+        '''值存在且能解码的位置'''
+        return self.__masks[field]
+
+
+    def is_numeric(self,field: str) -> bool:
+        return self.__numeric[field]
+
+
+    def rows(self) -> Iterator[list]:
+        '''逐行产生[文件,各字段的值]，缺失的值为None'''
+        for i in range(0,len(self.__files)):
+            row: list = [self.__files[i]]
+            for field in self.__fields:
+                row.append(self.__data[field][i] if self.__masks[field][i] else None)
+            yield row
+
+
+    def write_csv(self,stream: TextIO) -> NoReturn:
+        '''以CSV格式写入流，第一列为文件，缺失的值为空'''
+        writer = csv.writer(stream,lineterminator='\n')
+        writer.writerow(['file'] + self.__fields)
+        for row in self.rows():
+            writer.writerow(['' if value is None else
+            (int(value) if isinstance(value,float) and value.is_integer() else value) for value in row])
+
+
+    def to_csv(self,path: str) -> NoReturn:
+        '''
+        输出为CSV文件
+        抛出IOError异常
+        '''
+        with open(path,'w',encoding='utf-8',newline='') as f:
+            self.write_csv(f)
+
+
+    def to_npy(self,directory: str) -> List[str]:
+        '''
+        每个字段输出为 字段.npy 和 字段.mask.npy，字符串字段为定长unicode数组
+        另有files.txt记录每一行对应的文件，返回写入的全部路径
+        抛出IOError异常
+        '''
+        os.makedirs(directory,exist_ok=True)
+        count: int = len(self.__files)
+        paths: List[str] = []
+
+        for field in self.__fields:
+            path: str = os.path.join(directory,field + '.npy')
+
+            if self.__numeric[field]:
+                column = self.__data[field]
+                payload: bytes = column.tobytes() if numpy is not None else array('d',column).tobytes()
+                write_npy(path,'<f8',count,payload)
+            else:
+                strs: List[str] = ['' if value is None else value for value in self.__data[field]]
+                width: int = max([len(x) for x in strs] + [1])
+                payload = b''.join(x.ljust(width,'\0').encode('utf-32-le') for x in strs)
+                write_npy(path,'<U{0}'.format(width),count,payload)
+
+            mask_path: str = os.path.join(directory,field + '.mask.npy')
+            write_npy(mask_path,'|b1',count,bytes(bool(x) for x in self.__masks[field]))
+            paths += [path,mask_path]
+
+        files_path: str = os.path.join(directory,'files.txt')
+        with open(files_path,'w',encoding='utf-8') as f:
+            f.write('\n'.join(self.__files))
+        paths.append(files_path)
+        return paths
+
+
+def build_columns(entries: Iterable[Tuple[str,IIni]],count: int,fields: List[str]) -> Columns:
+    '''
+    从(文件,ini)流中填充预先分配的列，count为行数上限
+    跳过没有[core]和[core]dont_load为true的文件
+    '''
+    specs: List[Tuple[str,str,str,object,bool]] = []
+    data: Dict[str,object] = {}
+    masks: Dict[str,object] = {}
+    numeric: Dict[str,bool] = {}
+
+    for field in fields:
+        section,key = parse_field(field)
+        value_type: Optional[str] = values.lookup_type(section,key)
+        is_numeric: bool = value_type is not None and values.normalize_type(value_type) in values.NUMERIC
+        numeric[field] = is_numeric
+
+        if numpy is not None:
+            data[field] = numpy.full(count,numpy.nan) if is_numeric else numpy.full(count,None,dtype=object)
+            masks[field] = numpy.zeros(count,dtype=bool)
+        else:
+            data[field] = array('d',[math.nan]) * count if is_numeric else [None] * count
+            masks[field] = array('b',bytes(count))
+
+        specs.append((field,section,key,values.decoder(value_type) if is_numeric else None,is_numeric))
+
+    files: List[str] = []
+    row: int = 0
+
+    for relpath,ini in entries:
+        core = ini.core
+
+        if core is None or row >= count:
+            continue
+
+        dont_load = core['dont_load']
+
+        if dont_load is not None and _is_true(dont_load.value):
+            continue
+
+        for field,section,key,decode,is_numeric in specs:
+            sec = core if section == 'core' else getattr(ini,section)
+            attr = None if sec is None else sec[key]
+
+            if attr is None:
+                continue
+
+            if is_numeric:
+                try:
+                    data[field][row] = float(decode(attr.value))
+                except ValueError:
+                    continue
+            else:
+                data[field][row] = attr.value
+
+            masks[field][row] = True
+
+        files.append(relpath)
+        row += 1
+
+    for field in fields:
+        if numpy is not None:
+            data[field] = data[field][:row]
+            masks[field] = masks[field][:row]
+        else:
+            del data[field][row:]
+            del masks[field][row:]
+
+    return Columns(fields[:],files,data,masks,numeric)
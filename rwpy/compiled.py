@@ -0,0 +1,404 @@
+'''
+预编译的代码表：由codelist.json或ncodelist.json生成紧凑的二进制查找表，以mmap打开
+启动时只读取文件头，不解析json；说明文字在查询时才解码
+本模块只依赖启动开销很小的标准库模块，rwpy.code、json、re等在需要时才导入
+'''
+from __future__ import annotations
+
+import mmap
+import os
+import struct
+import _thread
+
+TYPE_CHECKING = False
+
+# typing会连带导入re等模块，只在类型检查时导入
+if TYPE_CHECKING:
+    from typing import Dict,Iterator,List,NoReturn,Optional,Tuple,Union
+
+
+MAGIC: bytes = b'RWCL'
+FORMAT_VERSION: int = 1
+
+# 魔数,格式版本,源文件大小,源文件修改时间,源文件sha256,记录数
+_HEADER = struct.Struct('<4sIQq32sI')
+# 代码,段落,值类型,名称,说明各自在字符串池中的(偏移,长度)，以及在源中的顺序
+_RECORD = struct.Struct('<11I')
+_KEY,_SECTION,_TYPE,_NAME,_DESCRIPTION = range(0,5)
+
+_loaded: Dict[Tuple[str,str],CompiledCodeList] = {}
+# threading连带导入functools等模块，此处只需要一个锁
+_lock = _thread.allocate_lock()
+# 预编译文件写入时源文件的修改时间距写入时间不足此值(纳秒)时，之后同一修改时间内的改动无法由大小和修改时间发现
+RACY_NS: int = 2 * 10 ** 9
+
+
+def default_cache_dir() -> str:
+    '''预编译文件的默认位置：$XDG_CACHE_HOME/rwpy，未设置时为~/.cache/rwpy'''
+    base: Optional[str] = os.environ.get('XDG_CACHE_HOME')
+    if not base:
+        base = os.path.join(os.path.expanduser('~'),'.cache')
+    return os.path.join(base,'rwpy')
+
+
+def normalize_section(name: str) -> str:
+    '''[core]、core或core]...的规范形式core'''
+    name = name.strip()
+    if name.startswith('['):
+        name = name[1:]
+    return name.split(']',1)[0].strip()
+
+
+def normalize_key(key: str) -> str:
+    '''name:或name: 说明的规范形式name'''
+    return key.split(':',1)[0].strip()
+
+
+def _records(src: dict) -> Iterator[Tuple[str,str,str,str,str]]:
+    '''按源中的顺序产生(代码,段落,值类型,名称,说明)，兼容codelist.json和ncodelist.json两种格式'''
+    if 'sections' in src:
+        for sec in src['sections']:
+            section: str = normalize_section(sec['name'])
+            for attr in sec['attributes']:
+                yield (normalize_key(attr['key']),section,attr.get('value_type') or '',attr.get('name') or '',
+                attr.get('description') or '')
+    else:
+        for attr in src['attributes']:
+            yield (normalize_key(attr['key']),normalize_section(attr['section']),attr.get('value_type') or '',
+            attr.get('name') or '',attr.get('description') or '')
+
+
+def build(data: bytes,size: int = 0,mtime: int = 0) -> bytes:
+    '''
+    由代码表json的原始内容生成预编译的二进制形式
+    记录按(代码,段落)的UTF-8字节排序，字符串放在记录之后的字符串池中
+    抛出ValueError
+    '''
+    import hashlib
+    import json
+
+    src: dict = json.loads(str(data,'utf-8'))
+    pool: bytearray = bytearray()
+    offsets: Dict[str,Tuple[int,int]] = {}
+    rows: List[Tuple[bytes,bytes,int,tuple]] = []
+
+    def intern(text: str) -> Tuple[int,int]:
+        found: Optional[Tuple[int,int]] = offsets.get(text)
+        if found is None:
+            encoded: bytes = text.encode('utf-8')
+            found = (len(pool),len(encoded))
+            offsets[text] = found
+            pool.extend(encoded)
+        return found
+
+    for order,record in enumerate(_records(src)):
+        fields: tuple = tuple(intern(text) for text in record)
+        rows.append((record[0].encode('utf-8'),record[1].encode('utf-8'),order,fields))
+
+    rows.sort(key=lambda row: row[0:3])
+    out: bytearray = bytearray(_HEADER.pack(MAGIC,FORMAT_VERSION,size,mtime,hashlib.sha256(data).digest(),
+    len(rows)))
+    base: int = _HEADER.size + _RECORD.size * len(rows)
+
+    for key,section,order,fields in rows:
+        out += _RECORD.pack(*[x for off,length in fields for x in (base + off,length)],order)
+
+    out += pool
+    return bytes(out)
+
+
+class Entry(tuple):
+    '''代码表中的一条记录：(代码,段落,值类型,名称,说明)'''
+    __slots__ = ()
+
+    key = property(lambda self: self[0])
+    section = property(lambda self: self[1])
+    value_type = property(lambda self: self[2])
+    name = property(lambda self: self[3])
+    description = property(lambda self: self[4])
+
+
+class CompiledCodeList(object):
+    '''
+    预编译的代码表，查找表位于mmap(或bytes)中，按(代码,段落)二分查找
+    只做精确查找；带#、{LANG}等模式的代码见validator
+    '''
+    def __init__(self,buffer: Union[bytes,mmap.mmap],source: Optional[str] = None):
+        '''抛出ValueError'''
+        if len(buffer) < _HEADER.size:
+            raise ValueError('预编译代码表已损坏')
+
+        magic,version,size,mtime,digest,count = _HEADER.unpack_from(buffer,0)
+
+        if magic != MAGIC or version != FORMAT_VERSION or len(buffer) < _HEADER.size + _RECORD.size * count:
+            raise ValueError('预编译代码表已损坏')
+
+        self.__buffer: Union[bytes,mmap.mmap] = buffer
+        self.__count: int = count
+        self.__source: Optional[str] = source
+        self.__digest: bytes = digest
+        self.__validator = None
+        self.__strings: Dict[Tuple[int,int],str] = {}
+
+
+    @property
+    def source(self) -> Optional[str]:
+        '''源json文件'''
+        return self.__source
+
+
+    @property
+    def digest(self) -> bytes:
+        '''源json文件的sha256'''
+        return self.__digest
+
+
+    def __len__(self) -> int:
+        return self.__count
+
+
+    def __field(self,index: int,field: int) -> Tuple[int,int]:
+        pos: int = _HEADER.size + _RECORD.size * index + field * 8
+        return struct.unpack_from('<II',self.__buffer,pos)
+
+
+    def __bytes(self,index: int,field: int) -> bytes:
+        off,length = self.__field(index,field)
+        return self.__buffer[off:off + length]
+
+
+    def __str(self,index: int,field: int) -> str:
+        '''解码字符串池中的字符串，结果按位置缓存'''
+        location: Tuple[int,int] = self.__field(index,field)
+        text: Optional[str] = self.__strings.get(location)
+        if text is None:
+            off,length = location
+            text = str(self.__buffer[off:off + length],'utf-8')
+            self.__strings[location] = text
+        return text
+
+
+    def __order(self,index: int) -> int:
+        return struct.unpack_from('<I',self.__buffer,_HEADER.size + _RECORD.size * index + 40)[0]
+
+
+    def __lower_bound(self,key: bytes,section: bytes = b'') -> int:
+        '''第一个(代码,段落)不小于(key,section)的记录'''
+        low: int = 0
+        high: int = self.__count
+
+        while low < high:
+            mid: int = (low + high) // 2
+            if (self.__bytes(mid,_KEY),self.__bytes(mid,_SECTION)) < (key,section):
+                low = mid + 1
+            else:
+                high = mid
+
+        return low
+
+
+    def __find(self,section: str,key: str) -> int:
+        encoded_key: bytes = key.encode('utf-8')
+        encoded_section: bytes = section.encode('utf-8')
+        index: int = self.__lower_bound(encoded_key,encoded_section)
+
+        if index < self.__count and self.__bytes(index,_KEY) == encoded_key \
+        and self.__bytes(index,_SECTION) == encoded_section:
+            return index
+
+        return -1
+
+
+    def __with_key(self,key: str) -> List[int]:
+        '''含有该代码的全部记录，按在源中的顺序'''
+        encoded: bytes = key.encode('utf-8')
+        index: int = self.__lower_bound(encoded)
+        found: List[int] = []
+
+        while index < self.__count and self.__bytes(index,_KEY) == encoded:
+            found.append(index)
+            index += 1
+
+        found.sort(key=self.__order)
+        return found
+
+
+    def value_type(self,section: str,key: str) -> Optional[str]:
+        '''段落下代码的值类型，未知时返回None'''
+        index: int = self.__find(normalize_section(section),normalize_key(key))
+        return None if index < 0 else self.__str(index,_TYPE)
+
+
+    def key_type(self,key: str) -> Optional[str]:
+        '''不知道段落时代码的值类型，取源中第一个含有该代码的段落，未知时返回None'''
+        found: List[int] = self.__with_key(normalize_key(key))
+        return None if len(found) == 0 else self.__str(found[0],_TYPE)
+
+
+    def __entry(self,index: int) -> Entry:
+        return Entry(self.__str(index,field) for field in (_KEY,_SECTION,_TYPE,_NAME,_DESCRIPTION))
+
+
+    def describe(self,section: Optional[str],key: str) -> Optional[Entry]:
+        '''
+        代码的完整记录，此时才解码名称和说明；section为None时取源中第一个含有该代码的段落
+        未知时返回None
+        '''
+        if section is None:
+            found: List[int] = self.__with_key(normalize_key(key))
+            return None if len(found) == 0 else self.__entry(found[0])
+
+        index: int = self.__find(normalize_section(section),normalize_key(key))
+        return None if index < 0 else self.__entry(index)
+
+
+    def entries(self,section: Optional[str] = None) -> List[Entry]:
+        '''全部记录或某一段落下的记录，按在源中的顺序'''
+        wanted: Optional[bytes] = None if section is None else normalize_section(section).encode('utf-8')
+        indexes: List[int] = [i for i in range(0,self.__count) if wanted is None or self.__bytes(i,_SECTION) == wanted]
+        indexes.sort(key=self.__order)
+        return [self.__entry(i) for i in indexes]
+
+
+    def sections(self) -> List[str]:
+        '''全部段落名，按在源中第一次出现的顺序'''
+        first: Dict[str,int] = {}
+        for i in range(0,self.__count):
+            name: str = self.__str(i,_SECTION)
+            order: int = self.__order(i)
+            if order < first.get(name,order + 1):
+                first[name] = order
+        return sorted(first,key=first.get)
+
+
+    @property
+    def validator(self):
+        '''
+        由本代码表构建的rwpy.codelist.Validator，支持带模式的代码，第一次访问时构建
+        '''
+        if self.__validator is None:
+            from rwpy.codelist import Validator
+
+            sections: Dict[str,list] = {}
+            for entry in self.entries():
+                sections.setdefault(entry.section,[]).append({'key': entry.key,'value_type': entry.value_type})
+            self.__validator = Validator({'sections': [{'name': name,'attributes': attrs}
+            for name,attrs in sections.items()]})
+
+        return self.__validator
+
+
+    def close(self) -> NoReturn:
+        if isinstance(self.__buffer,mmap.mmap):
+            self.__buffer.close()
+
+
+def _artifact(path: str,cache_dir: str) -> str:
+    '''源文件对应的预编译文件路径，不同位置的同名源互不影响'''
+    import zlib
+    return os.path.join(cache_dir,'{0}.{1:08x}.rwcl'.format(os.path.basename(path),
+    zlib.crc32(os.path.abspath(path).encode('utf-8'))))
+
+
+def _valid(artifact: str,path: str,stat: os.stat_result) -> bool:
+    '''
+    预编译文件是否对应源文件的当前内容
+    源文件的大小和修改时间与记录的相同、且写入预编译文件时源文件已经修改了RACY_NS以上时直接认为有效；
+    否则比较sha256，内容未变时重写文件头，预编译文件的修改时间即为确认的时间
+    '''
+    try:
+        with open(artifact,'rb') as f:
+            header: bytes = f.read(_HEADER.size)
+            written: int = os.fstat(f.fileno()).st_mtime_ns
+    except OSError:
+        return False
+
+    if len(header) < _HEADER.size:
+        return False
+
+    magic,version,size,mtime,digest,count = _HEADER.unpack(header)
+
+    if magic != MAGIC or version != FORMAT_VERSION:
+        return False
+
+    if size == stat.st_size and mtime == stat.st_mtime_ns and written - mtime >= RACY_NS:
+        return True
+
+    import hashlib
+
+    with open(path,'rb') as f:
+        if hashlib.sha256(f.read()).digest() != digest:
+            return False
+
+    with open(artifact,'r+b') as f:
+        f.write(_HEADER.pack(MAGIC,FORMAT_VERSION,stat.st_size,stat.st_mtime_ns,digest,count))
+
+    return True
+
+
+def compile_codelist(path: str,output: str) -> NoReturn:
+    '''
+    将代码表json编译为预编译文件，先写入临时文件再替换
+    抛出IOError和ValueError异常
+    '''
+    import tempfile
+
+    stat: os.stat_result = os.stat(path)
+
+    with open(path,'rb') as f:
+        data: bytes = f.read()
+
+    compiled: bytes = build(data,stat.st_size,stat.st_mtime_ns)
+    directory: str = os.path.dirname(os.path.abspath(output))
+    os.makedirs(directory,exist_ok=True)
+    fd,tmp = tempfile.mkstemp(dir=directory,suffix='.tmp')
+
+    try:
+        with os.fdopen(fd,'wb') as f:
+            f.write(compiled)
+        os.replace(tmp,output)
+    except BaseException:
+        if os.path.exists(tmp):
+            os.remove(tmp)
+        raise
+
+
+def _open(path: str,cache_dir: str) -> CompiledCodeList:
+    stat: os.stat_result = os.stat(path)
+    artifact: str = _artifact(path,cache_dir)
+
+    try:
+        if not _valid(artifact,path,stat):
+            compile_codelist(path,artifact)
+
+        with open(artifact,'rb') as f:
+            return CompiledCodeList(mmap.mmap(f.fileno(),0,access=mmap.ACCESS_READ),path)
+
+    except (OSError,ValueError):
+        # 缓存目录不可写或预编译文件损坏时在内存中编译
+        with open(path,'rb') as f:
+            return CompiledCodeList(build(f.read()),path)
+
+
+def load(path: Optional[str] = None,cache_dir: Optional[str] = None) -> CompiledCodeList:
+    '''
+    打开代码表的预编译形式，每个进程中同一源只打开一次
+    path默认为rwpy.values.CODELIST_DEFAULT(ncodelist.json)；cache_dir默认为default_cache_dir()
+    预编译文件不存在或源的sha256改变时重新编译
+    抛出IOError异常
+    '''
+    if path is None:
+        path = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))),'ncodelist.json')
+
+    if cache_dir is None:
+        cache_dir = default_cache_dir()
+
+    key: Tuple[str,str] = (os.path.abspath(path),os.path.abspath(cache_dir))
+
+    with _lock:
+        codelist: Optional[CompiledCodeList] = _loaded.get(key)
+        if codelist is None:
+            codelist = _open(path,cache_dir)
+            _loaded[key] = codelist
+
+    return codelist
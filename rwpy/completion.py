@@ -0,0 +1,244 @@
+'''
+代码补全：按段落前缀查找代码表中的代码，可选模糊匹配
+'''
+import os
+import re
+from bisect import bisect_left
+from typing import Dict,Iterable,List,NamedTuple,Optional,Pattern,Tuple
+
+from rwpy.codelist import Validator,_key_pattern
+from rwpy.compiled import CompiledCodeList,Entry,load as load_compiled
+from rwpy.util import check
+
+
+LIMIT_DEFAULT: int = 50
+
+_ROOT: str = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+class CompletionItem(NamedTuple):
+    '''补全项：代码、值类型和名称(codelist.json中的中文名称，未知时为空字符串)'''
+    key: str
+    value_type: str
+    name: str
+
+
+def _display_key(key: str) -> str:
+    '''ncodelist.json中已经写成正则的代码还原为代码表的写法(\\d+写作#)'''
+    return key.replace('\\d+','#')
+
+
+def _mask(text: str) -> int:
+    '''文本中出现的字符集合的位图，只用于排除不可能匹配的代码'''
+    mask: int = 0
+    for c in text:
+        mask |= 1 << (ord(c) & 63)
+    return mask
+
+
+def _fuzzy(query: str,key: str,lowered: str) -> int:
+    '''
+    query(小写)按顺序出现在key中时返回得分，否则返回-1
+    开头、单词边界(_之后或小写后的大写字母)和连续的匹配得分更高
+    '''
+    score: int = 0
+    pos: int = 0
+    last: int = -2
+
+    for c in query:
+        pos = lowered.find(c,pos)
+        if pos < 0:
+            return -1
+        score += 1
+        if pos == 0:
+            score += 8
+        elif pos == last + 1:
+            score += 5
+        elif key[pos - 1] == '_' or (key[pos].isupper() and key[pos - 1].islower()):
+            score += 4
+        last = pos
+        pos += 1
+
+    return score - (len(key) - len(query)) // 8
+
+
+class _Group(object):
+    '''一个代码表段落下的代码，按小写代码排序'''
+    __slots__ = ('items','lowered','masks','last','entries','patterns')
+
+    def __init__(self,items: List[CompletionItem],entries: Dict[str,Entry]):
+        items.sort(key=lambda item: (item.key.lower(),item.key))
+        self.items: List[CompletionItem] = items
+        self.lowered: List[str] = [item.key.lower() for item in items]
+        self.masks: List[int] = [_mask(key) for key in self.lowered]
+        # 上一次模糊查询及其候选，输入时每次只多一个字符，可以在上一次的结果中继续筛选
+        self.last: Tuple[str,List[int]] = ('',list(range(0,len(items))))
+        # 小写代码到codelist.json中的记录，用于显示说明
+        self.entries: Dict[str,Entry] = entries
+        # 含有#、{LANG}等的代码按Validator相同的规则匹配实际的代码(如builtFrom_1_name)
+        self.patterns: List[Tuple[Pattern,int]] = []
+        for i,item in enumerate(items):
+            pattern: str = _key_pattern(item.key)
+            if pattern != item.key:
+                try:
+                    self.patterns.append((re.compile(pattern,re.IGNORECASE),i))
+                except re.error:
+                    pass
+
+
+    def find(self,key: str) -> int:
+        '''与实际的代码key对应的补全项的位置，不存在时返回-1'''
+        lowered: str = key.lower()
+        i: int = bisect_left(self.lowered,lowered)
+
+        if i < len(self.items) and self.lowered[i] == lowered:
+            return i
+
+        for pattern,i in self.patterns:
+            if pattern.fullmatch(key):
+                return i
+
+        return -1
+
+
+    def prefix(self,prefix: str,limit: int) -> List[CompletionItem]:
+        lowered: str = prefix.lower()
+        start: int = bisect_left(self.lowered,lowered)
+        result: List[CompletionItem] = []
+
+        for i in range(start,len(self.items)):
+            if len(result) >= limit or not self.lowered[i].startswith(lowered):
+                break
+            result.append(self.items[i])
+
+        return result
+
+
+    def fuzzy(self,query: str,limit: int) -> List[CompletionItem]:
+        lowered: str = query.lower()
+        previous,candidates = self.last
+
+        if not lowered.startswith(previous):
+            candidates = range(0,len(self.items))
+
+        mask: int = _mask(lowered)
+        scored: List[Tuple[int,int]] = []
+
+        for i in candidates:
+            if self.masks[i] & mask == mask:
+                score: int = _fuzzy(lowered,self.items[i].key,self.lowered[i])
+                if score >= 0:
+                    scored.append((score,i))
+
+        self.last = (lowered,[i for score,i in scored])
+        scored.sort(key=lambda x: (-x[0],len(self.lowered[x[1]]),x[1]))
+        return [self.items[i] for score,i in scored[0:limit]]
+
+
+class CompletionIndex(object):
+    '''
+    代码补全索引，每个代码表段落(如projectile_.+)一个按代码排序的数组
+    段落名(如projectile_1)由Validator按代码表的段落模式对应到代码表段落，结果缓存
+    前缀查找为二分查找；模糊查找按字符位图排除后逐个打分，连续输入时只在上一次的候选中筛选
+    '''
+    def __init__(self,types: Iterable[Entry],names: Iterable[Entry] = ()):
+        '''
+        types为ncodelist.json格式代码表的记录(决定段落和值类型)，names为codelist.json的记录(提供名称)
+        两者的段落按段落对应：codelist.json的段落名(如projectile_NAME、leg_#)由Validator对应到types的段落，
+        不是段落的名称(如Spawn units line)按名称对应；段落中的代码按代码名对应
+        '''
+        sections: Dict[str,List[Entry]] = {}
+        for entry in types:
+            sections.setdefault(entry.section,[]).append(entry)
+
+        self.__validator: Validator = Validator({'sections': [{'name': name,'attributes': [{'key': entry.key,
+        'value_type': entry.value_type} for entry in entries]} for name,entries in sections.items()]})
+        self.__groups: Dict[str,_Group] = {}
+
+        named: Dict[str,Dict[str,Entry]] = {}
+        paired: Dict[str,Optional[str]] = {}
+        for entry in names:
+            if not entry.section in paired:
+                paired[entry.section] = self.__pair(entry.section,sections)
+            if paired[entry.section] is not None:
+                named.setdefault(paired[entry.section],{}).setdefault(_display_key(entry.key),entry)
+
+        for section,entries in sections.items():
+            found: Dict[str,Entry] = named.get(section,{})
+            items: Dict[str,CompletionItem] = {}
+            for entry in entries:
+                key: str = _display_key(entry.key)
+                other: Optional[Entry] = found.get(key)
+                items.setdefault(key,CompletionItem(other.key if other is not None else key,entry.value_type,
+                other.name if other is not None else ''))
+            self.__groups[section] = _Group(list(items.values()),dict((key.lower(),entry)
+            for key,entry in found.items()))
+
+
+    def __pair(self,name: str,sections: Dict[str,List[Entry]]) -> Optional[str]:
+        '''codelist.json的段落名对应的types段落：同名的段落直接对应，否则#换成数字后由Validator匹配(projectile_NAME可以直接匹配projectile_.+)，不存在时返回None'''
+        if name in sections:
+            return name
+        sample: str = name.strip().split(']',1)[0].replace('#','1')
+        return self.__validator.section_of(sample)
+
+
+    @classmethod
+    def load(cls: type,types_file: Optional[str] = None,names_file: Optional[str] = None,
+    cache_dir: Optional[str] = None) -> 'CompletionIndex':
+        '''
+        由预编译的代码表(参见rwpy.compiled.load)建立索引
+        types_file默认为ncodelist.json，names_file默认为codelist.json
+        抛出IOError异常
+        '''
+        types: CompiledCodeList = load_compiled(types_file,cache_dir)
+        names: CompiledCodeList = load_compiled(os.path.join(_ROOT,'codelist.json') if names_file is None
+        else names_file,cache_dir)
+        return cls(types.entries(),names.entries())
+
+
+    @property
+    def validator(self) -> Validator:
+        '''由同一代码表建立的校验器'''
+        return self.__validator
+
+
+    def __group(self,sec_name: str) -> Optional[_Group]:
+        section: Optional[str] = self.__validator.section_of(sec_name)
+        return None if section is None else self.__groups.get(section)
+
+
+    def complete(self,sec_name: str,prefix: str = '',limit: int = LIMIT_DEFAULT,
+    fuzzy: bool = False) -> List[CompletionItem]:
+        '''
+        段落sec_name下以prefix开头(不区分大小写)的代码，按代码排序，最多limit个；未知段落返回空列表
+        fuzzy为True时返回按顺序含有prefix中全部字符的代码，按得分从高到低排序
+        '''
+        check(sec_name,str)
+        check(prefix,str)
+        group: Optional[_Group] = self.__group(sec_name)
+
+        if group is None:
+            return []
+
+        if fuzzy and prefix != '':
+            return group.fuzzy(prefix,limit)
+
+        return group.prefix(prefix,limit)
+
+
+    def lookup(self,sec_name: str,key: str) -> Optional[CompletionItem]:
+        '''段落sec_name下实际的代码key(不区分大小写，可以是builtFrom_1_name等)对应的补全项，不存在时返回None'''
+        group: Optional[_Group] = self.__group(sec_name)
+
+        if group is None:
+            return None
+
+        i: int = group.find(key)
+        return None if i < 0 else group.items[i]
+
+
+    def describe(self,sec_name: str,key: str) -> Optional[Entry]:
+        '''段落sec_name下代码key(参见lookup)在codelist.json中的记录(含说明)，不存在时返回None'''
+        item: Optional[CompletionItem] = self.lookup(sec_name,key)
+        return None if item is None else self.__group(sec_name).entries.get(item.key.lower())
@@ -0,0 +1,192 @@
+'''
+比较两个版本的mod，按内容哈希跳过相同的文件和段落
+'''
+import os
+from concurrent.futures import ThreadPoolExecutor
+from hashlib import blake2b
+from typing import Dict,Iterator,List,NamedTuple,Optional,Tuple
+
+from rwpy.code import IIni,Element,Section,Attribute,HASH_SIZE
+from rwpy.mod import IMod,ArchiveMod,not_ini_list
+from rwpy.util import check
+
+
+# 变化的种类，rwpy.watch也使用
+ADDED: str = 'added'
+CHANGED: str = 'changed'
+REMOVED: str = 'removed'
+
+
+class Difference(NamedTuple):
+    '''
+    一处差异，kind为ADDED、CHANGED或REMOVED
+    section和key都为None时表示整个文件(非ini文件只比较内容)，key为None时表示整个段落
+    第一个段落之前的属性的section为空字符串
+    old、new为两个版本中的值，old_line、new_line为对应的行号，不存在的一方为None和-1
+    '''
+    kind: str
+    file: str
+    section: Optional[str]
+    key: Optional[str]
+    old: Optional[str]
+    new: Optional[str]
+    old_line: int
+    new_line: int
+
+
+def _digest(mod: IMod,relpath: str) -> bytes:
+    if isinstance(mod,ArchiveMod):
+        data = mod.read(relpath)
+    else:
+        with open(os.path.join(mod.dir,relpath),'rb') as f:
+            data = f.read()
+    return blake2b(data,digest_size=HASH_SIZE).digest()
+
+
+def hash_files(mod: IMod,dir: Optional[str] = None,workers: Optional[int] = None) -> Dict[str,bytes]:
+    '''
+    以workers个线程计算mod某一文件夹下全部文件原始字节的哈希，返回相对路径到哈希的映射
+    抛出IOError异常
+    '''
+    check(mod,IMod)
+    workers = (os.cpu_count() or 1) if workers is None else max(workers,1)
+    relpaths: List[str] = [os.path.relpath(path,mod.dir) for path in mod.getfiles(dir)]
+
+    if workers == 1:
+        return dict((relpath,_digest(mod,relpath)) for relpath in relpaths)
+
+    with ThreadPoolExecutor(workers) as pool:
+        return dict(zip(relpaths,pool.map(lambda relpath: _digest(mod,relpath),relpaths)))
+
+
+def _sections(ini: IIni) -> Dict[Tuple[str,int],Section]:
+    '''(段落名,同名段落中的序号)到段落的映射'''
+    counts: Dict[str,int] = {}
+    sections: Dict[Tuple[str,int],Section] = {}
+
+    for sec in ini.sections:
+        n: int = counts.get(sec.name,0)
+        counts[sec.name] = n + 1
+        sections[(sec.name,n)] = sec
+
+    return sections
+
+
+def _attrs(elements: List[Element]) -> Dict[Tuple[str,int],Attribute]:
+    '''(键,同名属性中的序号)到属性的映射，与_sections相同，同名的属性按出现顺序对应'''
+    counts: Dict[str,int] = {}
+    attrs: Dict[Tuple[str,int],Attribute] = {}
+
+    for ele in elements:
+        if isinstance(ele,Attribute):
+            n: int = counts.get(ele.key,0)
+            counts[ele.key] = n + 1
+            attrs[(ele.key,n)] = ele
+
+    return attrs
+
+
+def _diff_attrs(file: str,name: str,old: List[Element],new: List[Element]) -> Iterator[Difference]:
+    old_attrs: Dict[Tuple[str,int],Attribute] = _attrs(old)
+    new_attrs: Dict[Tuple[str,int],Attribute] = _attrs(new)
+
+    for pair,attr in old_attrs.items():
+        other: Optional[Attribute] = new_attrs.get(pair)
+
+        if other is None:
+            yield Difference(REMOVED,file,name,attr.key,attr.value,None,attr.linenum,-1)
+        elif other.content_hash != attr.content_hash:
+            yield Difference(CHANGED,file,name,attr.key,attr.value,other.value,attr.linenum,other.linenum)
+
+    for pair,attr in new_attrs.items():
+        if not pair in old_attrs:
+            yield Difference(ADDED,file,name,attr.key,None,attr.value,-1,attr.linenum)
+
+
+def diff_sections(file: str,old: Section,new: Section) -> Iterator[Difference]:
+    '''比较同一文件中对应的两个段落，内容哈希相同时直接跳过'''
+    if old.content_hash == new.content_hash:
+        return
+
+    yield from _diff_attrs(file,old.name,old.elements,new.elements)
+
+
+def diff_inis(file: str,old: IIni,new: IIni) -> Iterator[Difference]:
+    '''
+    比较同一文件的两个版本，同名段落按出现顺序对应，第一个段落之前的属性作为名为空字符串的段落比较
+    内容哈希不同但没有属性或段落的差异(如只修改了注释)时报告整个文件修改
+    '''
+    if old.content_hash == new.content_hash:
+        return
+
+    found: bool = False
+
+    for difference in _diff_ini_parts(file,old,new):
+        found = True
+        yield difference
+
+    if not found:
+        yield Difference(CHANGED,file,None,None,None,None,-1,-1)
+
+
+def _diff_ini_parts(file: str,old: IIni,new: IIni) -> Iterator[Difference]:
+    yield from _diff_attrs(file,'',old.elements,new.elements)
+
+    old_sections: Dict[Tuple[str,int],Section] = _sections(old)
+    new_sections: Dict[Tuple[str,int],Section] = _sections(new)
+
+    for key,sec in old_sections.items():
+        other: Optional[Section] = new_sections.get(key)
+
+        if other is None:
+            yield Difference(REMOVED,file,sec.name,None,None,None,sec.linenum,-1)
+        else:
+            yield from diff_sections(file,sec,other)
+
+    for key,sec in new_sections.items():
+        if not key in old_sections:
+            yield Difference(ADDED,file,sec.name,None,None,None,-1,sec.linenum)
+
+
+def diff(mod_a: IMod,mod_b: IMod,dir: Optional[str] = None,workers: Optional[int] = None) -> List[Difference]:
+    '''
+    比较两个版本的mod(可以是文件夹或压缩包)某一文件夹下的全部文件
+    先以workers个线程计算两边全部文件的哈希，只解析内容不同的ini，
+    再跳过哈希相同的段落和属性，只报告新增、删除、修改的文件、段落和代码
+    结果按文件排列，同一文件中按段落和代码在文件中的顺序
+    抛出IOError和IniSyntaxError异常
+    '''
+    check(mod_a,IMod)
+    check(mod_b,IMod)
+    old: Dict[str,bytes] = hash_files(mod_a,dir,workers)
+    new: Dict[str,bytes] = hash_files(mod_b,dir,workers)
+    result: List[Difference] = []
+
+    for file in sorted(set(old) | set(new)):
+
+        if not file in new:
+            result.append(Difference(REMOVED,file,None,None,None,None,-1,-1))
+            continue
+
+        if not file in old:
+            result.append(Difference(ADDED,file,None,None,None,None,-1,-1))
+            continue
+
+        if old[file] == new[file]:
+            continue
+
+        if os.path.splitext(file)[1].lower() in not_ini_list:
+            result.append(Difference(CHANGED,file,None,None,None,None,-1,-1))
+            continue
+
+        old_ini: Optional[IIni] = mod_a.getini(file)
+        new_ini: Optional[IIni] = mod_b.getini(file)
+
+        if old_ini is None or new_ini is None:
+            # 无法按UTF-8解码，只能比较内容
+            result.append(Difference(CHANGED,file,None,None,None,None,-1,-1))
+            continue
+
+        result.extend(diff_inis(file,old_ini,new_ini))
+
+    return result
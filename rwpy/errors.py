@@ -41,4 +41,17 @@ class SectionNotExistedError(RWPYError):
     '''Section不存在错误'''
     def __init__(self,message: str):
         self.__message = message
-        RWPYError.__init__(self,message)
\ No newline at end of file
+        RWPYError.__init__(self,message)
+
+class CopyFromError(RWPYError):
+    '''copyFrom引用的文件不存在或存在循环引用错误'''
+    def __init__(self,message: str):
+        self.__message = message
+        RWPYError.__init__(self,message)
+
+
+class TransactionClosedError(RWPYError):
+    '''事务已回滚错误'''
+    def __init__(self,message: str):
+        self.__message = message
+        RWPYError.__init__(self,message)
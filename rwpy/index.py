@@ -0,0 +1,353 @@
+'''
+mod范围的倒排索引与查询
+'''
+import bisect
+import os
+import re
+from fnmatch import fnmatchcase
+from typing import Dict,List,NamedTuple,NoReturn,Optional,Set,Tuple,Union
+
+from rwpy.code import IIni,Attribute
+from rwpy.mod import IMod,not_ini_list
+from rwpy.util import check
+
+
+_NUMBER = re.compile(r'[+-]?(?:\d+\.?\d*|\.\d+)(?:[eE][+-]?\d+)?')
+_CONDITION = re.compile(r'\s*([^\s.]+)\.([^\s<>=!~]+)\s*(?:(<=|>=|==|!=|<|>|~)\s*(.*?))?\s*')
+_AND = re.compile(r'\s+and\s+')
+
+OPERATORS: Tuple[str,...] = ('<','<=','>','>=','==','!=','~')
+
+
+class Hit(NamedTuple):
+    '''索引中的一个属性，file为相对于mod根目录的路径'''
+    file: str
+    section: str
+    linenum: int
+    key: str
+    value: str
+
+
+def to_number(value: str) -> Optional[float]:
+    '''值为数字时返回对应的float，否则返回None'''
+    value = value.strip()
+    if _NUMBER.fullmatch(value) is None:
+        return None
+    return float(value)
+
+
+class _Column(object):
+    '''
+    一个(段落,代码)下的全部属性，按文件分组；数字值另按(值,文件,行号)排序
+    增删一个文件时只插入或删除该文件的属性，与列的大小无关(除列表插入的内存移动外)
+    '''
+    __slots__ = ('files','count','numbers','order','__hits')
+
+    def __init__(self):
+        self.files: Dict[str,List[Hit]] = {}
+        self.count: int = 0
+        self.numbers: List[float] = []
+        self.order: List[Hit] = []
+        self.__hits: Optional[List[Hit]] = None
+
+
+    @property
+    def hits(self) -> List[Hit]:
+        '''全部属性，增删文件后第一次访问时重新连接'''
+        if self.__hits is None:
+            self.__hits = [hit for hits in self.files.values() for hit in hits]
+        return self.__hits
+
+
+    def __position(self,number: float,hit: Hit,right: bool) -> int:
+        '''hit在数字列中的位置：值相同的属性按(文件,行号)排列，right为True时在相同的属性之后'''
+        lo: int = bisect.bisect_left(self.numbers,number)
+        hi: int = bisect.bisect_right(self.numbers,number,lo)
+        key: Tuple[str,int] = (hit.file,hit.linenum)
+
+        while lo < hi:
+            mid: int = (lo + hi) // 2
+            other: Hit = self.order[mid]
+            if (other.file,other.linenum) < key or (right and (other.file,other.linenum) == key):
+                lo = mid + 1
+            else:
+                hi = mid
+
+        return lo
+
+
+    def add(self,relpath: str,hits: List[Hit]) -> NoReturn:
+        self.files[relpath] = hits
+        self.count += len(hits)
+        self.__hits = None
+
+        for hit in hits:
+            number: Optional[float] = to_number(hit.value)
+            if number is not None:
+                i: int = self.__position(number,hit,True)
+                self.numbers.insert(i,number)
+                self.order.insert(i,hit)
+
+
+    def remove(self,relpath: str) -> NoReturn:
+        hits: List[Hit] = self.files.pop(relpath)
+        self.count -= len(hits)
+        self.__hits = None
+
+        for hit in hits:
+            number: Optional[float] = to_number(hit.value)
+            if number is not None:
+                i: int = self.__position(number,hit,False)
+                while self.order[i] is not hit:
+                    i += 1
+                del self.numbers[i]
+                del self.order[i]
+
+
+    def range(self,op: str,target: float) -> List[Hit]:
+        '''以二分查找取出数字列中满足比较的属性'''
+        numbers: List[float] = self.numbers
+        lo: int = bisect.bisect_left(numbers,target)
+        hi: int = bisect.bisect_right(numbers,target)
+        if op == '<':
+            return self.order[:lo]
+        if op == '<=':
+            return self.order[:hi]
+        if op == '>':
+            return self.order[hi:]
+        if op == '>=':
+            return self.order[lo:]
+        if op == '==':
+            return self.order[lo:hi]
+        return self.order[:lo] + self.order[hi:]
+
+
+class ModIndex(object):
+    '''
+    mod中全部ini的倒排索引，(段落名,代码) -> 属性所在的文件、段落、行号和值
+    查询只使用内存中的索引；文件变化后用update、remove或refresh增量更新
+    '''
+    def __init__(self,mod: IMod,dir: Optional[str] = None,workers: Optional[int] = None):
+        '''
+        索引mod下某一文件夹下全部ini，workers含义同Mod.iter_inis
+        抛出IniSyntaxError
+        '''
+        check(mod,IMod)
+        self.__mod: IMod = mod
+        self.__dir: Optional[str] = dir
+        self.__columns: Dict[Tuple[str,str],_Column] = {}
+        self.__files: Dict[str,Tuple[int,Set[Tuple[str,str]]]] = {}
+        self.__sections: Dict[str,Set[str]] = {}
+        self.__matched: Dict[str,List[str]] = {}
+
+        for ini in mod.iter_inis(dir,workers):
+            self.__add(os.path.relpath(ini.filename,mod.dir),ini)
+
+
+    @property
+    def mod(self) -> IMod:
+        return self.__mod
+
+
+    @property
+    def files(self) -> List[str]:
+        '''已索引的文件'''
+        return list(self.__files)
+
+
+    def __len__(self) -> int:
+        return sum(column.count for column in self.__columns.values())
+
+
+    def __mtime(self,relpath: str) -> int:
+        try:
+            return os.stat(os.path.join(self.__mod.dir,relpath)).st_mtime_ns
+        except OSError:
+            return -1
+
+
+    def __add(self,relpath: str,ini: IIni) -> NoReturn:
+        grouped: Dict[Tuple[str,str],List[Hit]] = {}
+
+        for sec in ini.sections:
+            name: str = sec.name
+
+            for ele in sec.elements:
+                if isinstance(ele,Attribute):
+                    grouped.setdefault((name,ele.key),[]).append(Hit(relpath,name,ele.linenum,ele.key,ele.value))
+
+        for pair,hits in grouped.items():
+            column: Optional[_Column] = self.__columns.get(pair)
+
+            if column is None:
+                column = self.__columns[pair] = _Column()
+                name,key = pair
+                if not name in self.__sections:
+                    self.__matched = {}
+                self.__sections.setdefault(name,set()).add(key)
+
+            column.add(relpath,hits)
+
+        self.__files[relpath] = (self.__mtime(relpath),set(grouped))
+
+
+    def __drop(self,relpath: str) -> NoReturn:
+        if not relpath in self.__files:
+            return
+
+        for pair in self.__files.pop(relpath)[1]:
+            column: _Column = self.__columns[pair]
+            column.remove(relpath)
+
+            if column.count == 0:
+                del self.__columns[pair]
+                name,key = pair
+                self.__sections[name].discard(key)
+                if len(self.__sections[name]) == 0:
+                    del self.__sections[name]
+                    self.__matched = {}
+
+
+    def update(self,path: str) -> NoReturn:
+        '''
+        重新索引单个文件，文件已不存在时从索引中删除
+        抛出IniSyntaxError
+        '''
+        check(path,str)
+        relpath: Optional[str] = self.__mod.getfile(path)
+        self.__drop(os.path.normpath(path) if relpath is None else relpath)
+
+        if relpath is not None:
+            ini: Optional[IIni] = self.__mod.getini(relpath)
+            if ini is not None:
+                self.__add(relpath,ini)
+
+
+    def remove(self,path: str) -> NoReturn:
+        '''从索引中删除单个文件'''
+        check(path,str)
+        self.__drop(os.path.normpath(path))
+
+
+    def apply(self,changes: list) -> NoReturn:
+        '''按rwpy.watch.Watcher报告的变化更新索引，使用其中已解析的ini，可以直接作为订阅者'''
+        for change in changes:
+            self.__drop(change.path)
+            if change.ini is not None and self.__inside(change.path):
+                self.__add(change.path,change.ini)
+
+
+    def __inside(self,relpath: str) -> bool:
+        if self.__dir is None:
+            return True
+        prefix: str = os.path.normpath(self.__dir)
+        return prefix == '.' or relpath.startswith(prefix + os.sep)
+
+
+    def refresh(self) -> List[str]:
+        '''
+        按修改时间重新索引变化、新增的文件并删除已不存在的文件，返回变化的文件
+        抛出IniSyntaxError
+        '''
+        root: str = self.__mod.dir
+        current: Set[str] = set(os.path.relpath(path,root) for path in self.__mod.getfiles(self.__dir)
+        if not os.path.splitext(path)[1].lower() in not_ini_list)
+        changed: List[str] = [relpath for relpath in self.__files if not relpath in current]
+
+        for relpath in changed:
+            self.__drop(relpath)
+
+        for relpath in sorted(current):
+            entry = self.__files.get(relpath)
+            if entry is None or entry[0] != self.__mtime(relpath):
+                self.update(relpath)
+                changed.append(relpath)
+
+        return changed
+
+
+    def sections(self,pattern: str = '*') -> List[str]:
+        '''匹配通配符模式(如action_*)的段落名'''
+        check(pattern,str)
+        names: Optional[List[str]] = self.__matched.get(pattern)
+
+        if names is None:
+            names = sorted(name for name in self.__sections if fnmatchcase(name,pattern))
+            self.__matched[pattern] = names
+
+        return names
+
+
+    def keys(self,section: str = '*') -> List[str]:
+        '''匹配的段落下出现过的代码'''
+        keys: Set[str] = set()
+        for name in self.sections(section):
+            keys.update(self.__sections[name])
+        return sorted(keys)
+
+
+    def select(self,section: str,key: str,op: Optional[str] = None,value: Union[str,int,float,None] = None) -> List[Hit]:
+        '''
+        查询属性，section可以是通配符模式
+        op为None时返回全部；value为数字时按数字比较，只返回值为数字的属性；
+        value为字符串时==和!=比较去掉首尾空白的值，~按正则表达式搜索
+        结果按文件和行号排列
+        '''
+        check(section,str)
+        check(key,str)
+
+        if op is not None and not op in OPERATORS:
+            raise ValueError('未知的运算符 -> ' + op)
+
+        hits: List[Hit] = []
+        pattern = re.compile(str(value)) if op == '~' else None
+
+        for name in self.sections(section):
+            column: Optional[_Column] = self.__columns.get((name,key))
+
+            if column is None:
+                continue
+
+            if op is None:
+                hits.extend(column.hits)
+            elif pattern is not None:
+                hits.extend(hit for hit in column.hits if pattern.search(hit.value))
+            elif isinstance(value,(int,float)):
+                hits.extend(column.range(op,float(value)))
+            elif op in ('==','!='):
+                hits.extend(hit for hit in column.hits if (hit.value.strip() == value) == (op == '=='))
+            else:
+                raise ValueError('只能按数字比较大小 -> ' + op)
+
+        hits.sort(key=lambda x: (x.file,x.linenum))
+        return hits
+
+
+    def query(self,expr: str) -> List[str]:
+        '''
+        按过滤表达式查询，返回满足全部条件的文件
+        表达式为以and连接的条件，条件为 段落.代码 或 段落.代码 运算符 值，例如
+        attack.maxAttackRange > 400 and core.name ~ ^tank
+        值可以用引号括起，否则能解析为数字时按数字比较
+        '''
+        check(expr,str)
+        result: Optional[Set[str]] = None
+
+        for cond in _AND.split(expr.strip()):
+            match = _CONDITION.fullmatch(cond)
+
+            if match is None:
+                raise ValueError('无法解析的条件 -> ' + cond)
+
+            section,key,op,value = match.groups()
+
+            if op is not None:
+                if len(value) >= 2 and value[0] == value[-1] and value[0] in '\'"':
+                    value = value[1:-1]
+                elif op != '~' and to_number(value) is not None:
+                    value = to_number(value)
+
+            files: Set[str] = set(hit.file for hit in self.select(section,key,op,value))
+            result = files if result is None else result & files
+
+        return sorted(result)
@@ -0,0 +1,445 @@
+'''
+惰性ini，只在访问时构建段落
+'''
+import mmap
+import os
+import re
+from typing import List,Optional,Union,NoReturn,Iterator,TextIO
+
+from rwpy.code import IIni,Ini,Section,Element
+from rwpy.parser import tokenize
+from rwpy.errors import IniSyntaxError, SectionNotExistedError
+from rwpy.util import check
+
+
+Buffer = Union[bytes,mmap.mmap,memoryview]
+
+_CANDIDATE = re.compile(rb'\[|"""')
+_LONE_CR = re.compile(rb'\r(?!\n)')
+_NEWLINE = re.compile(rb'\n')
+_BACK_STEP: int = 256
+
+
+def _count_newlines(buf: Buffer,start: int,end: int) -> int:
+    if isinstance(buf,bytes):
+        return buf.count(b'\n',start,end)
+    return bytes(buf[start:end]).count(b'\n')
+
+
+def _line_start(buf: Buffer,end: int) -> int:
+    '''end所在行的开头'''
+    return buf.rfind(b'\n',0,end) + 1
+
+
+def _line_end(buf: Buffer,start: int) -> int:
+    end = buf.find(b'\n',start)
+    return len(buf) if end == -1 else end
+
+
+def _decode_line(buf: Buffer,start: int,end: int) -> str:
+    line = buf[start:end].decode('utf-8')
+    return line[:-1] if line.endswith('\r') else line
+
+
+def _view_line_start(buf: memoryview,end: int) -> int:
+    '''memoryview没有rfind，向前逐块查找换行，每次只复制_BACK_STEP字节'''
+    while end > 0:
+        start: int = max(end - _BACK_STEP,0)
+        found: int = bytes(buf[start:end]).rfind(b'\n')
+        if found != -1:
+            return start + found + 1
+        end = start
+    return 0
+
+
+def _view_line_end(buf: memoryview,start: int) -> int:
+    match = _NEWLINE.search(buf,start)
+    return len(buf) if match is None else match.start()
+
+
+def _view_decode_line(buf: memoryview,start: int,end: int) -> str:
+    line = str(buf[start:end],'utf-8')
+    return line[:-1] if line.endswith('\r') else line
+
+
+def _decode(buf: Buffer,start: int,end: int) -> str:
+    if isinstance(buf,memoryview):
+        return str(buf[start:end],'utf-8')
+    return buf[start:end].decode('utf-8')
+
+
+class _Span(object):
+    '''段落在缓冲区中的位置，section为已构建的段落'''
+    __slots__ = ('name','linenum','start','end','section')
+
+    def __init__(self,name: str,linenum: int,start: int,end: int,section: Optional[Section] = None):
+        self.name: str = name
+        self.linenum: int = linenum
+        self.start: int = start
+        self.end: int = end
+        self.section: Optional[Section] = section
+
+
+    @property
+    def current_name(self) -> str:
+        return self.name if self.section is None else self.section.name
+
+
+class LazyIni(IIni):
+    '''
+    惰性代码文件，以字节偏移索引各段落，只在访问时构建段落
+    缓冲区可以是bytes、mmap或memoryview(如压缩包中未压缩成员在mmap上的数据)，不复制，内容按UTF-8解码
+    访问sections、__str__、write、merge时会构建全部段落，此后等同于Ini
+    '''
+    def __init__(self,filename: str = 'untitled.ini',buffer: Buffer = b''):
+        '''抛出IniSyntaxError'''
+        check(filename,str)
+        self.__filename: str = filename
+        self.__buffer: Optional[Buffer] = buffer
+        self.__head: Optional[_Span] = None
+        self.__elements: Optional[List[Element]] = None
+        self.__spans: List[_Span] = []
+        self.__ini: Optional[Ini] = None
+
+        if len(buffer) == 0:
+            self.__ini = Ini()
+
+        elif (isinstance(buffer,memoryview) or buffer.find(b'\r') != -1) and _LONE_CR.search(buffer) is not None:
+            text = _decode(buffer,0,len(buffer)).replace('\r\n','\n').replace('\r','\n')
+            self.__ini = Ini.create_ini(text,filename)
+            self.__release()
+
+        else:
+            self.__index(buffer)
+
+            if len(self.__spans) == 0 and self.__slice(self.__head).isspace():
+                self.__ini = Ini()
+                self.__release()
+
+
+    def __index(self,buf: Buffer) -> NoReturn:
+        '''扫描段落边界，只解码含有[或\"\"\"的行'''
+        size: int = len(buf)
+        pos: int = 0
+        counted: int = 0
+        linenum: int = 1
+        headers: List[tuple] = []
+        line_start,line_end,decode_line = (_view_line_start,_view_line_end,_view_decode_line) \
+        if isinstance(buf,memoryview) else (_line_start,_line_end,_decode_line)
+
+        while True:
+            match = _CANDIDATE.search(buf,pos)
+
+            if match is None:
+                break
+
+            start: int = line_start(buf,match.start())
+            end: int = line_end(buf,match.start())
+            linenum += _count_newlines(buf,counted,start)
+            counted = start
+            line: str = decode_line(buf,start,end)
+            stripped: str = line.strip()
+            pos = end + 1
+
+            if stripped.startswith('#'):
+                continue
+
+            if stripped.startswith('[') and stripped.find(']',2) != -1:
+                headers.append((stripped[1:-1],linenum,start))
+                continue
+
+            if line.find(':',1,len(line) - 1) == -1:
+                continue
+
+            value: str = line.split(':',1)[1]
+
+            if not value.lstrip().startswith('\"\"\"'):
+                continue
+
+            closed: bool = value.rstrip().endswith('\"\"\"')
+
+            while True:
+
+                if pos > size:
+                    linenum += _count_newlines(buf,counted,size)
+                    raise IniSyntaxError('行号:{0}|意外终止的多行文本'.format(linenum))
+
+                end = line_end(buf,pos)
+                tail: str = decode_line(buf,pos,end).rstrip()
+                pos = end + 1
+
+                if tail:
+                    closed = tail.endswith('\"\"\"')
+
+                if closed:
+                    break
+
+        bounds: List[int] = [start for name,linenum,start in headers] + [size + 1]
+        self.__head = _Span('',0,0,bounds[0] - 1)
+
+        for i in range(0,len(headers)):
+            name,linenum,start = headers[i]
+            self.__spans.append(_Span(name,linenum,start,bounds[i + 1] - 1))
+
+
+    def __slice(self,span: _Span) -> str:
+        end: int = span.end
+        if end > span.start and self.__buffer[end - 1:end] == b'\r':
+            end -= 1
+        return _decode(self.__buffer,span.start,end).replace('\r\n','\n')
+
+
+    def __release(self) -> NoReturn:
+        if isinstance(self.__buffer,mmap.mmap):
+            try:
+                self.__buffer.close()
+            except BufferError:
+                # section_source返回的memoryview仍在使用，交由垃圾回收关闭
+                pass
+        self.__buffer = None
+
+
+    def __build(self,span: _Span) -> Section:
+        '''构建一个段落'''
+        if span.section is None:
+            lines: List[str] = self.__slice(span).split('\n')
+            span.section = Ini.from_tokens(tokenize(lines,span.linenum - 1)).sections[0]
+        return span.section
+
+
+    def __materialize(self) -> Ini:
+        '''构建全部内容，此后所有操作委托给返回的Ini'''
+        if self.__ini is None:
+            ini: Ini = Ini(self.__filename)
+            ini.elements = self.elements
+            ini.sections = [self.__build(span) for span in self.__spans]
+            self.__ini = ini
+            self.__spans = []
+            self.__release()
+        return self.__ini
+
+
+    @property
+    def materialized(self) -> bool:
+        '''是否已构建全部内容'''
+        return self.__ini is not None
+
+
+    def section_source(self,name: str) -> Optional[memoryview]:
+        '''
+        获取第一个指定名称段落(含段落头)在源中的原始字节，不复制缓冲区
+        段落不来自缓冲区时返回None
+        '''
+        for span in self.__spans:
+            if span.current_name == name:
+                if span.end < span.start:
+                    return None
+                return memoryview(self.__buffer)[span.start:span.end]
+        return None
+
+
+    def close(self) -> NoReturn:
+        '''构建全部内容并释放缓冲区'''
+        self.__materialize()
+
+
+    def __str__(self) -> str:
+        '''对应的文本'''
+        return str(self.__materialize())
+
+
+    @property
+    def filename(self) -> str:
+        '''代码文件的文件路径'''
+        if self.__ini is not None:
+            return self.__ini.filename
+        return self.__filename
+
+
+    @filename.setter
+    def filename(self,name: str) -> NoReturn:
+        check(name,str)
+        if self.__ini is not None:
+            self.__ini.filename = name
+        self.__filename = name
+
+
+    @property
+    def elements(self) -> List[Element]:
+
+        if self.__ini is not None:
+            return self.__ini.elements
+
+        if self.__elements is None:
+            head: _Span = self.__head
+            if head.end < head.start:
+                self.__elements = []
+            else:
+                lines: List[str] = self.__slice(head).split('\n')
+                self.__elements = Ini.from_tokens(tokenize(lines)).elements
+        return self.__elements
+
+
+    @elements.setter
+    def elements(self,eles: List[Element]) -> NoReturn:
+
+        if self.__ini is not None:
+            self.__ini.elements = eles
+            return
+
+        check(eles,list)
+        if any(map(lambda x: not isinstance(x,Element),eles)):
+            raise TypeError()
+        self.__elements = eles
+
+
+    @property
+    def sections(self) -> List[Section]:
+
+        return self.__materialize().sections
+
+
+    @sections.setter
+    def sections(self,secs: List[Section]) -> NoReturn:
+
+        self.__materialize().sections = secs
+
+
+    def __getattr__(self,attr: Optional[str] = None) -> Optional[Section]:
+        '''获取一个指定名称的段落'''
+        if attr.startswith('_LazyIni__') or attr.startswith('__'):
+            raise AttributeError(attr)
+
+        if self.__ini is not None:
+            return getattr(self.__ini,attr)
+
+        for span in self.__spans:
+            if span.current_name == attr:
+                return self.__build(span)
+
+
+    def get_section(self,name: str) -> Section:
+        '''获取一个指定名称的段落'''
+        if self.__ini is not None:
+            return self.__ini.get_section(name)
+
+        for span in reversed(self.__spans):
+            if span.current_name == name:
+                return self.__build(span)
+
+        sec = Section(name)
+        self.__spans.append(_Span(name,-1,0,-1,sec))
+        return sec
+
+    getsection = get_section
+
+
+    def append(self,obj: Union[Section,Element]) -> NoReturn:
+        '''追加段落或头部元素'''
+        if self.__ini is not None:
+            self.__ini.append(obj)
+
+        elif isinstance(obj,Section):
+            self.__spans.append(_Span(obj.name,obj.linenum,0,-1,obj))
+
+        elif isinstance(obj,Element):
+            self.elements.append(obj)
+
+        else:
+            raise TypeError()
+
+    append_sec = append
+    append_ele = append
+
+
+    def remove(self,name: str) -> bool:
+        '''删除指定名称的段落'''
+        check(name,str)
+
+        if self.__ini is not None:
+            return self.__ini.remove(name)
+
+        for i in range(0,len(self.__spans)):
+            if self.__spans[i].current_name == name:
+                self.__spans.pop(i)
+                return True
+
+        return False
+
+
+    def removeat(self,pos: int) -> bool:
+        '''删除指定位置的头部元素'''
+        check(pos,int)
+
+        if pos >= len(self.elements):
+            raise IndexError()
+
+        self.elements.pop(pos)
+
+
+    def insert_section(self,sec: Section,before: str) -> NoReturn:
+        '''在指定的段落之前插入段落'''
+        check(sec,Section)
+
+        if self.__ini is not None:
+            return self.__ini.insert_section(sec,before)
+
+        for i in range(0,len(self.__spans)):
+            if self.__spans[i].current_name == before:
+                self.__spans.insert(i,_Span(sec.name,sec.linenum,0,-1,sec))
+                return
+
+        raise SectionNotExistedError('段落不存在 -> ' + before)
+
+
+    def iter_chunks(self) -> Iterator[str]:
+        '''逐段产生对应的文本，连接后与str(self)相同'''
+        return self.__materialize().iter_chunks()
+
+
+    def write_to(self,stream: TextIO,minimal: bool = False) -> NoReturn:
+        '''将对应的文本写入流，惰性ini不保留源，minimal不起作用'''
+        self.__materialize().write_to(stream,minimal)
+
+
+    def write(self,minimal: bool = False):
+        '''
+        输出ini内容到文件
+        抛出IOError异常
+        '''
+        self.__materialize().write(minimal)
+
+
+    def merge(self,ini):
+        '''合并指定ini到本ini'''
+        if isinstance(ini,LazyIni):
+            ini = ini.__materialize()
+        self.__materialize().merge(ini)
+
+
+    @classmethod
+    def create_ini(cls: type,text: str,filename: str = 'untitled.ini') -> IIni:
+        '''
+        从字符串创建惰性ini
+        抛出IniSyntaxError
+        '''
+        check(text,str)
+        check(filename,str)
+        return LazyIni(filename,text.encode('utf-8'))
+
+
+    @classmethod
+    def open(cls: type,path: str,filename: Optional[str] = None) -> IIni:
+        '''
+        以mmap打开文件创建惰性ini
+        抛出IOError和IniSyntaxError异常
+        '''
+        check(path,str)
+
+        with open(path,'rb') as f:
+            if os.fstat(f.fileno()).st_size == 0:
+                buffer: Buffer = b''
+            else:
+                buffer = mmap.mmap(f.fileno(),0,access=mmap.ACCESS_READ)
+
+        return LazyIni(path if filename is None else filename,buffer)
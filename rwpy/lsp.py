@@ -0,0 +1,533 @@
+'''
+Rusted Warfare ini的语言服务器(Language Server Protocol)，通过标准输入输出通信
+提供代码表诊断、代码补全、悬停说明和copyFrom跳转
+python -m rwpy.lsp [mod文件夹]
+'''
+import json
+import os
+import re
+import sys
+import threading
+from queue import Queue
+from typing import BinaryIO,Callable,Dict,Iterator,List,NoReturn,Optional,Tuple
+from pathlib import PurePosixPath,PureWindowsPath
+from urllib.parse import unquote,urlparse
+
+from rwpy.code import Ini,Section
+from rwpy.codelist import Problem,Validator
+from rwpy.completion import CompletionIndex,CompletionItem
+from rwpy.errors import IniSyntaxError
+from rwpy.mod import Mod
+from rwpy.resolver import copyfrom_paths
+from rwpy.util import check
+
+
+# LSP常量
+SYNC_INCREMENTAL: int = 2
+SEVERITY_ERROR: int = 1
+SEVERITY_WARNING: int = 2
+KIND_PROPERTY: int = 10
+MESSAGE_ERROR: int = 1
+
+METHOD_NOT_FOUND: int = -32601
+INTERNAL_ERROR: int = -32603
+
+_SYNTAX_LINE = re.compile(r'行号:(\d+)')
+
+
+def read_message(stream: BinaryIO) -> Optional[dict]:
+    '''读取一条以Content-Length头分隔的JSON-RPC消息，输入结束时返回None'''
+    length: int = -1
+
+    while True:
+        line: bytes = stream.readline()
+        if not line:
+            return None
+        line = line.strip()
+        if not line:
+            break
+        name,_,value = line.decode('ascii').partition(':')
+        if name.strip().lower() == 'content-length':
+            length = int(value)
+
+    if length < 0:
+        return None
+
+    return json.loads(stream.read(length).decode('utf-8'))
+
+
+def write_message(stream: BinaryIO,message: dict) -> NoReturn:
+    '''写入一条JSON-RPC消息'''
+    body: bytes = json.dumps(message,ensure_ascii=False,separators=(',',':')).encode('utf-8')
+    stream.write(b'Content-Length: ' + str(len(body)).encode('ascii') + b'\r\n\r\n' + body)
+    stream.flush()
+
+
+def uri_to_path(uri: str,pathmod = os.path) -> str:
+    '''
+    file URI转为路径，pathmod为os.path、ntpath或posixpath
+    Windows下file:///C:/x(包括VS Code发送的file:///c%3A/x)转为C:\\x，file://server/share转为UNC路径
+    '''
+    parsed = urlparse(uri)
+    path: str = unquote(parsed.path)
+
+    if pathmod.sep == '\\':
+        if parsed.netloc not in ('','localhost'):
+            path = '//' + parsed.netloc + path
+        elif re.match(r'/[A-Za-z][:|]',path):
+            path = path[1] + ':' + path[3:]
+        path = path.replace('/','\\')
+
+    return pathmod.normpath(path)
+
+
+def path_to_uri(path: str,pathmod = os.path) -> str:
+    '''路径转为file URI，相对路径先转为绝对路径，pathmod含义同uri_to_path'''
+    pure: type = PureWindowsPath if pathmod.sep == '\\' else PurePosixPath
+    return pure(pathmod.abspath(path)).as_uri()
+
+
+def _index(line: str,character: int) -> int:
+    '''LSP的列(UTF-16码元)转为字符串下标'''
+    if line.isascii():
+        return min(character,len(line))
+    units: int = 0
+    for i,c in enumerate(line):
+        if units >= character:
+            return i
+        units += 2 if ord(c) > 0xFFFF else 1
+    return len(line)
+
+
+def _character(line: str,index: int) -> int:
+    '''字符串下标转为LSP的列(UTF-16码元)'''
+    head: str = line[0:index]
+    return len(head) if head.isascii() else len(head.encode('utf-16-le')) // 2
+
+
+class Document(object):
+    '''
+    编辑器中打开的ini
+    每次修改由Ini.apply_text_edit只重新解析修改所在的段落，其后的段落沿用原来的对象，
+    因此单次修改的开销与修改涉及的段落大小成正比，与文件大小无关
+    存在语法错误(未结束的多行文本)时保留上一次的解析结果，之后每次修改都重新解析整个文件直到错误消失
+    '''
+    def __init__(self,uri: str,text: str,version: int = 0):
+        check(uri,str)
+        check(text,str)
+        self.uri: str = uri
+        self.version: int = version
+        self.error: Optional[IniSyntaxError] = None
+        self.__filename: str = os.path.basename(uri_to_path(uri))
+        self.__lines: List[str] = text.split('\n')
+        self.__ini: Ini = Ini(self.__filename)
+        self.__problems: Dict[int,Tuple[Section,List[Tuple[int,Problem]]]] = {}
+        self.__validator: Optional[Validator] = None
+        self.__parse()
+
+
+    @property
+    def ini(self) -> Ini:
+        return self.__ini
+
+
+    @property
+    def text(self) -> str:
+        return '\n'.join(self.__lines)
+
+
+    @property
+    def filename(self) -> str:
+        return self.__filename
+
+
+    def line(self,line: int) -> str:
+        '''第line行(从0开始)的文本'''
+        return self.__lines[line] if 0 <= line < len(self.__lines) else ''
+
+
+    def __parse(self) -> NoReturn:
+        try:
+            ini: Ini = Ini.create_ini(self.text,self.__filename,True)
+        except IniSyntaxError as e:
+            self.error = e
+            return
+        self.__ini = ini
+        self.error = None
+
+
+    def apply_change(self,start: Optional[Tuple[int,int]],end: Optional[Tuple[int,int]],text: str) -> NoReturn:
+        '''
+        应用一次修改，start和end为LSP的(行,列)，从0开始；都为None时替换全部文本
+        '''
+        check(text,str)
+
+        if start is None or end is None:
+            self.__lines = text.split('\n')
+            self.__parse()
+            return
+
+        lines: List[str] = self.__lines
+        first: int = min(start[0],len(lines) - 1)
+        last: int = min(end[0],len(lines) - 1)
+        head: str = lines[first][0:_index(lines[first],start[1])] if start[0] < len(lines) else lines[first]
+        tail: str = lines[last][_index(lines[last],end[1]):] if end[0] < len(lines) else ''
+        replacement: List[str] = (head + text + tail).split('\n')
+        lines[first:last + 1] = replacement
+
+        if self.error is not None:
+            self.__parse()
+            return
+
+        try:
+            self.__ini.apply_text_edit(first + 1,last + 2,'\n'.join(replacement) + '\n')
+        except IniSyntaxError as e:
+            self.error = e
+
+
+    def iter_sections(self) -> Iterator[Tuple[int,Section]]:
+        '''按顺序产生(段落头的当前行号,段落)，行号从1开始'''
+        return ((sec.linenum,sec) for sec in self.__ini.sections)
+
+
+    def section_at(self,line: int) -> Optional[Section]:
+        '''第line行(从1开始)所在的段落，在第一个段落之前时返回None'''
+        return self.__ini.section_at(line)
+
+
+    def validate(self,validator: Validator) -> List[Problem]:
+        '''
+        按代码表校验，结果中的行号为当前行号
+        每个段落的结果按段落对象缓存，只校验重新解析产生的段落
+        '''
+        if validator is not self.__validator:
+            self.__problems = {}
+            self.__validator = validator
+
+        cache: Dict[int,Tuple[Section,List[Tuple[int,Problem]]]] = {}
+        problems: List[Problem] = []
+
+        for start,sec in self.iter_sections():
+            cached: Optional[Tuple[Section,List[Tuple[int,Problem]]]] = self.__problems.get(id(sec))
+
+            if cached is None or cached[0] is not sec:
+                cached = (sec,[(problem.linenum - sec.linenum,problem)
+                for problem in validator.validate_section(self.__filename,sec)])
+
+            cache[id(sec)] = cached
+            problems.extend(problem._replace(linenum=start + offset) for offset,problem in cached[1])
+
+        self.__problems = cache
+        return problems
+
+
+class Server(object):
+    '''
+    语言服务器，从reader读取请求并向writer写入响应和通知
+    mod_dir为copyFrom跳转使用的mod文件夹，为None时取initialize中的rootUri
+    '''
+    def __init__(self,reader: BinaryIO,writer: BinaryIO,mod_dir: Optional[str] = None,
+    index: Optional[CompletionIndex] = None):
+        self.__reader: BinaryIO = reader
+        self.__writer: BinaryIO = writer
+        self.__mod_dir: Optional[str] = mod_dir
+        self.__mod: Optional[Mod] = None
+        self.__index: Optional[CompletionIndex] = index
+        self.__documents: Dict[str,Document] = {}
+        # 等待发布诊断的文档，在没有待处理的消息时才发布
+        self.__pending: Dict[str,Document] = {}
+        self.__shutdown: bool = False
+        self.__handlers: Dict[str,Callable[[dict],object]] = {
+        'initialize': self.initialize,
+        'shutdown': self.shutdown,
+        'textDocument/didOpen': self.did_open,
+        'textDocument/didChange': self.did_change,
+        'textDocument/didClose': self.did_close,
+        'textDocument/completion': self.completion,
+        'textDocument/hover': self.hover,
+        'textDocument/definition': self.definition
+        }
+
+
+    @property
+    def index(self) -> CompletionIndex:
+        '''补全索引，第一次使用时加载'''
+        if self.__index is None:
+            self.__index = CompletionIndex.load()
+        return self.__index
+
+
+    @property
+    def mod(self) -> Optional[Mod]:
+        if self.__mod is None and self.__mod_dir is not None and os.path.isdir(self.__mod_dir):
+            self.__mod = Mod(self.__mod_dir)
+        return self.__mod
+
+
+    def document(self,uri: str) -> Optional[Document]:
+        return self.__documents.get(uri)
+
+
+    def __read(self,queue: Queue) -> NoReturn:
+        '''在后台线程中读取消息，输入结束时放入None'''
+        while True:
+            message: Optional[dict] = read_message(self.__reader)
+            queue.put(message)
+            if message is None or message.get('method') == 'exit':
+                return
+
+
+    def serve(self) -> int:
+        '''
+        处理消息直到收到exit或输入结束，返回进程的退出码
+        消息由后台线程读取，处理完当前全部消息后才计算并发布诊断，连续输入时每次按键只需应用修改
+        '''
+        queue: Queue = Queue()
+        threading.Thread(target=self.__read,args=(queue,),name='rwpy-lsp-reader',daemon=True).start()
+
+        while True:
+            message: Optional[dict] = queue.get()
+
+            if message is None:
+                return 1
+
+            if message.get('method') == 'exit':
+                return 0 if self.__shutdown else 1
+
+            self.handle(message)
+
+            if queue.empty():
+                try:
+                    self.flush()
+                except Exception as e:
+                    self.__log('publishDiagnostics -> {0}: {1}'.format(type(e).__name__,e))
+
+
+    def handle(self,message: dict) -> NoReturn:
+        '''
+        处理一条消息，请求的结果或错误写入writer
+        处理时的任何异常都不会终止服务器：请求返回INTERNAL_ERROR，通知以window/logMessage报告
+        '''
+        method: Optional[str] = message.get('method')
+        handler: Optional[Callable[[dict],object]] = self.__handlers.get(method)
+        request: bool = 'id' in message
+
+        if handler is None:
+            if request:
+                self.__send({'jsonrpc': '2.0','id': message['id'],'error': {'code': METHOD_NOT_FOUND,
+                'message': '不支持的方法 -> {0}'.format(method)}})
+            return
+
+        try:
+            result = handler(message.get('params') or {})
+        except Exception as e:
+            text: str = '{0} -> {1}: {2}'.format(method,type(e).__name__,e)
+            if request:
+                self.__send({'jsonrpc': '2.0','id': message['id'],'error': {'code': INTERNAL_ERROR,'message': text}})
+            else:
+                self.__log(text)
+            return
+
+        if request:
+            self.__send({'jsonrpc': '2.0','id': message['id'],'result': result})
+
+
+    def __send(self,message: dict) -> NoReturn:
+        write_message(self.__writer,message)
+
+
+    def __log(self,text: str) -> NoReturn:
+        '''以window/logMessage向客户端报告错误'''
+        self.__send({'jsonrpc': '2.0','method': 'window/logMessage','params': {'type': MESSAGE_ERROR,'message': text}})
+
+
+    def initialize(self,params: dict) -> dict:
+        if self.__mod_dir is None:
+            root: Optional[str] = params.get('rootUri')
+            if root:
+                self.__mod_dir = uri_to_path(root)
+            elif params.get('rootPath'):
+                self.__mod_dir = params['rootPath']
+
+        return {'capabilities': {
+        'textDocumentSync': {'openClose': True,'change': SYNC_INCREMENTAL},
+        'completionProvider': {'triggerCharacters': []},
+        'hoverProvider': True,
+        'definitionProvider': True
+        },'serverInfo': {'name': 'rwpy'}}
+
+
+    def shutdown(self,params: dict) -> None:
+        '''关闭前发布尚未发布的诊断'''
+        self.flush()
+        self.__shutdown = True
+        return None
+
+
+    def did_open(self,params: dict) -> None:
+        item: dict = params['textDocument']
+        document: Document = Document(item['uri'],item['text'],item.get('version',0))
+        self.__documents[document.uri] = document
+        self.__pending[document.uri] = document
+
+
+    def did_change(self,params: dict) -> None:
+        document: Optional[Document] = self.document(params['textDocument']['uri'])
+
+        if document is None:
+            return
+
+        for change in params['contentChanges']:
+            if 'range' in change:
+                start: dict = change['range']['start']
+                end: dict = change['range']['end']
+                document.apply_change((start['line'],start['character']),(end['line'],end['character']),
+                change['text'])
+            else:
+                document.apply_change(None,None,change['text'])
+
+        document.version = params['textDocument'].get('version',document.version)
+        self.__pending[document.uri] = document
+
+
+    def did_close(self,params: dict) -> None:
+        uri: str = params['textDocument']['uri']
+        self.__documents.pop(uri,None)
+        self.__pending.pop(uri,None)
+        self.__send({'jsonrpc': '2.0','method': 'textDocument/publishDiagnostics','params': {'uri': uri,
+        'diagnostics': []}})
+
+
+    def diagnostics(self,document: Document) -> List[dict]:
+        '''文档当前的诊断'''
+        diagnostics: List[dict] = []
+
+        if document.error is not None:
+            match = _SYNTAX_LINE.search(document.error.message)
+            line: int = int(match.group(1)) - 1 if match is not None else 0
+            diagnostics.append({'range': self.__line_range(document,line),'severity': SEVERITY_ERROR,
+            'source': 'rwpy','message': document.error.message})
+
+        for problem in document.validate(self.index.validator):
+            line = problem.linenum - 1
+            text: str = document.line(line)
+            start: int = 0
+            end: int = len(text)
+
+            if problem.key is not None and text.find(problem.key) >= 0:
+                start = text.find(problem.key)
+                end = start + len(problem.key)
+
+            diagnostics.append({'range': {'start': {'line': line,'character': _character(text,start)},
+            'end': {'line': line,'character': _character(text,end)}},'severity': SEVERITY_WARNING,
+            'source': 'rwpy','message': '{0} -> {1}'.format(problem.message,problem.key or problem.section)})
+
+        return diagnostics
+
+
+    def __line_range(self,document: Document,line: int) -> dict:
+        text: str = document.line(line)
+        return {'start': {'line': line,'character': 0},'end': {'line': line,'character': _character(text,len(text))}}
+
+
+    def flush(self) -> NoReturn:
+        '''发布打开或修改之后还没有发布的诊断'''
+        pending: List[Document] = list(self.__pending.values())
+        self.__pending.clear()
+        for document in pending:
+            self.publish(document)
+
+
+    def publish(self,document: Document) -> NoReturn:
+        self.__send({'jsonrpc': '2.0','method': 'textDocument/publishDiagnostics','params': {'uri': document.uri,
+        'version': document.version,'diagnostics': self.diagnostics(document)}})
+
+
+    def __position(self,params: dict) -> Tuple[Optional[Document],int,str,int]:
+        '''(文档,行号(从0开始),该行文本,光标在该行中的下标)'''
+        document: Optional[Document] = self.document(params['textDocument']['uri'])
+        line: int = params['position']['line']
+
+        if document is None:
+            return (None,line,'',0)
+
+        text: str = document.line(line)
+        return (document,line,text,_index(text,params['position']['character']))
+
+
+    def completion(self,params: dict) -> dict:
+        '''光标位于代码名中时补全所在段落下的代码'''
+        document,line,text,index = self.__position(params)
+        before: str = text[0:index]
+        stripped: str = before.lstrip()
+        sec: Optional[Section] = None if document is None else document.section_at(line + 1)
+
+        if sec is None or ':' in before or stripped.startswith('#') or stripped.startswith('['):
+            return {'isIncomplete': False,'items': []}
+
+        items: List[CompletionItem] = self.index.complete(sec.name,stripped)
+        return {'isIncomplete': False,'items': [{'label': item.key,'kind': KIND_PROPERTY,'detail': item.value_type,
+        'documentation': item.name} for item in items]}
+
+
+    def hover(self,params: dict) -> Optional[dict]:
+        '''光标位于代码名上时显示代码表中的名称、值类型和说明'''
+        document,line,text,index = self.__position(params)
+        colon: int = text.find(':')
+        sec: Optional[Section] = None if document is None else document.section_at(line + 1)
+
+        if sec is None or colon < 0 or index > colon or text.lstrip().startswith('#'):
+            return None
+
+        key: str = text[0:colon].strip()
+        entry = self.index.describe(sec.name,key)
+
+        if entry is None:
+            return None
+
+        start: int = text.find(key)
+        contents: str = '**{0}** `{1}` {2}'.format(entry.key,entry.value_type,entry.name)
+
+        if entry.description:
+            contents += '\n\n' + entry.description
+
+        return {'contents': {'kind': 'markdown','value': contents},'range': {'start': {'line': line,
+        'character': _character(text,start)},'end': {'line': line,'character': _character(text,start + len(key))}}}
+
+
+    def definition(self,params: dict) -> List[dict]:
+        '''光标位于[core]copyFrom的值中时跳转到对应的文件，光标不在某个路径上时返回全部文件'''
+        document,line,text,index = self.__position(params)
+        mod: Optional[Mod] = self.mod
+        colon: int = text.find(':')
+        sec: Optional[Section] = None if document is None else document.section_at(line + 1)
+
+        if mod is None or sec is None or sec.name != 'core' or colon < 0 or text[0:colon].strip() != 'copyFrom':
+            return []
+
+        value: str = text[colon + 1:]
+        offset: int = index - colon - 1
+        selected: str = value
+        pos: int = 0
+
+        for part in value.split(','):
+            if pos <= offset <= pos + len(part) and part.strip() != '':
+                selected = part
+                break
+            pos += len(part) + 1
+
+        relpath: str = os.path.relpath(uri_to_path(document.uri),mod.dir)
+        return [{'uri': path_to_uri(os.path.join(mod.dir,target)),'range': {'start': {'line': 0,'character': 0},
+        'end': {'line': 0,'character': 0}}} for path,target in copyfrom_paths(mod,relpath,selected)
+        if target is not None]
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    '''命令行入口：python -m rwpy.lsp [mod文件夹]'''
+    argv = sys.argv[1:] if argv is None else argv
+    server: Server = Server(sys.stdin.buffer,sys.stdout.buffer,argv[0] if len(argv) > 0 else None)
+    return server.serve()
+
+
+if __name__ == '__main__':
+    sys.exit(main())
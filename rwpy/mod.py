@@ -1,11 +1,21 @@
 from abc import ABC, abstractclassmethod, abstractmethod
-from typing import List, NoReturn,Optional
-from zipfile import ZipFile
+from typing import BinaryIO,Callable,Deque,Dict,Iterator,List,NoReturn,Optional,Tuple,Union
+from collections import deque
+from concurrent.futures import Future,ThreadPoolExecutor,ProcessPoolExecutor,FIRST_COMPLETED,wait
+from zipfile import ZipFile,ZipInfo,ZIP_STORED
+import io
+import marshal
+import mmap
 import os
+import posixpath
 import shutil
+import struct
+import threading
 
 
-from rwpy.code import Ini,Section,Element,Attribute
+from rwpy.code import IIni,Ini,Section,Element,Attribute
+from rwpy.lazy import LazyIni
+from rwpy.cache import ParseCache,CACHE_SIZE_DEFAULT,read_text
 from rwpy.util import filterl,check
 import rwpy.errors as errors
 
@@ -28,6 +38,85 @@ not_ini_list: List[str] = [
 '.png'
 ]
 
+def _parse_compact(text: str,filename: str) -> bytes:
+    '''在工作进程中解析，返回marshal序列化的Ini.to_compact'''
+    return marshal.dumps(Ini.create_ini(text,filename).to_compact())
+
+
+def _iter_inis(load: Callable[[str,str,Optional[Callable]],Optional[Ini]],inifiles: List[str],
+workers: Optional[int],executor: str,ordered: bool) -> Iterator[Ini]:
+    '''IMod.iter_inis的实现，load(path,filename,parse)读取并解析一个文件'''
+    if not executor in ('thread','process'):
+        raise ValueError('executor只能为thread或process')
+
+    if workers is None or workers <= 1:
+
+        for inifile in inifiles:
+            ini: Optional[Ini] = load(inifile,inifile)
+            if not ini is None:
+                yield ini
+
+        return
+
+    processes: Optional[ProcessPoolExecutor] = ProcessPoolExecutor(workers) if executor == 'process' else None
+    parse: Optional[Callable[[str,str],tuple]] = None
+
+    if not processes is None:
+        parse = lambda text,filename: marshal.loads(processes.submit(_parse_compact,text,filename).result())
+
+    try:
+        with ThreadPoolExecutor(workers) as threads:
+            pending: Deque[Future] = deque()
+            queue: Iterator[str] = iter(inifiles)
+
+            def submit() -> NoReturn:
+                inifile: Optional[str] = next(queue,None)
+                if not inifile is None:
+                    pending.append(threads.submit(load,inifile,inifile,parse))
+
+            for _ in range(0,workers * 4):
+                submit()
+
+            while len(pending) > 0:
+
+                if ordered:
+                    future: Future = pending.popleft()
+                else:
+                    future = next(iter(wait(pending,return_when=FIRST_COMPLETED).done))
+                    pending.remove(future)
+
+                submit()
+                ini = future.result()
+
+                if not ini is None:
+                    yield ini
+
+    finally:
+        if not processes is None:
+            processes.shutdown(cancel_futures=True)
+
+
+def _to_columns(mod,inifiles: List[str],fields: List[str],dir: Optional[str],resolve: bool,workers: Optional[int]):
+    '''IMod.to_columns的实现'''
+    from rwpy.columns import build_columns
+
+    check(fields,list)
+
+    if resolve:
+        from rwpy.resolver import CopyFromResolver
+
+        # 以workers并行构建文件夹下的ini，只有合并copyFrom在当前线程中依次进行
+        parsed: Dict[str,Ini] = dict((os.path.relpath(ini.filename,mod.dir),ini) for ini in
+        mod.iter_inis(dir,workers)) if not workers in (None,1) else {}
+        resolver = CopyFromResolver(mod,parsed)
+        relpaths: List[str] = [os.path.relpath(path,mod.dir) for path in inifiles]
+        entries = filter(lambda x: not x[1] is None,((relpath,resolver.resolve(relpath)) for relpath in relpaths))
+    else:
+        entries = ((os.path.relpath(ini.filename,mod.dir),ini) for ini in mod.iter_inis(dir,workers,ordered=True))
+
+    return build_columns(entries,len(inifiles),fields)
+
+
 class Unit(object):
     '''由ini及其他文件构造出的单位'''
     pass
@@ -58,7 +147,7 @@ class IMod(ABC):
         pass
 
     @abstractmethod
-    def getini(self,inifile: str) -> Optional[Ini]:
+    def getini(self,inifile: str,lazy: bool = False) -> Optional[IIni]:
         pass
 
     @abstractmethod
@@ -69,26 +158,140 @@ class IMod(ABC):
 class Mod(IMod):
     '''Mod'''
     
-    def __init__(self,dir: str):
-        '''抛出ModNotExistedError和RepeatedModInfoError异常'''
+    def __init__(self,dir: str,cache_dir: Optional[str] = None,cache_size: int = CACHE_SIZE_DEFAULT,
+    case_sensitive: bool = True):
+        '''
+        cache_dir不为None时，getini和getinis使用该目录下的解析缓存
+        case_sensitive为False时，查找文件不区分大小写
+        文件索引由锁保护，可以在多个线程中同时使用(如Watcher的后台线程)
+        抛出ModNotExistedError和RepeatedModInfoError异常
+        '''
         
         if not os.path.exists(dir):
             raise errors.ModNotExistsError('指定Mod不存在->' + dir)
             
         self.__dir: str = dir
         self.__modinfo: Optional[Ini] = None
+        self.__cache: Optional[ParseCache] = None if cache_dir is None else ParseCache(cache_dir,cache_size)
+        self.__case_sensitive: bool = case_sensitive
+        self.__files: Optional[Dict[str,str]] = None
+        self.__dirs: Dict[str,Tuple[int,List[str],List[str]]] = {}
+        self.__lock: threading.RLock = threading.RLock()
         
-        for root,dirs,files in os.walk(dir,topdown=True):
+        for file in self.__index().values():
         
-            if 'mod-info.txt' in files:
+            if os.path.basename(file) == 'mod-info.txt':
             
                 if self.__modinfo is None:
                 
-                    with open(os.path.join(root,'mod-info.txt'),'r',encoding='UTF-8') as f:
+                    with open(os.path.join(dir,file),'r',encoding='UTF-8') as f:
                         self.__modinfo = Ini.create_ini(f.read())
                         
                 else:
-                    raise errors.RepeatedModInfoError('多余的mod-info.txt -> ' + os.path.join(root,'mod-info.txt'))
+                    raise errors.RepeatedModInfoError('多余的mod-info.txt -> ' + os.path.join(dir,file))
+
+
+    def __key(self,relpath: str) -> str:
+        '''文件索引的查找键'''
+        key: str = os.path.normpath(relpath)
+        return key if self.__case_sensitive else key.lower()
+
+
+    def __scan(self,reldir: str) -> NoReturn:
+        '''扫描一个文件夹及其新出现的子文件夹，更新文件索引'''
+        path: str = os.path.join(self.__dir,reldir)
+        old: Optional[Tuple[int,List[str],List[str]]] = self.__dirs.get(reldir)
+
+        if old is not None:
+            for name in old[1]:
+                self.__files.pop(self.__key(os.path.join(reldir,name)),None)
+
+        try:
+            mtime: int = os.stat(path).st_mtime_ns
+            files: List[str] = []
+            subdirs: List[str] = []
+
+            with os.scandir(path) as entries:
+                for entry in entries:
+                    if entry.is_dir():
+                        if not entry.is_symlink():
+                            subdirs.append(entry.name)
+                    else:
+                        files.append(entry.name)
+
+        except OSError:
+            self.__drop(reldir)
+            return
+
+        self.__dirs[reldir] = (mtime,files,subdirs)
+
+        for name in files:
+            relpath: str = os.path.join(reldir,name)
+            self.__files[self.__key(relpath)] = relpath
+
+        for name in subdirs:
+            if old is None or not name in old[2]:
+                self.__scan(os.path.join(reldir,name))
+
+        if old is not None:
+            for name in old[2]:
+                if not name in subdirs:
+                    self.__drop(os.path.join(reldir,name))
+
+
+    def __drop(self,reldir: str) -> NoReturn:
+        '''从文件索引中移除一个文件夹及其子文件夹'''
+        old: Optional[Tuple[int,List[str],List[str]]] = self.__dirs.pop(reldir,None)
+
+        if old is not None:
+            for name in old[1]:
+                self.__files.pop(self.__key(os.path.join(reldir,name)),None)
+            for name in old[2]:
+                self.__drop(os.path.join(reldir,name))
+
+
+    def __stale(self,reldir: str) -> bool:
+        '''文件夹的修改时间是否与索引中记录的不同'''
+        try:
+            return os.stat(os.path.join(self.__dir,reldir)).st_mtime_ns != self.__dirs[reldir][0]
+        except (OSError,KeyError):
+            return True
+
+
+    def __index(self,check_all: bool = False) -> Dict[str,str]:
+        '''
+        文件索引，查找键到相对路径的映射，第一次使用时遍历一次mod文件夹
+        check_all为True时检查所有文件夹是否变化
+        '''
+        if self.__files is None:
+            self.refresh()
+
+        elif check_all:
+            for reldir in list(self.__dirs.keys()):
+                if reldir in self.__dirs and self.__stale(reldir):
+                    self.__scan(reldir)
+
+        return self.__files
+
+
+    def __touched(self,relpath: str) -> NoReturn:
+        '''mod自身修改文件后更新所在文件夹的索引'''
+        with self.__lock:
+            if self.__files is not None:
+                reldir: str = os.path.dirname(os.path.normpath(relpath))
+
+                if reldir in self.__dirs:
+                    self.__scan(reldir)
+                else:
+                    self.__index(check_all=True)
+
+
+    def refresh(self) -> NoReturn:
+        '''重新遍历mod文件夹，重建文件索引'''
+        with self.__lock:
+            self.__files = {}
+            self.__dirs = {}
+            self.__scan('')
 
 
     @property
@@ -101,83 +304,170 @@ class Mod(IMod):
     def modinfo(self) -> Optional[Ini]:
         '''mod-info.txt的内容'''
         return self.__modinfo
+
+
+    @property
+    def cache(self) -> Optional[ParseCache]:
+        '''解析缓存，未启用时为None'''
+        return self.__cache
+
+
+    def __parse(self,path: str,filename: str,parse: Optional[Callable[[str,str],tuple]] = None) -> Optional[Ini]:
+        '''
+        读取并解析文件，编码错误时返回None
+        parse不为None时由parse(text,filename)解析，返回Ini.to_compact的形式
+        '''
+        try:
+
+            if self.__cache is not None:
+                return self.__cache.load(path,filename,parse)
+
+            with open(path,'r',encoding = 'UTF-8') as fs:
+
+                if parse is None:
+                    return Ini.create_ini(fs.read(),filename)
+
+                return Ini.from_compact(parse(fs.read(),filename))
+                
+        except UnicodeDecodeError:
+            return None
     
     
     def getfile(self,path: str) -> Optional[str]:
-        '''获取相对于mod路径下指定文件'''
+        '''获取相对于mod路径下指定文件，返回其相对路径'''
         check(path,str)
-        
-        for root,dirs,files in os.walk(self.__dir):
-        
-            for file in files:
-            
-                if os.path.relpath(os.path.join(root,file),self.dir) == path:
-                    return file
+        key: str = self.__key(path)
+
+        with self.__lock:
+            relpath: Optional[str] = self.__index().get(key)
+
+            if relpath is not None:
+                reldir: str = os.path.dirname(relpath)
+
+                if self.__stale(reldir):
+                    self.__scan(reldir)
+                    relpath = self.__files.get(key)
+
+            if relpath is None:
+                relpath = self.__index(check_all=True).get(key)
+
+        return relpath
                     
     
     def getfiles(self,dir: Optional[str]=None) -> List[str]:
-        '''获取相对于mod路径下某一文件夹下全部文件'''
+        '''获取相对于mod路径下某一文件夹(包括子文件夹)下全部文件'''
         if not dir is None and not isinstance(dir,str):
             raise TypeError
-            
-        r_files: List[str] = []
-        
-        for root,dirs,files in os.walk(self.__dir):
-            if os.path.relpath(self.__dir,root) == dir:
-                return files
-                
-            elif dir is None:
-                for file in files:
-                    r_files.append(os.path.join(root,file))
-                    
-        return r_files
+
+        with self.__lock:
+            files: Dict[str,str] = self.__index(check_all=True)
+
+            if dir is None:
+                return [os.path.join(self.__dir,relpath) for relpath in files.values()]
+
+            prefix: str = self.__key(dir)
+
+            if prefix == '.':
+                prefix = ''
+            else:
+                prefix += os.sep
+
+            return [os.path.join(self.__dir,relpath) for key,relpath in files.items() if key.startswith(prefix)]
                 
     
-    def getini(self,inifile: str) -> Optional[Ini]:
-        '''构建mod中的指定ini'''
+    def getini(self,inifile: str,lazy: bool = False) -> Optional[IIni]:
+        '''
+        构建mod中的指定ini
+        lazy为True时返回以mmap打开的LazyIni，只在访问段落时解析；此时编码错误在访问时才抛出
+        '''
         check(inifile,str)
         file: str = self.getfile(inifile)
         
         if not file is None:
-            text: str = ''
-            
-            try:
-                with open(os.path.join(self.dir,file),'r',encoding = 'UTF-8') as fs:
-                    text = fs.read()
-                    
-            except UnicodeDecodeError:
-                return None
-                
-            return Ini.create_ini(text,os.path.basename(inifile))
+
+            if lazy:
+                return LazyIni.open(os.path.join(self.dir,file),os.path.basename(inifile))
+
+            return self.__parse(os.path.join(self.dir,file),os.path.basename(inifile))
             
     
-    def getinis(self,dir: Optional[str] = None) -> List[Ini]:
-        '''构建mod下某一文件夹下全部ini'''
-        
-        files: List[str] = self.getfiles(dir)
-        inifiles: List[str] = filterl(lambda x: not x.split('.')[-1] in not_ini_list,files)
-        inis: List[Ini] = []
-        
-        for inifile in inifiles:
-            text: str = ''
-            
-            try:
-                with open(inifile,'r') as fs:
-                    text = fs.read()
-                inis.append(Ini.create_ini(text,inifile))
-                
-            except UnicodeDecodeError:
-                pass
-                
-        return filterl(lambda x: not x is None,inis)
-        
-        
+    def __inifiles(self,dir: Optional[str] = None) -> List[str]:
+        return filterl(lambda x: not os.path.splitext(x)[1].lower() in not_ini_list,self.getfiles(dir))
+
+
+    def getinis(self,dir: Optional[str] = None,workers: Optional[int] = None,executor: str = 'thread') -> List[Ini]:
+        '''构建mod下某一文件夹下全部ini，参数含义同iter_inis，结果按文件顺序排列'''
+        return list(self.iter_inis(dir,workers,executor,ordered=True))
+
+
+    def iter_inis(self,dir: Optional[str] = None,workers: Optional[int] = None,executor: str = 'thread',
+    ordered: bool = False) -> Iterator[Ini]:
+        '''
+        逐个构建mod下某一文件夹下全部ini，跳过无法按UTF-8解码的文件
+        workers为None或1时在当前线程中依次构建；否则以workers个线程读取文件，
+        executor为'process'时再交给workers个进程解析，进程只传回marshal序列化的紧凑形式
+        ordered为False时按完成顺序产生结果，否则按文件顺序
+        抛出IniSyntaxError
+        '''
+        return _iter_inis(self.__parse,self.__inifiles(dir),workers,executor,ordered)
+
+
+    def to_columns(self,fields: List[str],dir: Optional[str] = None,resolve: bool = False,
+    workers: Optional[int] = None):
+        '''
+        将mod下某一文件夹下全部单位的指定字段(段落.代码，如core.price)导出为rwpy.columns.Columns
+        数值预先分配到NumPy数组中，没有NumPy时使用array.array
+        resolve为True时先合并copyFrom；没有[core]或[core]dont_load为true的文件不导出
+        workers含义同Mod.iter_inis，resolve为True时也以workers并行构建，只有合并copyFrom依次进行
+        抛出IniSyntaxError和CopyFromError
+        '''
+        return _to_columns(self,self.__inifiles(dir),fields,dir,resolve,workers)
+
+
+    def watch(self,subscriber: Optional[Callable] = None,dir: Optional[str] = None,interval: float = 1.0,
+    debounce: float = 0.2,backend: str = 'auto'):
+        '''
+        在后台线程中监视mod文件夹，返回已启动的rwpy.watch.Watcher
+        subscriber不为None时订阅变化，参见Watcher
+        '''
+        from rwpy.watch import Watcher
+
+        watcher = Watcher(self,dir,interval,debounce,backend)
+
+        if subscriber is not None:
+            watcher.subscribe(subscriber)
+
+        return watcher.start()
+
+
+    def pack(self,output: str,workers: Optional[int] = None,level: int = 6,previous: Optional[str] = None):
+        '''
+        打包为.rwmod，参见rwpy.pack.pack，返回rwpy.pack.PackStats
+        抛出IOError和ValueError异常
+        '''
+        from rwpy.pack import pack
+
+        return pack(self,output,workers,level,previous)
+
+
+    def transaction(self,workers: Optional[int] = None,minimal: bool = True):
+        '''
+        开始批量修改，返回rwpy.transaction.Transaction
+        在with语句中使用时正常结束则只写入修改过的ini，抛出异常则不写入任何文件
+        minimal为True时只改写ini中修改过的部分
+        '''
+        from rwpy.transaction import Transaction
+
+        return Transaction(self,workers,minimal)
+
+
     def newini(self,relpath: str,content: str = '') -> Ini:
         ini: Optional[Ini] = None
         path = os.path.join(self.dir, relpath)
         with open(path,'w',encoding='UTF-8') as f:
             ini = Ini.create_ini(content, filename = path)
             ini.write()
+        self.__touched(relpath)
         return ini
         
         
@@ -185,6 +475,7 @@ class Mod(IMod):
         try:
             Ini.create_ini(os.path.join(self.dir, relpath))
             os.remove(os.path.join(self.dir, relpath))
+            self.__touched(relpath)
         except errors.IniSyntaxError:
             pass
         except IOError:
@@ -193,12 +484,257 @@ class Mod(IMod):
 
     def mvfile(self,src: str,dst: str) -> NoReturn:
         shutil.move(os.path.join(self.dir,src),os.path.join(self.dir,dst))
+        self.__touched(src)
+        self.__touched(dst)
 
 
     def rmfile(self,relpath: str) -> NoReturn:
         os.remove(os.path.join(self.dir,relpath))
+        self.__touched(relpath)
         
 
+class ArchiveMod(IMod):
+    '''
+    .rwmod或.zip压缩包中的Mod，不解压到磁盘
+    打开时只读取一次中央目录建立文件索引；成员在getini时才解压，并直接流式交给解析器
+    未压缩的成员从压缩包的mmap中读取
+    getfiles返回的路径以压缩包路径为前缀，与Mod一样可以用os.path.relpath(path,mod.dir)得到相对路径
+    '''
+    def __init__(self,dir: str,case_sensitive: bool = True):
+        '''
+        dir为压缩包路径，mod-info.txt所在的文件夹视为mod根目录
+        抛出ModNotExistedError、RepeatedModInfoError和zipfile.BadZipFile异常
+        '''
+        if not os.path.isfile(dir):
+            raise errors.ModNotExistsError('指定Mod不存在->' + dir)
+
+        self.__dir: str = dir
+        self.__case_sensitive: bool = case_sensitive
+        self.__zip: ZipFile = ZipFile(dir)
+        self.__mmap: Optional[mmap.mmap] = None
+        # getinis等在多个线程中读取成员，mmap只建立一次
+        self.__lock: threading.Lock = threading.Lock()
+        self.__files: Dict[str,str] = {}
+        self.__infos: Dict[str,ZipInfo] = {}
+        self.__modinfo: Optional[Ini] = None
+
+        members: List[ZipInfo] = [info for info in self.__zip.infolist() if not info.is_dir()]
+        modinfos: List[ZipInfo] = [info for info in members if posixpath.basename(info.filename) == 'mod-info.txt']
+
+        if len(modinfos) > 1:
+            raise errors.RepeatedModInfoError('多余的mod-info.txt -> ' + os.path.join(dir,modinfos[1].filename))
+
+        self.__root: str = '' if len(modinfos) == 0 else posixpath.dirname(modinfos[0].filename)
+        prefix: str = '' if self.__root == '' else self.__root + '/'
+
+        for info in members:
+            if info.filename.startswith(prefix):
+                relpath: str = os.path.normpath(info.filename[len(prefix):])
+                self.__files[self.__key(relpath)] = relpath
+                self.__infos[relpath] = info
+
+        if len(modinfos) > 0:
+            self.__modinfo = self.__parse('mod-info.txt','mod-info.txt')
+
+
+    def __key(self,relpath: str) -> str:
+        key: str = os.path.normpath(relpath)
+        return key if self.__case_sensitive else key.lower()
+
+
+    @property
+    def dir(self) -> str:
+        '''压缩包路径'''
+        return self.__dir
+
+
+    @property
+    def root(self) -> str:
+        '''mod根目录在压缩包中的路径，位于压缩包根部时为空字符串'''
+        return self.__root
+
+
+    @property
+    def modinfo(self) -> Optional[Ini]:
+        '''mod-info.txt的内容'''
+        return self.__modinfo
+
+
+    def close(self) -> NoReturn:
+        '''关闭压缩包'''
+        with self.__lock:
+            if self.__mmap is not None:
+                try:
+                    self.__mmap.close()
+                except BufferError:
+                    # read返回的memoryview仍在使用，交由垃圾回收关闭
+                    pass
+                self.__mmap = None
+        self.__zip.close()
+
+
+    def __enter__(self):
+        return self
+
+
+    def __exit__(self,*args) -> NoReturn:
+        self.close()
+
+
+    def __stored(self,info: ZipInfo) -> Optional[memoryview]:
+        '''未压缩、未加密成员在mmap中的数据，不复制'''
+        if info.compress_type != ZIP_STORED or info.flag_bits & 0x1 or info.file_size == 0:
+            return None
+
+        buffer: Optional[mmap.mmap] = self.__mmap
+
+        if buffer is None:
+            with self.__lock:
+                if self.__mmap is None:
+                    with open(self.__dir,'rb') as f:
+                        self.__mmap = mmap.mmap(f.fileno(),0,access=mmap.ACCESS_READ)
+                buffer = self.__mmap
+
+        header: bytes = buffer[info.header_offset:info.header_offset + 30]
+
+        if len(header) < 30 or header[0:4] != b'PK\x03\x04':
+            return None
+
+        name_length,extra_length = struct.unpack('<HH',header[26:30])
+        start: int = info.header_offset + 30 + name_length + extra_length
+        return memoryview(buffer)[start:start + info.file_size]
+
+
+    def getfile(self,path: str) -> Optional[str]:
+        '''获取相对于mod根目录的指定文件，返回其相对路径'''
+        check(path,str)
+        return self.__files.get(self.__key(path))
+
+
+    def getfiles(self,dir: Optional[str] = None) -> List[str]:
+        '''获取相对于mod根目录某一文件夹(包括子文件夹)下全部文件'''
+        if not dir is None and not isinstance(dir,str):
+            raise TypeError
+
+        if dir is None:
+            return [os.path.join(self.__dir,relpath) for relpath in self.__files.values()]
+
+        prefix: str = self.__key(dir)
+
+        if prefix == '.':
+            prefix = ''
+        else:
+            prefix += os.sep
+
+        return [os.path.join(self.__dir,relpath) for key,relpath in self.__files.items() if key.startswith(prefix)]
+
+
+    def open(self,path: str) -> BinaryIO:
+        '''
+        以二进制流打开成员，按需解压
+        抛出FileNotFoundError异常
+        '''
+        relpath: Optional[str] = self.getfile(path)
+
+        if relpath is None:
+            raise FileNotFoundError(path)
+
+        info: ZipInfo = self.__infos[relpath]
+        data: Optional[memoryview] = self.__stored(info)
+
+        if data is not None:
+            return io.BytesIO(data)
+
+        return self.__zip.open(info)
+
+
+    def read(self,path: str) -> Union[bytes,memoryview]:
+        '''
+        读取成员的全部内容，未压缩的成员返回mmap上的memoryview
+        抛出FileNotFoundError异常
+        '''
+        relpath: Optional[str] = self.getfile(path)
+
+        if relpath is None:
+            raise FileNotFoundError(path)
+
+        info: ZipInfo = self.__infos[relpath]
+        data: Optional[memoryview] = self.__stored(info)
+        return self.__zip.read(info) if data is None else data
+
+
+    def __parse(self,path: str,filename: str,parse: Optional[Callable[[str,str],tuple]] = None) -> Optional[Ini]:
+        '''读取并解析成员，path可以带压缩包路径前缀，编码错误时返回None'''
+        if path.startswith(self.__dir + os.sep):
+            path = os.path.relpath(path,self.__dir)
+
+        relpath: str = self.__files[self.__key(path)]
+        info: ZipInfo = self.__infos[relpath]
+
+        try:
+            data: Optional[memoryview] = self.__stored(info)
+
+            if data is not None or parse is not None:
+                text: str = read_text(self.__zip.read(info) if data is None else data)
+                return Ini.create_ini(text,filename) if parse is None else Ini.from_compact(parse(text,filename))
+
+            with self.__zip.open(info) as stream:
+                return Ini.from_stream(stream,filename)
+
+        except UnicodeDecodeError:
+            return None
+
+
+    def getini(self,inifile: str,lazy: bool = False) -> Optional[IIni]:
+        '''
+        构建mod中的指定ini
+        lazy为True时返回LazyIni，只在访问段落时解析；未压缩的成员直接使用mmap上的数据，不复制
+        '''
+        check(inifile,str)
+        relpath: Optional[str] = self.getfile(inifile)
+
+        if relpath is None:
+            return None
+
+        if lazy:
+            return LazyIni(os.path.basename(inifile),self.read(relpath))
+
+        return self.__parse(relpath,os.path.basename(inifile))
+
+
+    def __inifiles(self,dir: Optional[str] = None) -> List[str]:
+        return filterl(lambda x: not os.path.splitext(x)[1].lower() in not_ini_list,self.getfiles(dir))
+
+
+    def getinis(self,dir: Optional[str] = None,workers: Optional[int] = None,executor: str = 'thread') -> List[Ini]:
+        '''构建mod下某一文件夹下全部ini，参数含义同Mod.iter_inis，结果按文件顺序排列'''
+        return list(self.iter_inis(dir,workers,executor,ordered=True))
+
+
+    def iter_inis(self,dir: Optional[str] = None,workers: Optional[int] = None,executor: str = 'thread',
+    ordered: bool = False) -> Iterator[Ini]:
+        '''逐个构建mod下某一文件夹下全部ini，参数含义同Mod.iter_inis'''
+        return _iter_inis(self.__parse,self.__inifiles(dir),workers,executor,ordered)
+
+
+    def to_columns(self,fields: List[str],dir: Optional[str] = None,resolve: bool = False,
+    workers: Optional[int] = None):
+        '''参见Mod.to_columns'''
+        return _to_columns(self,self.__inifiles(dir),fields,dir,resolve,workers)
+
+
+def openmod(path: str,**kwargs) -> IMod:
+    '''
+    打开mod，.zip和.rwmod文件返回ArchiveMod，否则返回Mod；kwargs原样传给对应的构造函数
+    ArchiveMod只接受case_sensitive，传入其他参数(如cache_dir)时抛出TypeError
+    抛出ModNotExistsError、RepeatedModInfoError和TypeError异常
+    '''
+    check(path,str)
+    if os.path.isfile(path) and path.split('.')[-1].lower() in ('zip','rwmod'):
+        return ArchiveMod(path,**kwargs)
+    return Mod(path,**kwargs)
+
+
 def mkmod(name: str,namespace: str = 'default') -> Mod:
     '''
     创建新mod
@@ -0,0 +1,310 @@
+'''
+将mod文件夹打包为.rwmod
+'''
+import hashlib
+import mmap
+import os
+import struct
+import tempfile
+import zlib
+from collections import deque
+from concurrent.futures import Future,ThreadPoolExecutor
+from typing import BinaryIO,Deque,Dict,Iterator,List,NamedTuple,NoReturn,Optional,Tuple,Union
+from zipfile import ZipFile,ZipInfo,BadZipFile,ZIP_STORED,ZIP_DEFLATED
+
+from rwpy.mod import IMod
+from rwpy.util import check
+
+
+# 已经压缩过的媒体文件，直接存储
+STORED_EXTENSIONS: Tuple[str,...] = ('.png','.ogg','.wav','.mp4','.jpg','.jpeg','.mp3')
+
+LEVEL_DEFAULT: int = 6
+
+# 固定的修改时间(1980-01-01 00:00:00)和权限，使输出只取决于文件内容
+_DOS_TIME: int = 0
+_DOS_DATE: int = (1 << 5) | 1
+_EXTERNAL_ATTR: int = 0o100644 << 16
+_VERSION: int = 20
+_LIMIT: int = 0xFFFFFFFF
+# 读取、哈希和压缩的块大小；压缩结果超过_SPOOL字节时暂存到临时文件
+_CHUNK: int = 1 << 20
+_SPOOL: int = 1 << 20
+
+_LOCAL = struct.Struct('<4s5H3L2H')
+_CENTRAL = struct.Struct('<4s6H3L5H2L')
+_END = struct.Struct('<4s4H2LH')
+
+
+class PackStats(NamedTuple):
+    '''打包结果：文件数、复用上次压缩结果的文件数、本次压缩的文件数、直接存储的文件数、输出字节数'''
+    files: int
+    reused: int
+    compressed: int
+    stored: int
+    size: int
+
+
+class _Entry(NamedTuple):
+    '''
+    一个成员：data为源文件路径(直接存储)、暂存压缩结果的文件或上一次压缩包中的(起始位置,长度)
+    digest为成员注释，即内容的sha256和压缩级别
+    '''
+    name: bytes
+    method: int
+    crc: int
+    size: int
+    compress_size: int
+    data: Union[str,BinaryIO,Tuple[int,int]]
+    digest: bytes
+    reused: bool
+
+
+class _Previous(object):
+    '''上一次的压缩包，按成员名和注释(内容哈希和压缩级别)找出已压缩的原始数据'''
+    def __init__(self,path: Optional[str]):
+        self.__infos: Dict[str,ZipInfo] = {}
+        self.__mmap: Optional[mmap.mmap] = None
+
+        if path is None or not os.path.isfile(path) or os.path.getsize(path) == 0:
+            return
+
+        try:
+            with ZipFile(path) as f:
+                self.__infos = dict((info.filename,info) for info in f.infolist())
+        except BadZipFile:
+            return
+
+        with open(path,'rb') as f:
+            self.__mmap = mmap.mmap(f.fileno(),0,access=mmap.ACCESS_READ)
+
+
+    def get(self,name: str,method: int,digest: bytes) -> Optional[Tuple[int,int]]:
+        '''注释和压缩方式都相同时返回已压缩的数据在压缩包中的(起始位置,长度)'''
+        info: Optional[ZipInfo] = self.__infos.get(name)
+
+        if info is None or info.compress_type != method or info.comment != digest or info.flag_bits & 0x1:
+            return None
+
+        header: bytes = self.__mmap[info.header_offset:info.header_offset + _LOCAL.size]
+
+        if len(header) < _LOCAL.size or header[0:4] != b'PK\x03\x04':
+            return None
+
+        name_length,extra_length = struct.unpack('<HH',header[26:30])
+        start: int = info.header_offset + _LOCAL.size + name_length + extra_length
+
+        if start + info.compress_size > len(self.__mmap):
+            return None
+
+        return (start,info.compress_size)
+
+
+    def write(self,region: Tuple[int,int],f: BinaryIO) -> NoReturn:
+        '''将get返回的数据分块写入f'''
+        start,size = region
+        for pos in range(start,start + size,_CHUNK):
+            f.write(self.__mmap[pos:min(pos + _CHUNK,start + size)])
+
+
+    def close(self) -> NoReturn:
+        if self.__mmap is not None:
+            self.__mmap.close()
+            self.__mmap = None
+
+
+def _chunks(path: str) -> Iterator[bytes]:
+    with open(path,'rb') as f:
+        while True:
+            chunk: bytes = f.read(_CHUNK)
+            if not chunk:
+                return
+            yield chunk
+
+
+def _compress(path: str,name: str,level: int,previous: _Previous) -> _Entry:
+    '''
+    在工作线程中分块读取并压缩一个文件，zlib和hashlib在处理大块数据时释放GIL
+    先计算内容哈希，可以复用上一次的结果时不再压缩；压缩时再次计算CRC，确认文件在两次读取之间未被修改
+    抛出IOError和ValueError异常
+    '''
+    encoded: bytes = name.encode('utf-8')
+    sha = hashlib.sha256()
+    crc: int = 0
+    size: int = 0
+
+    for chunk in _chunks(path):
+        sha.update(chunk)
+        crc = zlib.crc32(chunk,crc)
+        size += len(chunk)
+        if size > _LIMIT:
+            raise ValueError('文件过大，不支持ZIP64 -> ' + name)
+
+    digest: bytes = '{0}:{1}'.format(sha.hexdigest(),level).encode('ascii')
+
+    if os.path.splitext(name)[1].lower() in STORED_EXTENSIONS or size == 0:
+        return _Entry(encoded,ZIP_STORED,crc,size,size,path,digest,False)
+
+    for method in (ZIP_DEFLATED,ZIP_STORED):
+        region: Optional[Tuple[int,int]] = previous.get(name,method,digest)
+        if region is not None:
+            return _Entry(encoded,method,crc,size,region[1],region,digest,True)
+
+    compressor = zlib.compressobj(level,zlib.DEFLATED,-zlib.MAX_WBITS)
+    spool = tempfile.SpooledTemporaryFile(_SPOOL)
+    check_crc: int = 0
+    written: int = 0
+
+    try:
+        for chunk in _chunks(path):
+            check_crc = zlib.crc32(chunk,check_crc)
+            data: bytes = compressor.compress(chunk)
+            spool.write(data)
+            written += len(data)
+            if written >= size:
+                break
+        else:
+            data = compressor.flush()
+            spool.write(data)
+            written += len(data)
+            if check_crc != crc:
+                raise ValueError('文件在打包时被修改 -> ' + name)
+
+    except BaseException:
+        spool.close()
+        raise
+
+    # 压缩后反而更大时直接存储，写入时再确认内容未变
+    if written >= size:
+        spool.close()
+        return _Entry(encoded,ZIP_STORED,crc,size,size,path,digest,False)
+
+    spool.seek(0)
+    return _Entry(encoded,ZIP_DEFLATED,crc,size,written,spool,digest,False)
+
+
+def _write(entry: _Entry,f: BinaryIO,previous: _Previous) -> NoReturn:
+    '''
+    将成员的数据分块写入f，之后关闭暂存的文件
+    抛出IOError和ValueError异常
+    '''
+    if isinstance(entry.data,tuple):
+        previous.write(entry.data,f)
+        return
+
+    if isinstance(entry.data,str):
+        crc: int = 0
+        size: int = 0
+        for chunk in _chunks(entry.data):
+            crc = zlib.crc32(chunk,crc)
+            size += len(chunk)
+            f.write(chunk)
+        if crc != entry.crc or size != entry.size:
+            raise ValueError('文件在打包时被修改 -> ' + entry.name.decode('utf-8'))
+        return
+
+    try:
+        while True:
+            chunk: bytes = entry.data.read(_CHUNK)
+            if not chunk:
+                break
+            f.write(chunk)
+    finally:
+        entry.data.close()
+
+
+def _entries(files: List[Tuple[str,str]],level: int,previous: _Previous,workers: int) -> Iterator[_Entry]:
+    '''按文件顺序产生压缩结果，同时最多workers * 2个文件在处理中，每个最多在内存中暂存_SPOOL字节'''
+    with ThreadPoolExecutor(workers) as pool:
+        pending: Deque[Future] = deque()
+        queue: Iterator[Tuple[str,str]] = iter(files)
+
+        def submit() -> NoReturn:
+            item: Optional[Tuple[str,str]] = next(queue,None)
+            if item is not None:
+                pending.append(pool.submit(_compress,item[0],item[1],level,previous))
+
+        for _ in range(0,workers * 2):
+            submit()
+
+        while len(pending) > 0:
+            future: Future = pending.popleft()
+            submit()
+            yield future.result()
+
+
+def pack(mod: IMod,output: str,workers: Optional[int] = None,level: int = LEVEL_DEFAULT,
+previous: Optional[str] = None) -> PackStats:
+    '''
+    将mod打包为.rwmod(zip格式)，成员按路径排序并使用固定的时间和权限，相同的内容总是得到相同的输出
+    媒体文件(STORED_EXTENSIONS)直接存储；其余文件以workers个线程并行压缩
+    previous为上一次的输出(默认为output)，其中内容哈希和压缩级别都未变的成员直接复制已压缩的数据
+    每个成员的注释为其内容的sha256和压缩级别，形如<sha256>:<level>；文件分块读取和压缩，不整个读入内存
+    抛出IOError和ValueError异常
+    '''
+    check(output,str)
+    check(level,int)
+    workers = (os.cpu_count() or 1) if workers is None else max(workers,1)
+    target: str = os.path.abspath(output)
+    root: str = mod.dir
+    files: List[Tuple[str,str]] = []
+
+    for path in mod.getfiles():
+        if os.path.abspath(path) == target:
+            continue
+        files.append((path,os.path.relpath(path,root).replace(os.sep,'/')))
+
+    files.sort(key=lambda x: x[1])
+    old: _Previous = _Previous(output if previous is None else previous)
+    fd,tmp = tempfile.mkstemp(dir=os.path.dirname(target),suffix='.tmp')
+    reused: int = 0
+    compressed: int = 0
+    stored: int = 0
+
+    try:
+        with os.fdopen(fd,'wb') as f:
+            central: List[bytes] = []
+            offset: int = 0
+
+            for entry in _entries(files,level,old,workers):
+                flag: int = 0 if entry.name.isascii() else 0x800
+
+                if offset > _LIMIT:
+                    raise ValueError('压缩包过大，不支持ZIP64')
+
+                header: bytes = _LOCAL.pack(b'PK\x03\x04',_VERSION,flag,entry.method,_DOS_TIME,_DOS_DATE,
+                entry.crc,entry.compress_size,entry.size,len(entry.name),0)
+                f.write(header)
+                f.write(entry.name)
+                _write(entry,f,old)
+                central.append(_CENTRAL.pack(b'PK\x01\x02',_VERSION | (3 << 8),_VERSION,flag,entry.method,
+                _DOS_TIME,_DOS_DATE,entry.crc,entry.compress_size,entry.size,len(entry.name),0,len(entry.digest),
+                0,0,_EXTERNAL_ATTR,offset) + entry.name + entry.digest)
+                offset += len(header) + len(entry.name) + entry.compress_size
+
+                if entry.reused:
+                    reused += 1
+                elif entry.method == ZIP_STORED:
+                    stored += 1
+                else:
+                    compressed += 1
+
+            directory: bytes = b''.join(central)
+
+            if len(central) > 0xFFFF or offset > _LIMIT:
+                raise ValueError('压缩包过大，不支持ZIP64')
+
+            f.write(directory)
+            f.write(_END.pack(b'PK\x05\x06',0,0,len(central),len(central),len(directory),offset,0))
+            size: int = offset + len(directory) + _END.size
+
+        old.close()
+        os.replace(tmp,target)
+
+    except BaseException:
+        old.close()
+        if os.path.exists(tmp):
+            os.remove(tmp)
+        raise
+
+    return PackStats(len(files),reused,compressed,stored,size)
@@ -0,0 +1,140 @@
+'''
+流式解析器，逐行产生事件而不构建Ini树
+'''
+import codecs
+import os
+from typing import Iterator,Iterable,NamedTuple,Optional,Tuple,Union,TextIO,BinaryIO
+
+from rwpy.errors import IniSyntaxError
+
+
+SECTION: str = 'section'
+ATTRIBUTE: str = 'attribute'
+MULTILINE: str = 'multiline'
+COMMENT: str = 'comment'
+ELEMENT: str = 'element'
+
+CHUNK_SIZE: int = 64 * 1024
+
+# 解析规则变化时递增，用于使持久化的解析缓存失效
+PARSER_VERSION: int = 1
+
+
+class Event(NamedTuple):
+    '''
+    解析事件
+    kind为SECTION时key为段落名；
+    kind为ATTRIBUTE或MULTILINE时key、value为属性的键和值，endline为值的最后一行；
+    kind为COMMENT或ELEMENT时value为该行原文
+    '''
+    kind: str
+    linenum: int
+    key: Optional[str]
+    value: Optional[str]
+    endline: int
+
+
+Source = Union[str,os.PathLike,TextIO,BinaryIO]
+
+
+def iter_lines(source: Source,chunk_size: int = CHUNK_SIZE) -> Iterator[str]:
+    '''
+    按行迭代源，与str.split('\\n')的结果一致：只按\\n分行，\\r\\n的\\r和单独的\\r保留在行中
+    source可以是文本字符串、路径(os.PathLike)或文件对象；文件按块读取，字节按UTF-8解码
+    文本模式的文件对象按其自身的newline设置读取(默认会转换换行符)，需要一致时以newline=''打开
+    '''
+    if isinstance(source,str):
+        yield from source.split('\n')
+        return
+
+    if isinstance(source,os.PathLike):
+        with open(source,'r',encoding='utf-8',newline='') as f:
+            yield from iter_lines(f,chunk_size)
+        return
+
+    if not hasattr(source,'read'):
+        raise TypeError('参数类型错误')
+
+    decoder: Optional[codecs.IncrementalDecoder] = None
+    rest: str = ''
+
+    while True:
+        chunk = source.read(chunk_size)
+        eof: bool = not chunk
+
+        if isinstance(chunk,bytes):
+            if decoder is None:
+                decoder = codecs.getincrementaldecoder('utf-8')()
+            chunk = decoder.decode(chunk,eof)
+
+        if eof and not chunk:
+            break
+
+        lines = (rest + chunk).split('\n')
+        rest = lines.pop()
+        yield from lines
+
+    yield rest
+
+
+def tokenize(lines: Iterable[str],linenum: int = 0) -> Iterator[Tuple[str,int,Optional[str],Optional[str],int]]:
+    '''
+    解析引擎，产生(kind,linenum,key,value,endline)元组
+    linenum为lines之前已经消耗的行数
+    抛出IniSyntaxError
+    '''
+    lines = iter(lines)
+
+    for line in lines:
+        linenum += 1
+        stripped: str = line.strip()
+        first: str = stripped[:1]
+
+        if first == '#':
+            yield (COMMENT,linenum,None,line,linenum)
+        
+        elif first == '[' and stripped.find(']',2) != -1:
+            yield (SECTION,linenum,stripped[1:-1],None,linenum)
+        
+        elif line.find(':',1,len(line) - 1) != -1:
+            key,value = line.split(':',1)
+            clinenum: int = linenum
+            
+            if value.lstrip().startswith('\"\"\"'):
+                parts = [value]
+                closed: bool = value.rstrip().endswith('\"\"\"')
+            
+                while True:
+                    line = next(lines,None)
+                
+                    if line is None:
+                        raise IniSyntaxError('行号:{0}|意外终止的多行文本'.format(linenum))
+                        
+                    linenum += 1
+                    parts.append(line)
+                    tail: str = line.rstrip()
+                    
+                    if tail:
+                        closed = tail.endswith('\"\"\"')
+                    
+                    if closed:
+                        break
+                        
+                yield (MULTILINE,clinenum,key.strip(),'\n'.join(parts).strip(),linenum)
+
+            else:
+                yield (ATTRIBUTE,clinenum,key.strip(),value.strip(),linenum)
+            
+        else:
+            yield (ELEMENT,linenum,None,line,linenum)
+
+
+def iter_events(source: Source,chunk_size: int = CHUNK_SIZE) -> Iterator[Event]:
+    '''
+    拉取式解析，逐个产生Event，适用于不需要构建Ini的大文件扫描
+    source可以是文本字符串、路径(os.PathLike)或文件对象；文件按块读取，内存占用不随文件大小增长
+    抛出IniSyntaxError
+    '''
+    make = Event._make
+    for token in tokenize(iter_lines(source,chunk_size)):
+        yield make(token)
@@ -0,0 +1,223 @@
+'''
+copyFrom继承的解析
+'''
+import os
+from typing import Dict,List,NoReturn,Optional,Set,Tuple
+
+from rwpy.code import Ini
+from rwpy.errors import CopyFromError
+from rwpy.mod import IMod,not_ini_list
+from rwpy.util import check
+
+
+ROOT_PREFIX: str = 'ROOT:'
+
+_MISSING = object()
+
+
+def _is_true(ini: Ini,sec_name: str,key: str) -> bool:
+    sec = getattr(ini,sec_name)
+    if sec is None:
+        return False
+    attr = sec[key]
+    return attr is not None and attr.value.strip().lower() == 'true'
+
+
+def copyfrom_paths(mod: IMod,relpath: str,value: str) -> List[Tuple[str,Optional[str]]]:
+    '''
+    copyFrom的值中的各个路径(按从前到后的顺序)及其在mod中的实际相对路径，文件不存在时为None
+    ROOT:开头的路径相对于mod根目录，其余相对于relpath所在目录
+    '''
+    paths: List[Tuple[str,Optional[str]]] = []
+
+    for path in value.split(','):
+        path = path.strip().replace('\\','/')
+
+        if path == '':
+            continue
+
+        if path.startswith(ROOT_PREFIX):
+            full: str = path[len(ROOT_PREFIX):].lstrip('/')
+        else:
+            full = os.path.join(os.path.dirname(relpath),path)
+
+        paths.append((path,mod.getfile(os.path.normpath(full))))
+
+    return paths
+
+
+class CopyFromResolver(object):
+    '''
+    解析mod中[core]copyFrom的继承关系
+    每个文件只构建并合并一次，合并结果被继承它的所有文件共用，因此不要修改返回的ini
+    copyFrom中的多个文件按从前到后的顺序覆盖，ROOT:开头的路径相对于mod根目录，其余相对于文件所在目录
+    '''
+    def __init__(self,mod: IMod,parsed: Optional[Dict[str,Ini]] = None):
+        '''
+        parsed为已构建的ini(相对路径 -> ini)，例如由Mod.iter_inis并行构建；
+        解析这些文件时不再读取，直接合并到其中(会修改它们)，其余文件由mod.getini构建
+        '''
+        check(mod,IMod)
+        self.__mod: IMod = mod
+        self.__parsed: Dict[str,Ini] = {} if parsed is None else dict(parsed)
+        self.__resolved: Dict[str,Optional[Ini]] = {}
+        self.__deps: Dict[str,List[str]] = {}
+
+
+    @property
+    def mod(self) -> IMod:
+        return self.__mod
+
+
+    def __relpath(self,path: str) -> Optional[str]:
+        '''文件在mod中的实际相对路径'''
+        return self.__mod.getfile(os.path.normpath(path))
+
+
+    def __bases(self,relpath: str,ini: Ini) -> List[str]:
+        '''ini直接继承的文件，抛出CopyFromError'''
+        core = ini.core
+        attr = None if core is None else core['copyFrom']
+
+        if attr is None:
+            return []
+
+        bases: List[str] = []
+
+        for path,base in copyfrom_paths(self.__mod,relpath,attr.value):
+
+            if base is None:
+                raise CopyFromError('文件不存在 -> {0} (copyFrom于{1})'.format(path,relpath))
+
+            bases.append(base)
+
+        return bases
+
+
+    def __visit(self,relpath: str,stack: List[str],visiting: Set[str]) -> Optional[Ini]:
+        '''深度优先，先解析全部基础文件再合并，即按拓扑序解析'''
+        if relpath in self.__resolved:
+            return self.__resolved[relpath]
+
+        if relpath in visiting:
+            cycle: List[str] = stack[stack.index(relpath):] + [relpath]
+            raise CopyFromError('循环的copyFrom -> ' + ' -> '.join(cycle))
+
+        ini: Optional[Ini] = self.__parsed.pop(relpath,None)
+
+        if ini is None:
+            ini = self.__mod.getini(relpath)
+
+        if ini is None:
+            self.__resolved[relpath] = None
+            self.__deps[relpath] = []
+            return None
+
+        bases: List[str] = self.__bases(relpath,ini)
+        stack.append(relpath)
+        visiting.add(relpath)
+
+        try:
+            resolved: List[Optional[Ini]] = [self.__visit(base,stack,visiting) for base in bases]
+        finally:
+            stack.pop()
+            visiting.discard(relpath)
+
+        for base in reversed(resolved):
+            if base is not None:
+                ini.merge(base)
+
+        self.__deps[relpath] = bases
+        self.__resolved[relpath] = ini
+        return ini
+
+
+    def resolve(self,path: str) -> Optional[Ini]:
+        '''
+        获取合并了全部copyFrom的ini，文件不存在或无法解码时返回None
+        抛出CopyFromError和IniSyntaxError
+        '''
+        check(path,str)
+        relpath: Optional[str] = self.__relpath(path)
+
+        if relpath is None:
+            return None
+
+        return self.__visit(relpath,[],set())
+
+
+    def __files(self,dir: Optional[str] = None) -> List[str]:
+        root: str = self.__mod.dir
+        return [os.path.relpath(path,root) for path in self.__mod.getfiles(dir)
+        if not os.path.splitext(path)[1].lower() in not_ini_list]
+
+
+    def graph(self,dir: Optional[str] = None) -> Dict[str,List[str]]:
+        '''
+        解析某一文件夹下全部ini，返回copyFrom依赖图(相对路径 -> 直接继承的文件)
+        抛出CopyFromError和IniSyntaxError
+        '''
+        for relpath in self.__files(dir):
+            self.__visit(relpath,[],set())
+        return dict((relpath,bases[:]) for relpath,bases in self.__deps.items())
+
+
+    def order(self,dir: Optional[str] = None) -> List[str]:
+        '''依赖图的拓扑序，基础文件在前'''
+        graph: Dict[str,List[str]] = self.graph(dir)
+        result: List[str] = []
+        done: Set[str] = set()
+
+        def visit(relpath: str) -> NoReturn:
+            if relpath in done:
+                return
+            done.add(relpath)
+            for base in graph.get(relpath,[]):
+                visit(base)
+            result.append(relpath)
+
+        for relpath in graph:
+            visit(relpath)
+
+        return result
+
+
+    def resolve_all(self,dir: Optional[str] = None) -> Dict[str,Ini]:
+        '''
+        解析某一文件夹下全部ini，返回相对路径 -> 合并后的ini，不含[core]dont_load为true的模板
+        抛出CopyFromError和IniSyntaxError
+        '''
+        inis: Dict[str,Ini] = {}
+
+        for relpath in self.__files(dir):
+            ini: Optional[Ini] = self.__visit(relpath,[],set())
+            if ini is not None and not _is_true(ini,'core','dont_load'):
+                inis[relpath] = ini
+
+        return inis
+
+
+    def invalidate(self,path: Optional[str] = None) -> NoReturn:
+        '''文件修改后丢弃它和所有继承它的文件的解析结果；path为None时全部丢弃'''
+        if path is None:
+            self.__parsed = {}
+            self.__resolved = {}
+            self.__deps = {}
+            return
+
+        relpath: str = os.path.normpath(path)
+        found: Optional[str] = self.__relpath(relpath)
+        pending: List[str] = [relpath if found is None else found]
+
+        while len(pending) > 0:
+            current: str = pending.pop()
+            if self.__resolved.pop(current,_MISSING) is _MISSING:
+                continue
+            self.__deps.pop(current,None)
+            pending.extend(relpath for relpath,bases in self.__deps.items() if current in bases)
+
+
+    def apply(self,changes: list) -> NoReturn:
+        '''按rwpy.watch.Watcher报告的变化丢弃过期的解析结果，可以直接作为订阅者'''
+        for change in changes:
+            self.invalidate(change.path)
@@ -0,0 +1,262 @@
+'''
+批量修改mod中的ini，提交时只原子地写入修改过的文件
+'''
+import os
+import secrets
+import shutil
+import stat
+import tempfile
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict,List,NoReturn,Optional,Set,Tuple
+
+from rwpy.code import Ini
+from rwpy.errors import TransactionClosedError
+from rwpy.mod import Mod,not_ini_list
+from rwpy.util import check
+
+
+def _write_temp(path: str,ini: Ini) -> str:
+    '''
+    在目标文件所在文件夹中写入临时文件并刷新到磁盘，返回临时文件路径
+    保留了源的ini只改写修改过的部分
+    '''
+    dirname: str = os.path.dirname(path)
+    os.makedirs(dirname,exist_ok=True)
+    fd,tmp = tempfile.mkstemp(dir=dirname,prefix='.' + os.path.basename(path) + '.',suffix='.tmp')
+
+    try:
+        with os.fdopen(fd,'w',encoding='utf-8',newline='' if ini.source is not None else None) as f:
+            ini.write_to(f,True)
+            f.flush()
+            os.fsync(f.fileno())
+
+        # mkstemp创建的文件只有所有者可读写，沿用原文件的权限
+        if os.path.exists(path):
+            os.chmod(tmp,stat.S_IMODE(os.stat(path).st_mode))
+
+    except BaseException:
+        os.remove(tmp)
+        raise
+
+    return tmp
+
+
+def _backup(path: str) -> Optional[str]:
+    '''
+    为将被替换的文件建立备份，优先使用硬链接以避免复制内容，文件不存在时返回None
+    os.link在目标已存在时失败，因此随机的备份名不会与其他进程创建的文件冲突；不能建立硬链接时
+    由mkstemp独占地创建备份文件并复制内容
+    '''
+    if not os.path.exists(path):
+        return None
+
+    dirname: str = os.path.dirname(path)
+    prefix: str = '.' + os.path.basename(path) + '.'
+
+    for _ in range(0,100):
+        backup: str = os.path.join(dirname,prefix + secrets.token_hex(8) + '.bak')
+        try:
+            os.link(path,backup)
+            return backup
+        except FileExistsError:
+            continue
+        except OSError:
+            break
+
+    fd,backup = tempfile.mkstemp(dir=dirname,prefix=prefix,suffix='.bak')
+
+    try:
+        with os.fdopen(fd,'wb') as dst, open(path,'rb') as src:
+            shutil.copyfileobj(src,dst)
+        shutil.copystat(path,backup)
+    except BaseException:
+        os.remove(backup)
+        raise
+
+    return backup
+
+
+class Transaction(object):
+    '''
+    mod的批量修改事务，通过getini、getinis和newini取得的ini被事务跟踪
+    commit只写入dirty为True的ini和新建的ini：先以workers个线程把内容写入同一文件夹下的临时文件，
+    全部成功后逐个以os.replace替换原文件；任何一步失败都会恢复已替换的文件并删除临时文件
+    作为with语句使用时，正常结束则提交，抛出异常则回滚(不写入任何文件)
+    minimal为True时读取的ini保留源，写入时未修改的字节原样保留(参见Ini.write)，此时不使用mod的解析缓存
+    '''
+    def __init__(self,mod: Mod,workers: Optional[int] = None,minimal: bool = True):
+        check(mod,Mod)
+        self.__mod: Mod = mod
+        self.__minimal: bool = minimal
+        self.__workers: int = (os.cpu_count() or 1) * 4 if workers is None else max(workers,1)
+        self.__inis: Dict[str,Ini] = {}
+        self.__new: Set[str] = set()
+        self.__closed: bool = False
+
+
+    def __check(self) -> NoReturn:
+        if self.__closed:
+            raise TransactionClosedError('事务已回滚')
+
+
+    def getini(self,inifile: str) -> Optional[Ini]:
+        '''
+        读取mod中的指定ini并跟踪其修改，同一文件总是返回同一对象
+        抛出IniSyntaxError
+        '''
+        check(inifile,str)
+        self.__check()
+        relpath: Optional[str] = self.__mod.getfile(inifile)
+
+        if relpath is None:
+            relpath = os.path.normpath(inifile)
+            return self.__inis.get(relpath) if relpath in self.__new else None
+
+        ini: Optional[Ini] = self.__inis.get(relpath)
+
+        if ini is None:
+            ini = self.__load(relpath)
+            if ini is not None:
+                self.__inis[relpath] = ini
+
+        return ini
+
+
+    def __load(self,relpath: str) -> Optional[Ini]:
+        '''读取ini，编码错误时返回None'''
+        if not self.__minimal:
+            return self.__mod.getini(relpath)
+
+        try:
+            with open(os.path.join(self.__mod.dir,relpath),'r',encoding='utf-8',newline='') as f:
+                return Ini.create_ini(f.read(),os.path.basename(relpath),keep_source=True)
+        except UnicodeDecodeError:
+            return None
+
+
+    def getinis(self,dir: Optional[str] = None) -> List[Ini]:
+        '''
+        读取mod下某一文件夹下全部ini并跟踪其修改，跳过无法按UTF-8解码的文件
+        抛出IniSyntaxError
+        '''
+        root: str = self.__mod.dir
+        inis: List[Ini] = []
+
+        for path in self.__mod.getfiles(dir):
+            if not os.path.splitext(path)[1].lower() in not_ini_list:
+                ini: Optional[Ini] = self.getini(os.path.relpath(path,root))
+                if ini is not None:
+                    inis.append(ini)
+
+        return inis
+
+
+    def newini(self,relpath: str,content: str = '') -> Ini:
+        '''
+        新建ini，提交时写入
+        抛出IniSyntaxError
+        '''
+        check(relpath,str)
+        self.__check()
+        relpath = os.path.normpath(relpath)
+        ini: Ini = Ini.create_ini(content,os.path.basename(relpath),keep_source=self.__minimal)
+        self.__inis[relpath] = ini
+        self.__new.add(relpath)
+        return ini
+
+
+    @property
+    def dirty(self) -> List[str]:
+        '''提交时将写入的文件，相对于mod根目录'''
+        return sorted(relpath for relpath,ini in self.__inis.items() if relpath in self.__new or ini.dirty)
+
+
+    def commit(self) -> List[str]:
+        '''
+        写入修改过的ini，返回写入的文件；提交后可以继续修改并再次提交
+        抛出IOError和TransactionClosedError异常
+        '''
+        self.__check()
+        root: str = self.__mod.dir
+        targets: List[Tuple[str,str,Ini]] = [(relpath,os.path.join(root,relpath),self.__inis[relpath])
+        for relpath in self.dirty]
+
+        if len(targets) == 0:
+            return []
+
+        temps: List[Optional[str]] = [None] * len(targets)
+
+        try:
+            with ThreadPoolExecutor(min(self.__workers,len(targets))) as pool:
+                futures = [pool.submit(_write_temp,path,ini) for relpath,path,ini in targets]
+
+            # 全部写入结束后才检查错误，使成功写入的临时文件都能被删除
+            for i,future in enumerate(futures):
+                if future.exception() is None:
+                    temps[i] = future.result()
+
+            for future in futures:
+                if future.exception() is not None:
+                    raise future.exception()
+
+            self.__replace(targets,temps)
+
+        except BaseException:
+            for tmp in temps:
+                if tmp is not None and os.path.exists(tmp):
+                    os.remove(tmp)
+            raise
+
+        for relpath,path,ini in targets:
+            ini.mark_clean()
+            self.__new.discard(relpath)
+
+        return [relpath for relpath,path,ini in targets]
+
+
+    def __replace(self,targets: List[Tuple[str,str,Ini]],temps: List[str]) -> NoReturn:
+        '''以临时文件替换原文件，失败时恢复已替换的文件'''
+        done: List[Tuple[str,Optional[str]]] = []
+        backups: List[Optional[str]] = []
+
+        try:
+            for (relpath,path,ini),tmp in zip(targets,temps):
+                backup: Optional[str] = _backup(path)
+                backups.append(backup)
+                os.replace(tmp,path)
+                done.append((path,backup))
+
+        except BaseException:
+            for path,backup in reversed(done):
+                if backup is None:
+                    os.remove(path)
+                else:
+                    os.replace(backup,path)
+            for backup in backups[len(done):]:
+                if backup is not None:
+                    os.remove(backup)
+            raise
+
+        for backup in backups:
+            if backup is not None:
+                os.remove(backup)
+
+
+    def rollback(self) -> NoReturn:
+        '''放弃全部修改，不写入任何文件；此后事务不可再使用，已取得的ini对象保留修改后的内容'''
+        self.__inis.clear()
+        self.__new.clear()
+        self.__closed = True
+
+
+    def __enter__(self):
+        self.__check()
+        return self
+
+
+    def __exit__(self,exc_type,exc_value,traceback) -> bool:
+        if exc_type is None:
+            self.commit()
+        else:
+            self.rollback()
+        return False
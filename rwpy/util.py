@@ -1,14 +1,11 @@
 import json
-from functools import reduce
 from typing import List,Tuple,Callable,Any,Type
 from abc import ABC, abstractmethod
 
 
 def connect_strs(strs: List[str],sep: str = '\n') -> str:
     '''链接一个list中的所有对象作为一个字符串'''
-    if len(strs) == 0:
-        return ''
-    return reduce(lambda x,y: x + '\n' + y,map(lambda x: str(x),strs))
+    return sep.join(map(str,strs))
 
 def filterl(func: Callable[[Any],bool],lst: list) -> list:
     '''filter，但返回list'''
@@ -21,12 +18,12 @@ def check(obj: object,type: Type,message: str = '参数类型错误'):
         raise TypeError(message)
 
 
-def CodeList(object):
+class CodeList(object):
     '''代码表'''
     def __init__(self,codelist_src: dict):
         check(codelist_src,dict)
         self.__src = codelist_src
-        self.__namecheck = map(lambda x: (x['key'],x['section']),codelist_src['attributes'])
+        self.__namecheck = list(map(lambda x: (x['key'],x['section']),codelist_src['attributes']))
     
     
     @property
@@ -66,7 +63,7 @@ def load_codelist(filename: str = 'codelist.json') -> dict:
     '''加载代码表(json格式),开发中'''
     codelist:dict = {}
     #try:
-    with open(filename,'r') as f:
+    with open(filename,'r',encoding='utf-8') as f:
         codelist = json.loads(f.read())
     #except IOError:
     return codelist
\ No newline at end of file
@@ -0,0 +1,222 @@
+'''
+按代码表中的值类型解码属性值
+'''
+import math
+import os
+import re
+from array import array
+from typing import Callable,Dict,Iterable,List,NoReturn,Optional,Tuple,Union
+
+from rwpy.codelist import Validator
+from rwpy.util import check
+
+
+CODELIST_DEFAULT: str = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))),'ncodelist.json')
+
+_COLOR = re.compile(r'#([0-9a-fA-F]{6}|[0-9a-fA-F]{8})')
+_WHITESPACE = re.compile(r'\s+')
+
+_codelist: Optional[Validator] = None
+
+
+def to_int(value: str) -> int:
+    return int(value.strip())
+
+
+def to_float(value: str) -> float:
+    return float(value.strip())
+
+
+def to_time(value: str) -> float:
+    '''时间，单位为秒，可以带s后缀'''
+    value = value.strip()
+    if value.endswith('s'):
+        value = value[:-1]
+    return float(value)
+
+
+def to_bool(value: str) -> bool:
+    value = value.strip().lower()
+    if value == 'true':
+        return True
+    if value == 'false':
+        return False
+    raise ValueError('不是布尔值 -> ' + value)
+
+
+def to_color(value: str) -> Tuple[int,int,int,int]:
+    '''#RRGGBB或#AARRGGBB，返回(r,g,b,a)'''
+    match = _COLOR.fullmatch(value.strip())
+    if match is None:
+        raise ValueError('不是颜色 -> ' + value)
+    digits: str = match.group(1)
+    if len(digits) == 6:
+        digits = 'ff' + digits
+    a,r,g,b = (int(digits[i:i + 2],16) for i in range(0,8,2))
+    return (r,g,b,a)
+
+
+def to_point(value: str) -> Tuple[float,float]:
+    '''x,y，可以带括号'''
+    parts: List[str] = value.strip().strip('()').split(',')
+    if len(parts) != 2:
+        raise ValueError('不是坐标 -> ' + value)
+    return (float(parts[0]),float(parts[1]))
+
+
+def to_strs(value: str) -> List[str]:
+    '''以逗号分隔的列表'''
+    return [x.strip() for x in value.split(',') if x.strip() != '']
+
+
+def to_ints(value: str) -> List[int]:
+    return [int(x) for x in to_strs(value)]
+
+
+def _either(first: Callable[[str],object]) -> Callable[[str],object]:
+    '''能解码为first时解码，否则保留字符串'''
+    def decode(value: str) -> object:
+        try:
+            return first(value)
+        except ValueError:
+            return value
+    return decode
+
+
+def _same(value: str) -> str:
+    return value
+
+
+# 值类型(小写并去掉空白) -> 解码函数，未列出的类型保留字符串
+DECODERS: Dict[str,Callable[[str],object]] = {
+'int': to_int,
+'float': to_float,
+'float/s': to_float,
+'float/time': to_float,
+'time': to_time,
+'time(seconds)': to_time,
+'bool': to_bool,
+'boolean': to_bool,
+'color': to_color,
+'point': to_point,
+'intlist': to_ints,
+'ints': to_ints,
+'int/string': _either(to_int),
+'bool/string': _either(to_bool),
+'bool/effect': _either(to_bool),
+'list': to_strs,
+'string(s)': to_strs,
+'strings(s)': to_strs,
+'unitlist': to_strs,
+'units': to_strs,
+'unittypes': to_strs,
+'taglist': to_strs,
+'tags': to_strs,
+'actions': to_strs,
+'actionids': to_strs,
+'actionrefs': to_strs,
+'effects': to_strs,
+'effect(s)ref': to_strs,
+'effectreflist': to_strs,
+'preseteffects': to_strs,
+'movementtypes': to_strs,
+'sound(s)': to_strs,
+'file(s)(ini)': to_strs
+}
+
+# 按列解码时放入array('d')的类型
+NUMERIC: Tuple[str,...] = ('int','float','float/s','float/time','time','time(seconds)','bool','boolean')
+
+
+def normalize_type(value_type: str) -> str:
+    '''值类型的规范形式：小写并去掉空白'''
+    return _WHITESPACE.sub('',value_type).lower()
+
+
+def decoder(value_type: Optional[str]) -> Callable[[str],object]:
+    '''值类型对应的解码函数'''
+    if value_type is None:
+        return _same
+    return DECODERS.get(normalize_type(value_type),_same)
+
+
+def decode(value: str,value_type: Optional[str]) -> object:
+    '''
+    按值类型解码，未知类型返回原字符串
+    抛出ValueError
+    '''
+    check(value,str)
+    return decoder(value_type)(value)
+
+
+def get_codelist() -> Validator:
+    '''
+    类型查询使用的代码表，默认在第一次使用时由CODELIST_DEFAULT的预编译形式(参见rwpy.compiled)构建，不解析json
+    抛出IOError异常
+    '''
+    global _codelist
+    if _codelist is None:
+        from rwpy import compiled
+        _codelist = compiled.load(CODELIST_DEFAULT).validator
+    return _codelist
+
+
+def set_codelist(codelist: Optional[Validator]) -> NoReturn:
+    '''替换类型查询使用的代码表，None表示恢复默认'''
+    global _codelist
+    if codelist is not None:
+        check(codelist,Validator)
+    _codelist = codelist
+
+
+def lookup_type(sec_name: Optional[str],key: str) -> Optional[str]:
+    '''代码的值类型，sec_name为None时只按代码名查找'''
+    if sec_name is None:
+        return get_codelist().key_type(key)
+    return get_codelist().value_type(sec_name,key)
+
+
+def decode_column(attrs: Iterable,value_type: Optional[str]) -> Union[array,list]:
+    '''
+    一次解码一列属性(可以含None)
+    数字和布尔类型返回array('d')，缺失或无法解码的位置为nan；其他类型返回list，对应位置为None
+    '''
+    numeric: bool = value_type is not None and normalize_type(value_type) in NUMERIC
+
+    if numeric:
+        result = array('d')
+        missing = math.nan
+    else:
+        result = []
+        missing = None
+
+    for attr in attrs:
+        if attr is None:
+            result.append(missing)
+            continue
+        try:
+            result.append(attr.get_typed(value_type))
+        except ValueError:
+            result.append(missing)
+
+    return result
+
+
+def column(inis: Iterable,sec_name: str,key: str,value_type: Optional[str] = None) -> Union[array,list]:
+    '''
+    取出每个ini中指定段落下指定代码的属性并按列解码，参见decode_column
+    value_type为None时按代码表查找
+    '''
+    check(sec_name,str)
+    check(key,str)
+
+    if value_type is None:
+        value_type = lookup_type(sec_name,key)
+
+    attrs: List = []
+
+    for ini in inis:
+        sec = getattr(ini,sec_name)
+        attrs.append(None if sec is None else sec[key])
+
+    return decode_column(attrs,value_type)
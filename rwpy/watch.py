@@ -0,0 +1,389 @@
+'''
+监视mod文件夹，增量重新解析变化的ini
+'''
+import ctypes
+import ctypes.util
+import os
+import select
+import struct
+import threading
+import time
+from typing import Callable,Dict,List,NamedTuple,NoReturn,Optional,Set,Tuple
+
+from rwpy.code import IIni
+from rwpy.diff import ADDED,CHANGED,REMOVED
+from rwpy.errors import RWPYError
+from rwpy.mod import IMod,not_ini_list
+from rwpy.util import check
+
+
+INTERVAL_DEFAULT: float = 1.0
+DEBOUNCE_DEFAULT: float = 0.2
+
+_IN_MODIFY = 0x2
+_IN_ATTRIB = 0x4
+_IN_CLOSE_WRITE = 0x8
+_IN_MOVED_FROM = 0x40
+_IN_MOVED_TO = 0x80
+_IN_CREATE = 0x100
+_IN_DELETE = 0x200
+_IN_DELETE_SELF = 0x400
+# 内核的事件队列溢出，之后的事件已丢失；总是报告，wd为-1
+_IN_Q_OVERFLOW = 0x4000
+_IN_IGNORED = 0x8000
+_IN_ISDIR = 0x40000000
+_IN_MASK = _IN_MODIFY | _IN_ATTRIB | _IN_CLOSE_WRITE | _IN_MOVED_FROM | _IN_MOVED_TO | _IN_CREATE | _IN_DELETE \
+| _IN_DELETE_SELF
+_EVENT = struct.Struct('iIII')
+
+
+class Change(NamedTuple):
+    '''
+    一个文件的变化，path为相对于mod根目录的路径
+    ini为重新解析的结果，删除的文件和非ini文件为None；解析失败时error为对应的异常
+    '''
+    kind: str
+    path: str
+    ini: Optional[IIni]
+    error: Optional[Exception]
+
+
+Subscriber = Callable[[List[Change]],None]
+
+
+class _Inotify(object):
+    '''通过ctypes使用Linux的inotify，不可用时构造函数抛出OSError'''
+    def __init__(self):
+        name: Optional[str] = ctypes.util.find_library('c')
+        libc = ctypes.CDLL(name if name is not None else 'libc.so.6',use_errno=True)
+
+        if not hasattr(libc,'inotify_init1'):
+            raise OSError('inotify不可用')
+
+        self.__libc = libc
+        self.fd: int = libc.inotify_init1(os.O_NONBLOCK | os.O_CLOEXEC)
+
+        if self.fd < 0:
+            raise OSError(ctypes.get_errno(),'inotify_init1失败')
+
+        self.__dirs: Dict[int,str] = {}
+
+
+    def add(self,reldir: str,path: str) -> NoReturn:
+        wd: int = self.__libc.inotify_add_watch(self.fd,os.fsencode(path),_IN_MASK)
+        if wd >= 0:
+            self.__dirs[wd] = reldir
+
+
+    def read(self,timeout: Optional[float]) -> List[Tuple[str,str,int]]:
+        '''等待最多timeout秒，返回(所在文件夹,名称,事件)'''
+        ready = select.select([self.fd],[],[],timeout)[0]
+        events: List[Tuple[str,str,int]] = []
+
+        if len(ready) == 0:
+            return events
+
+        try:
+            data: bytes = os.read(self.fd,64 * 1024)
+        except BlockingIOError:
+            return events
+
+        return self.parse(data)
+
+
+    def parse(self,data: bytes) -> List[Tuple[str,str,int]]:
+        '''解析读取到的事件；队列溢出时产生('','',_IN_Q_OVERFLOW)，表示需要重新检查全部文件'''
+        events: List[Tuple[str,str,int]] = []
+        pos: int = 0
+
+        while pos < len(data):
+            wd,mask,cookie,length = _EVENT.unpack_from(data,pos)
+            name: str = os.fsdecode(data[pos + _EVENT.size:pos + _EVENT.size + length].rstrip(b'\0'))
+            pos += _EVENT.size + length
+
+            if mask & _IN_Q_OVERFLOW:
+                events.append(('','',_IN_Q_OVERFLOW))
+                continue
+
+            if mask & _IN_IGNORED:
+                self.__dirs.pop(wd,None)
+                continue
+
+            reldir: Optional[str] = self.__dirs.get(wd)
+
+            if reldir is not None:
+                events.append((reldir,name,mask))
+
+        return events
+
+
+    def close(self) -> NoReturn:
+        if self.fd >= 0:
+            os.close(self.fd)
+            self.fd = -1
+
+
+class Watcher(object):
+    '''
+    监视mod某一文件夹下的文件，报告新增、修改、删除的文件，只重新解析变化的ini
+    backend为'inotify'、'poll'或'auto'(inotify可用时使用inotify，否则每interval秒按修改时间轮询)
+    连续的修改在debounce秒内没有新变化后合并为一次通知；后台线程反复调用step，也可以不启动线程而直接调用
+    inotify的事件队列溢出(如git checkout、解压mod时大量修改)时重新监视全部文件夹并按修改时间比较全部文件
+    订阅者以变化的列表为参数调用；后台线程中订阅者抛出的异常保存在last_error中
+    mod的文件索引由mod自身加锁，后台线程与其他线程可以同时使用同一个mod
+    '''
+    def __init__(self,mod: IMod,dir: Optional[str] = None,interval: float = INTERVAL_DEFAULT,
+    debounce: float = DEBOUNCE_DEFAULT,backend: str = 'auto'):
+        check(mod,IMod)
+
+        if not backend in ('auto','inotify','poll'):
+            raise ValueError('backend只能为auto、inotify或poll')
+
+        self.__mod: IMod = mod
+        self.__dir: str = '' if dir is None else os.path.normpath(dir)
+        self.__interval: float = interval
+        self.__debounce: float = debounce
+        self.__subscribers: List[Subscriber] = []
+        self.__lock: threading.RLock = threading.RLock()
+        self.__thread: Optional[threading.Thread] = None
+        self.__stopped: threading.Event = threading.Event()
+        self.__inotify: Optional[_Inotify] = None
+        self.last_error: Optional[BaseException] = None
+
+        if backend != 'poll':
+            try:
+                self.__inotify = _Inotify()
+            except (OSError,AttributeError):
+                if backend == 'inotify':
+                    raise
+
+        self.__snapshot: Dict[str,Tuple[int,int]] = self.__state()
+        # step的状态：等待合并通知的文件、最后一次发现变化的时间、轮询时上次看到的状态
+        self.__queued: Set[str] = set()
+        # inotify队列溢出，丢失了事件，下次通知时重新检查全部文件
+        self.__rescan: bool = False
+        self.__last: float = 0.0
+        self.__seen: Dict[str,Tuple[int,int]] = self.__snapshot.copy()
+
+        if self.__inotify is not None:
+            self.__watch(self.__dir)
+
+
+    @property
+    def backend(self) -> str:
+        return 'poll' if self.__inotify is None else 'inotify'
+
+
+    @property
+    def files(self) -> List[str]:
+        '''当前已知的文件'''
+        return sorted(self.__snapshot)
+
+
+    def subscribe(self,subscriber: Subscriber) -> Subscriber:
+        '''添加订阅者，返回subscriber'''
+        with self.__lock:
+            self.__subscribers.append(subscriber)
+        return subscriber
+
+
+    def unsubscribe(self,subscriber: Subscriber) -> NoReturn:
+        with self.__lock:
+            self.__subscribers.remove(subscriber)
+
+
+    def __inside(self,relpath: str) -> bool:
+        return self.__dir in ('','.') or relpath == self.__dir or relpath.startswith(self.__dir + os.sep)
+
+
+    def __stat(self,relpath: str) -> Optional[Tuple[int,int]]:
+        try:
+            stat = os.stat(os.path.join(self.__mod.dir,relpath))
+        except OSError:
+            return None
+        return (stat.st_mtime_ns,stat.st_size)
+
+
+    def __state(self) -> Dict[str,Tuple[int,int]]:
+        '''由mod的文件索引(按文件夹修改时间增量更新)得到全部文件的修改时间和大小'''
+        root: str = self.__mod.dir
+        state: Dict[str,Tuple[int,int]] = {}
+
+        for path in self.__mod.getfiles(None if self.__dir in ('','.') else self.__dir):
+            relpath: str = os.path.relpath(path,root)
+            stat: Optional[Tuple[int,int]] = self.__stat(relpath)
+            if stat is not None:
+                state[relpath] = stat
+
+        return state
+
+
+    def __watch(self,reldir: str) -> List[str]:
+        '''监视一个文件夹及其子文件夹，返回其中的文件'''
+        files: List[str] = []
+        root: str = self.__mod.dir
+
+        for path,dirs,names in os.walk(os.path.join(root,reldir)):
+            current: str = os.path.relpath(path,root)
+            self.__inotify.add('' if current == '.' else current,path)
+            files += [os.path.normpath(os.path.join(current,name)) for name in names]
+
+        return files
+
+
+    def __diff(self,paths: Optional[Set[str]] = None) -> List[Change]:
+        '''比较paths(None表示全部文件)当前的状态与快照，更新快照并重新解析变化的ini'''
+        if paths is None:
+            state: Dict[str,Tuple[int,int]] = self.__state()
+            paths = set(state) | set(self.__snapshot)
+        else:
+            state = {}
+            for relpath in paths:
+                stat: Optional[Tuple[int,int]] = self.__stat(relpath)
+                if stat is not None and os.path.isfile(os.path.join(self.__mod.dir,relpath)):
+                    state[relpath] = stat
+
+        changes: List[Change] = []
+
+        for relpath in sorted(paths):
+            old: Optional[Tuple[int,int]] = self.__snapshot.get(relpath)
+            new: Optional[Tuple[int,int]] = state.get(relpath)
+
+            if old == new:
+                continue
+
+            if new is None:
+                del self.__snapshot[relpath]
+                changes.append(Change(REMOVED,relpath,None,None))
+                continue
+
+            self.__snapshot[relpath] = new
+            ini: Optional[IIni] = None
+            error: Optional[Exception] = None
+
+            if not os.path.splitext(relpath)[1].lower() in not_ini_list:
+                try:
+                    ini = self.__mod.getini(relpath)
+                except (RWPYError,OSError) as e:
+                    error = e
+
+            changes.append(Change(ADDED if old is None else CHANGED,relpath,ini,error))
+
+        return changes
+
+
+    def __notify(self,changes: List[Change]) -> NoReturn:
+        with self.__lock:
+            subscribers: List[Subscriber] = self.__subscribers[:]
+        for subscriber in subscribers:
+            subscriber(changes)
+
+
+    def poll(self) -> List[Change]:
+        '''立即检查全部文件并通知订阅者，返回变化'''
+        with self.__lock:
+            changes: List[Change] = self.__diff()
+        if len(changes) > 0:
+            self.__notify(changes)
+        return changes
+
+
+    def __dirty(self,events: List[Tuple[str,str,int]],dirty: Set[str]) -> NoReturn:
+        '''将inotify事件转换为需要检查的文件'''
+        for reldir,name,mask in events:
+            if mask & _IN_Q_OVERFLOW:
+                self.__rescan = True
+                continue
+
+            relpath: str = os.path.normpath(os.path.join(reldir,name)) if name else reldir
+
+            if mask & _IN_DELETE_SELF:
+                dirty.update(path for path in self.__snapshot if path.startswith(relpath + os.sep))
+            elif mask & _IN_ISDIR:
+                if mask & (_IN_CREATE | _IN_MOVED_TO):
+                    dirty.update(self.__watch(relpath))
+                if mask & (_IN_DELETE | _IN_MOVED_FROM):
+                    dirty.update(path for path in self.__snapshot if path.startswith(relpath + os.sep))
+            elif self.__inside(relpath):
+                dirty.add(relpath)
+
+
+    def step(self,timeout: float = 0.0) -> List[Change]:
+        '''
+        检查一次变化：使用inotify时最多等待timeout秒的事件，否则等待timeout秒后按修改时间比较全部文件
+        发现的变化在debounce秒内没有新变化后合并通知订阅者并返回，尚未通知时返回空列表
+        '''
+        if self.__inotify is not None:
+            events: List[Tuple[str,str,int]] = self.__inotify.read(timeout)
+            with self.__lock:
+                if len(events) > 0:
+                    self.__dirty(events,self.__queued)
+                    self.__last = time.monotonic()
+        else:
+            if timeout > 0:
+                self.__stopped.wait(timeout)
+            with self.__lock:
+                state: Dict[str,Tuple[int,int]] = self.__state()
+                seen: Dict[str,Tuple[int,int]] = self.__seen
+                if state != seen:
+                    self.__queued.update(set(state) ^ set(seen))
+                    self.__queued.update(path for path in state if state[path] != seen.get(path,state[path]))
+                    self.__seen = state
+                    self.__last = time.monotonic()
+
+        with self.__lock:
+            if not (self.__queued or self.__rescan) or time.monotonic() - self.__last < self.__debounce:
+                return []
+            if self.__rescan:
+                # 溢出期间新建的文件夹还没有被监视
+                self.__watch(self.__dir)
+                changes: List[Change] = self.__diff()
+                self.__rescan = False
+            else:
+                changes = self.__diff(self.__queued)
+            self.__queued = set()
+
+        if len(changes) > 0:
+            self.__notify(changes)
+        return changes
+
+
+    def __run(self) -> NoReturn:
+
+        while not self.__stopped.is_set():
+            try:
+                self.step(self.__debounce if self.__queued or self.__rescan else self.__interval)
+            except Exception as e:
+                self.last_error = e
+
+
+    def start(self) -> 'Watcher':
+        '''在后台线程中开始监视'''
+        if self.__thread is None:
+            self.__stopped.clear()
+            self.__thread = threading.Thread(target=self.__run,name='rwpy-watch',daemon=True)
+            self.__thread.start()
+        return self
+
+
+    def stop(self) -> NoReturn:
+        '''停止监视'''
+        if self.__thread is not None:
+            self.__stopped.set()
+            self.__thread.join()
+            self.__thread = None
+
+
+    def close(self) -> NoReturn:
+        self.stop()
+        if self.__inotify is not None:
+            self.__inotify.close()
+            self.__inotify = None
+
+
+    def __enter__(self):
+        return self.start()
+
+
+    def __exit__(self,*args) -> NoReturn:
+        self.close()
@@ -1,9 +1,35 @@
 import unittest
 import os
 import shutil
+import io
+import ntpath
+import pathlib
+import posixpath
+import tempfile
+import zipfile
 
 from rwpy.code import Ini,Section,Attribute,Element,parse_list,to_list
-from rwpy.mod import IMod,Mod,mkmod,rmmod
+from rwpy.mod import IMod,Mod,ArchiveMod,mkmod,rmmod,openmod
+from rwpy.errors import IniSyntaxError,SectionNotExistedError
+from rwpy.parser import iter_events
+import rwpy.parser as parser
+from rwpy.lazy import LazyIni
+from rwpy.codelist import Validator
+from rwpy.resolver import CopyFromResolver
+from rwpy.errors import CopyFromError
+from rwpy.index import ModIndex
+import rwpy.values as values
+from rwpy.columns import read_npy
+from rwpy.watch import Watcher,ADDED,CHANGED,REMOVED
+import rwpy.watch as watch
+from rwpy.diff import diff
+from rwpy.util import CodeList,load_codelist
+import rwpy.compiled as compiled
+from rwpy.completion import CompletionIndex
+from rwpy.lsp import Document,Server,path_to_uri,uri_to_path,read_message,write_message
+import io
+import benchmarks
+from benchmarks.generate import generate_mod,generate_texts,unit_path
 
 class Test(unittest.TestCase):
     def test_parser(self):
@@ -42,6 +68,881 @@ class Test(unittest.TestCase):
                 self.assertEqual(ini.sections[i].elements[j],ini.sections[i].elements[j])
 
 
+    def test_create_ini_linenum(self):
+
+        ex: str = "[core]\nname: a\ndesc: \"\"\"\nx\ny\n\"\"\"\n\n[attack]\nmaxAttackRange:400"
+        ini: Ini = Ini.create_ini(ex)
+        self.assertEqual(ini.core.linenum,1)
+        self.assertEqual(ini.core['desc'].value,'\"\"\"\nx\ny\n\"\"\"')
+        self.assertEqual(ini.core['desc'].linenum,3)
+        self.assertEqual(ini.core.elements[-1].linenum,7)
+        self.assertEqual(ini.attack.linenum,8)
+        self.assertEqual(ini.attack['maxAttackRange'].linenum,9)
+        self.assertRaises(IniSyntaxError,Ini.create_ini,'[core]\ndesc: \"\"\"\nabc')
+
+
+    def test_iter_events(self):
+
+        ex: str = "#abc\n[core]\nimage: a.png\ndef:\"\"\"\naz\n\"\"\""
+        events = list(iter_events(io.BytesIO(ex.encode('utf-8')),chunk_size=3))
+        self.assertEqual([e.kind for e in events],[parser.COMMENT,parser.SECTION,parser.ATTRIBUTE,parser.MULTILINE])
+        self.assertEqual((events[2].key,events[2].value,events[2].linenum),('image','a.png',3))
+        self.assertEqual((events[3].linenum,events[3].endline),(4,6))
+        self.assertEqual(events,list(iter_events(ex)))
+        # 与str.split('\n')一致，\r不分行
+        raw: str = '[core]\r\nname: a\rb\r\ndesc: 单位\r'
+        for size in (1,2,64):
+            self.assertEqual(list(parser.iter_lines(io.BytesIO(raw.encode('utf-8')),size)),raw.split('\n'))
+        self.assertEqual(Ini.from_stream(io.BytesIO(raw.encode('utf-8'))).core['name'].value,'a\rb')
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp,'a.ini')
+            with open(path,'wb') as f:
+                f.write(raw.encode('utf-8'))
+            self.assertEqual(list(parser.iter_lines(pathlib.Path(path))),raw.split('\n'))
+
+
+    def test_lazy_ini(self):
+
+        ex: str = "#abc\r\n[core]\r\nprice: 100\r\ndesc: \"\"\"\r\n[fake]\r\n\"\"\"\r\n[attack]\r\nmaxAttackRange:400"
+        ini: Ini = Ini.create_ini(ex.replace('\r\n','\n'))
+        lazy: LazyIni = LazyIni('lazy.ini',ex.encode('utf-8'))
+        self.assertEqual(lazy.core['price'].value,'100')
+        self.assertEqual(lazy.attack['maxAttackRange'].linenum,8)
+        self.assertIsNone(lazy.fake)
+        self.assertFalse(lazy.materialized)
+        self.assertEqual(bytes(lazy.section_source('attack')),b'[attack]\r\nmaxAttackRange:400')
+        self.assertEqual(str(lazy),str(ini))
+        stream = io.StringIO()
+        ini.write_to(stream)
+        self.assertEqual(stream.getvalue(),str(ini))
+        self.assertEqual(str(ini),'#abc\n[core]\nprice: 100\ndesc: \"\"\"\n[fake]\n\"\"\"\n[attack]\nmaxAttackRange: 400')
+        self.assertTrue(lazy.materialized)
+        # memoryview缓冲区与bytes结果一致
+        view: LazyIni = LazyIni('lazy.ini',memoryview(b'#' * 300 + ex.encode('utf-8'))[300:])
+        self.assertEqual(view.attack['maxAttackRange'].linenum,8)
+        self.assertEqual(bytes(view.section_source('attack')),b'[attack]\r\nmaxAttackRange:400')
+        self.assertEqual(str(view),str(ini))
+        self.assertEqual(str(LazyIni('lazy.ini',memoryview(b'[core]\rname: a'))),str(Ini.create_ini('[core]\nname: a')))
+
+
+    def test_index(self):
+
+        ini: Ini = Ini.create_ini("[core]\nprice: 1\nname: a\nprice: 2\n[attack]\nx: 1\n[core]\nprice: 3")
+        self.assertEqual(ini.core['price'].value,'2')
+        self.assertEqual(ini.get_section('core')['price'].value,'3')
+        ini.core.remove_attribute('price')
+        self.assertIsNone(ini.core['price'])
+        self.assertEqual(ini.core['name'].linenum,3)
+        ini.core.insert(Attribute('price','4'),'name')
+        self.assertEqual(str(ini.core.elements[-1]),'price: 4')
+        ini.core['name'].key = 'title'
+        self.assertIsNone(ini.core['name'])
+        self.assertEqual(ini.core['title'].value,'a')
+        ini.attack.name = 'defence'
+        self.assertIsNone(ini.attack)
+        self.assertEqual(ini.defence['x'].value,'1')
+        ini.sections.append(Section('movement'))
+        self.assertIsNotNone(ini.movement)
+        ini.insert_section(Section('graphics'),'defence')
+        self.assertEqual([sec.name for sec in ini.sections],['core','graphics','defence','core','movement'])
+        self.assertTrue(ini.remove('core'))
+        self.assertEqual(ini.core['price'].value,'3')
+        self.assertRaises(SectionNotExistedError,ini.insert_section,Section('a'),'nothing')
+        # 属性键和段落名的修改只通知所属的段落和ini，同一属性可以属于多个段落
+        other: Ini = Ini.create_ini('[core]\nprice: 1')
+        shared: Attribute = other.core['price']
+        copy: Section = Section('copy')
+        copy.append(shared)
+        self.assertIs(copy['price'],shared)
+        shared.key = 'cost'
+        self.assertIsNone(other.core['price'])
+        self.assertIs(copy['cost'],shared)
+        self.assertIs(other.core['cost'],shared)
+        other.core.name = 'base'
+        self.assertIsNone(other.core)
+        self.assertEqual(ini.defence['x'].value,'1')
+
+
+    def test_parse_cache(self):
+
+        with tempfile.TemporaryDirectory() as tmp:
+            moddir = os.path.join(tmp,'mod')
+            mkmod(moddir)
+            with open(os.path.join(moddir,'unit.ini'),'w',encoding='utf-8') as f:
+                f.write('[core]\nprice: 100')
+            cached: Mod = Mod(moddir,cache_dir=os.path.join(tmp,'cache'))
+            self.assertEqual(cached.getini('unit.ini').core['price'].value,'100')
+            self.assertEqual((cached.cache.hits,cached.cache.misses),(0,1))
+            warm: Mod = Mod(moddir,cache_dir=os.path.join(tmp,'cache'))
+            ini = warm.getini('unit.ini')
+            self.assertEqual((warm.cache.hits,warm.cache.misses),(1,0))
+            self.assertEqual((ini.filename,ini.core['price'].linenum),('unit.ini',2))
+            with open(os.path.join(moddir,'unit.ini'),'w',encoding='utf-8') as f:
+                f.write('[core]\nprice: 2000')
+            self.assertEqual(warm.getini('unit.ini').core['price'].value,'2000')
+            self.assertEqual(warm.cache.misses,1)
+            # 大小和修改时间都不变的改动：条目写入时文件刚修改过，由内容哈希发现
+            mtime = os.stat(os.path.join(moddir,'unit.ini')).st_mtime_ns
+            with open(os.path.join(moddir,'unit.ini'),'w',encoding='utf-8') as f:
+                f.write('[core]\nprice: 3000')
+            os.utime(os.path.join(moddir,'unit.ini'),ns=(mtime,mtime))
+            self.assertEqual(warm.getini('unit.ini').core['price'].value,'3000')
+            self.assertEqual(warm.cache.misses,2)
+            # 早已修改的文件只比较大小和修改时间
+            os.utime(os.path.join(moddir,'unit.ini'),ns=(mtime - 10 ** 10,mtime - 10 ** 10))
+            self.assertEqual(warm.getini('unit.ini').core['price'].value,'3000')
+            self.assertEqual(warm.getini('unit.ini').core['price'].value,'3000')
+            self.assertEqual((warm.cache.hits,warm.cache.misses),(3,2))
+            # 只清理缓存自己目录中的旧版本，缓存目录中其他的数据不受影响
+            os.makedirs(os.path.join(tmp,'cache','v1.0'))
+            os.makedirs(os.path.join(tmp,'cache','rwpy-parse-cache','v0.0'))
+            Mod(moddir,cache_dir=os.path.join(tmp,'cache'))
+            self.assertTrue(os.path.isdir(os.path.join(tmp,'cache','v1.0')))
+            self.assertFalse(os.path.isdir(os.path.join(tmp,'cache','rwpy-parse-cache','v0.0')))
+
+
+    def test_mod_index(self):
+
+        with tempfile.TemporaryDirectory() as tmp:
+            moddir = os.path.join(tmp,'mod')
+            mkmod(moddir)
+            os.makedirs(os.path.join(moddir,'units','tanks'))
+            with open(os.path.join(moddir,'units','tanks','Tank.ini'),'w',encoding='utf-8') as f:
+                f.write('[core]\nname: tank')
+            mymod: Mod = Mod(moddir)
+            self.assertEqual(mymod.getfile(os.path.join('units','tanks','Tank.ini')),os.path.join('units','tanks','Tank.ini'))
+            self.assertEqual(mymod.getini(os.path.join('units','tanks','Tank.ini')).core['name'].value,'tank')
+            self.assertIsNone(mymod.getfile(os.path.join('units','tanks','tank.ini')))
+            self.assertEqual(len(mymod.getfiles('units')),1)
+            os.makedirs(os.path.join(moddir,'units','air'))
+            with open(os.path.join(moddir,'units','air','plane.ini'),'w',encoding='utf-8') as f:
+                f.write('[core]\nname: plane')
+            self.assertEqual(len(mymod.getfiles('units')),2)
+            os.remove(os.path.join(moddir,'units','tanks','Tank.ini'))
+            self.assertIsNone(mymod.getini(os.path.join('units','tanks','Tank.ini')))
+            insensitive: Mod = Mod(moddir,case_sensitive=False)
+            self.assertEqual(insensitive.getfile('UNITS/AIR/PLANE.INI'),os.path.join('units','air','plane.ini'))
+
+
+    def test_iter_inis(self):
+
+        with tempfile.TemporaryDirectory() as tmp:
+            moddir = os.path.join(tmp,'mod')
+            mkmod(moddir)
+            os.makedirs(os.path.join(moddir,'units'))
+            for i in range(0,12):
+                with open(os.path.join(moddir,'units','u{0:02}.ini'.format(i)),'w',encoding='utf-8') as f:
+                    f.write('[core]\nname: u{0}\n[action_1]\ntext: """a\nb"""\n'.format(i))
+            with open(os.path.join(moddir,'units','bad.ini'),'wb') as f:
+                f.write(b'\xff\xfe')
+            mymod: Mod = Mod(moddir)
+            serial = [str(ini) for ini in mymod.getinis('units')]
+            self.assertEqual(len(serial),12)
+            self.assertEqual([str(ini) for ini in mymod.getinis('units',workers=4)],serial)
+            self.assertEqual([str(ini) for ini in mymod.getinis('units',workers=2,executor='process')],serial)
+            self.assertEqual(sorted(str(ini) for ini in mymod.iter_inis('units',workers=3)),sorted(serial))
+            cached: Mod = Mod(moddir,cache_dir=os.path.join(tmp,'cache'))
+            self.assertEqual([str(ini) for ini in cached.getinis('units',workers=2,executor='process')],serial)
+            self.assertEqual([str(ini) for ini in cached.getinis('units',workers=2)],serial)
+            self.assertEqual(cached.cache.hits,12)
+            with self.assertRaises(ValueError):
+                list(mymod.iter_inis('units',executor='fiber'))
+
+
+    def test_codelist(self):
+
+        self.assertEqual(CodeList(load_codelist()).namecheck[0],('name:','[core]'))
+        validator: Validator = Validator.load()
+        self.assertTrue(validator.has_section('hiddenAction_fire'))
+        self.assertTrue(validator.has_section('leg_2'))
+        self.assertFalse(validator.has_section('Spawn units line'))
+        self.assertEqual(validator.value_type('core','price'),'int')
+        self.assertEqual(validator.value_type('core','displayText_zh'),'string')
+        ini: Ini = Ini.create_ini('[core]\nname: a\nbogus: 1\n@define x: 1\n[nothing_1]\nx: 1','a.ini')
+        problems = validator.validate(ini)
+        self.assertEqual([(x.linenum,x.section,x.key) for x in problems],[(3,'core','bogus'),(5,'nothing_1',None)])
+        with tempfile.TemporaryDirectory() as tmp:
+            moddir = os.path.join(tmp,'mod')
+            mkmod(moddir)
+            for i in range(0,4):
+                with open(os.path.join(moddir,'u{0}.ini'.format(i)),'w',encoding='utf-8') as f:
+                    f.write('[core]\nname: u\nbogus: 1\n')
+            problems = validator.validate_mod(Mod(moddir),workers=2)
+            self.assertEqual(len([x for x in problems if x.key == 'bogus']),4)
+            self.assertEqual(problems,sorted(problems,key=lambda x: (x.filename,x.linenum)))
+
+
+    def test_compiled_codelist(self):
+
+        with tempfile.TemporaryDirectory() as tmp:
+            source = os.path.join(tmp,'codelist.json')
+            shutil.copy('codelist.json',source)
+            cache = os.path.join(tmp,'cache')
+            codelist = compiled.load(source,cache)
+            self.assertIs(compiled.load(source,cache),codelist)
+            self.assertEqual(len(codelist),len(load_codelist()['attributes']))
+            self.assertEqual(codelist.value_type('[core]','name:'),'string')
+            self.assertEqual(codelist.key_type('price'),'int')
+            self.assertIsNone(codelist.value_type('core','bogus'))
+            entry = codelist.describe('core','name')
+            self.assertEqual((entry.key,entry.section,entry.name),('name','core','名字'))
+            self.assertEqual(codelist.sections()[0],'core')
+            self.assertEqual(len(os.listdir(cache)),1)
+            # 只改变修改时间时沿用预编译文件，内容改变时重新编译
+            artifact = os.path.join(cache,os.listdir(cache)[0])
+            built = os.stat(artifact).st_ino
+            os.utime(source,ns=(1,1))
+            compiled._loaded.clear()
+            self.assertEqual(compiled.load(source,cache).value_type('core','price'),'int')
+            self.assertEqual(os.stat(artifact).st_ino,built)
+            with open(source,'w',encoding='utf-8') as f:
+                f.write('{"sections": [{"name": "core","attributes": [{"key": "price","value_type": "float"}]}]}')
+            compiled._loaded.clear()
+            codelist = compiled.load(source,cache)
+            self.assertEqual(codelist.value_type('core','price'),'float')
+            self.assertTrue(codelist.validator.has_section('core'))
+            # 大小和修改时间都不变的改动：编译时源文件刚修改过，由sha256发现
+            mtime = os.stat(source).st_mtime_ns
+            with open(source,'w',encoding='utf-8') as f:
+                f.write('{"sections": [{"name": "core","attributes": [{"key": "price","value_type": "fixed"}]}]}')
+            os.utime(source,ns=(mtime,mtime))
+            compiled._loaded.clear()
+            self.assertEqual(compiled.load(source,cache).value_type('core','price'),'fixed')
+            compiled._loaded.clear()
+
+
+    def test_completion(self):
+
+        with tempfile.TemporaryDirectory() as tmp:
+            index = CompletionIndex.load(cache_dir=tmp)
+            compiled._loaded.clear()
+        items = index.complete('projectile_1','li',3)
+        self.assertEqual([x.key for x in items],['life','lightCastOnGround','lightColor'])
+        self.assertEqual((items[0].value_type,items[0].name),('int','存在时间'))
+        self.assertEqual([x.key for x in index.complete('core','builtfrom_#_is')],['builtFrom_#_isLocked',
+        'builtFrom_#_isLockedMessage'])
+        self.assertEqual(index.complete('core','bfn',1,fuzzy=True)[0].key,'builtFrom_#_name')
+        self.assertEqual(index.complete('core','bfqq',fuzzy=True),[])
+        self.assertEqual(index.complete('core','bf',2,fuzzy=True)[0].key,'builtFrom_#_pos')
+        self.assertEqual(index.complete('Spawn units line','s'),[])
+        self.assertEqual(index.lookup('leg_2','copyfrom').key,'copyFrom')
+        self.assertIsNone(index.lookup('core','bogus'))
+        with tempfile.TemporaryDirectory() as tmp:
+            names = list(compiled.load(os.path.join(os.path.dirname(os.path.abspath(__file__)),'codelist.json'),
+            tmp).entries())
+            types = compiled.load(None,tmp).entries()
+            compiled._loaded.clear()
+        names.sort(key=lambda x: x.section != 'leg_#')
+        shuffled = CompletionIndex(types,names)
+        self.assertEqual(shuffled.complete('projectile_1','li',3),items)
+        self.assertEqual(shuffled.lookup('leg_2','copyfrom').name,index.lookup('leg_2','copyfrom').name)
+        self.assertEqual(shuffled.complete('core','price'),index.complete('core','price'))
+
+
+    def test_copyfrom(self):
+
+        ini: Ini = Ini.create_ini('[core]\nprice: 2')
+        ini.merge(Ini.create_ini('[core]\nprice: 1\nmass: 3\ncopyFrom: x.ini\n[hidden]\n@copyFrom_skipThisSection: true\nx: 1'))
+        self.assertEqual(str(ini),'\n[core]\nprice: 2\nmass: 3')
+        with tempfile.TemporaryDirectory() as tmp:
+            moddir = os.path.join(tmp,'mod')
+            mkmod(moddir)
+            os.makedirs(os.path.join(moddir,'units'))
+            files = {
+                'base.template': '[core]\ndont_load: true\nprice: 1\nmass: 5\n[graphics]\nimage: a.png',
+                os.path.join('units','mid.template'): '[core]\ncopyFrom: ROOT:base.template\ndont_load: true\nprice: 2',
+                os.path.join('units','a.ini'): '[core]\ncopyFrom: mid.template\nname: a',
+                os.path.join('units','b.ini'): '[core]\ncopyFrom: ROOT:base.template, mid.template\nname: b\nmass: 7'
+            }
+            for path,text in files.items():
+                with open(os.path.join(moddir,path),'w',encoding='utf-8') as f:
+                    f.write(text)
+            resolver = CopyFromResolver(Mod(moddir))
+            a = resolver.resolve(os.path.join('units','a.ini'))
+            self.assertEqual([(x.key,x.value) for x in a.core.getattrs()],
+            [('copyFrom','mid.template'),('name','a'),('price','2'),('mass','5')])
+            self.assertEqual(a.graphics['image'].value,'a.png')
+            b = resolver.resolve(os.path.join('units','b.ini'))
+            self.assertEqual((b.core['price'].value,b.core['mass'].value),('2','7'))
+            self.assertIs(resolver.resolve(os.path.join('units','mid.template')),resolver.resolve(os.path.join('units','mid.template')))
+            order = resolver.order()
+            self.assertLess(order.index('base.template'),order.index(os.path.join('units','mid.template')))
+            self.assertLess(order.index(os.path.join('units','mid.template')),order.index(os.path.join('units','a.ini')))
+            self.assertEqual(sorted(resolver.resolve_all('units')),[os.path.join('units','a.ini'),os.path.join('units','b.ini')])
+            with open(os.path.join(moddir,'base.template'),'a',encoding='utf-8') as f:
+                f.write('\nhp: 9')
+            resolver.invalidate('base.template')
+            self.assertEqual(resolver.resolve(os.path.join('units','a.ini')).graphics['hp'].value,'9')
+            with open(os.path.join(moddir,'base.template'),'w',encoding='utf-8') as f:
+                f.write('[core]\ncopyFrom: units/a.ini')
+            resolver.invalidate('base.template')
+            with self.assertRaises(CopyFromError):
+                resolver.resolve(os.path.join('units','a.ini'))
+
+
+    def test_mod_index_query(self):
+
+        with tempfile.TemporaryDirectory() as tmp:
+            moddir = os.path.join(tmp,'mod')
+            mkmod(moddir)
+            ranges = {'a.ini': '350','b.ini': '400','c.ini': '450.5','d.ini': 'none'}
+            for name,value in ranges.items():
+                with open(os.path.join(moddir,name),'w',encoding='utf-8') as f:
+                    f.write('[core]\nname: {0}\n[attack]\nmaxAttackRange: {1}\n[action_1]\nprice: 10'.format(name[0],value))
+            index = ModIndex(Mod(moddir))
+            self.assertEqual(index.query('attack.maxAttackRange > 400'),['c.ini'])
+            self.assertEqual(index.query('attack.maxAttackRange >= 400'),['b.ini','c.ini'])
+            self.assertEqual(index.query('attack.maxAttackRange == none'),['d.ini'])
+            self.assertEqual(index.query('attack.maxAttackRange < 400 and core.name ~ ^a'),['a.ini'])
+            self.assertEqual(index.query('action_*.price'),['a.ini','b.ini','c.ini','d.ini'])
+            hits = index.select('attack','maxAttackRange','<',400)
+            self.assertEqual([(x.file,x.section,x.linenum,x.value) for x in hits],[('a.ini','attack',4,'350')])
+            with self.assertRaises(ValueError):
+                index.query('attack.maxAttackRange > big')
+            with open(os.path.join(moddir,'a.ini'),'w',encoding='utf-8') as f:
+                f.write('[attack]\nmaxAttackRange: 900\n[action_2]\nprice: 1')
+            index.update('a.ini')
+            self.assertEqual(index.query('attack.maxAttackRange > 400'),['a.ini','c.ini'])
+            self.assertEqual(index.sections('action_*'),['action_1','action_2'])
+            os.remove(os.path.join(moddir,'b.ini'))
+            self.assertEqual(index.refresh(),['b.ini'])
+            self.assertEqual(index.query('action_1.price'),['c.ini','d.ini'])
+
+
+    def test_typed(self):
+
+        ini: Ini = Ini.create_ini('[core]\nprice: 100\nisBio: TRUE\naltNames: a, b\n[attack]\nmaxAttackRange: 400\n[action_1]\nprice: x')
+        self.assertEqual(ini.core.get_typed('price'),100)
+        self.assertIs(ini.core.get_typed('isBio'),True)
+        self.assertEqual(ini.core.get_typed('altNames'),['a','b'])
+        self.assertEqual(ini.attack.get_typed('maxAttackRange'),400.0)
+        self.assertIsNone(ini.core.get_typed('mass'))
+        attr: Attribute = ini.core['price']
+        self.assertEqual(attr.typed,100)
+        attr.value = '7'
+        self.assertEqual(attr.typed,7)
+        self.assertEqual(values.to_color('#80ff0000'),(255,0,0,128))
+        self.assertEqual(values.to_time('1.5s'),1.5)
+        column = values.column([ini,Ini(),Ini.create_ini('[core]\nprice: 3')],'core','price')
+        self.assertEqual(list(column[0:1]) + list(column[2:]),[7.0,3.0])
+        self.assertNotEqual(column[1],column[1])
+        self.assertEqual(values.decode_column([attr,None],'string'),['7',None])
+
+
+    def test_to_columns(self):
+
+        with tempfile.TemporaryDirectory() as tmp:
+            moddir = os.path.join(tmp,'mod')
+            mkmod(moddir)
+            files = {
+                'base.template': '[core]\ndont_load: true\nmaxHp: 50',
+                'a.ini': '[core]\ncopyFrom: base.template\nname: a\nprice: 100\n[attack]\nmaxAttackRange: 400',
+                'b.ini': '[core]\nname: b\nprice: x\nmaxHp: 70'
+            }
+            for path,text in files.items():
+                with open(os.path.join(moddir,path),'w',encoding='utf-8') as f:
+                    f.write(text)
+            mymod: Mod = Mod(moddir)
+            fields = ['core.price','core.maxHp','attack.maxAttackRange','core.name']
+            columns = mymod.to_columns(fields)
+            self.assertEqual(columns.files,['a.ini','b.ini'])
+            self.assertEqual([bool(x) for x in columns.mask('core.maxHp')],[False,True])
+            self.assertEqual(columns['core.price'][0],100.0)
+            self.assertFalse(columns.mask('core.price')[1])
+            self.assertEqual(list(columns['core.name']),['a','b'])
+            resolved = mymod.to_columns(fields,resolve=True)
+            self.assertEqual(list(resolved['core.maxHp']),[50.0,70.0])
+            parallel = mymod.to_columns(fields,resolve=True,workers=4)
+            self.assertEqual(parallel.files,resolved.files)
+            self.assertEqual(list(parallel['core.maxHp']),[50.0,70.0])
+            self.assertEqual(list(parallel['core.name']),['a','b'])
+            parsed = CopyFromResolver(mymod,{'a.ini': Ini.create_ini('[core]\ncopyFrom: base.template\nprice: 9')})
+            self.assertEqual([x.value for x in parsed.resolve('a.ini').core.getattrs()],['base.template','9','50'])
+            stream = io.StringIO()
+            resolved.write_csv(stream)
+            self.assertEqual(stream.getvalue(),'file,core.price,core.maxHp,attack.maxAttackRange,core.name\n'
+            'a.ini,100,50,400,a\nb.ini,,70,,b\n')
+            resolved.to_npy(os.path.join(tmp,'out'))
+            self.assertEqual(read_npy(os.path.join(tmp,'out','core.maxHp.npy'))[:2],('<f8',2))
+            self.assertEqual(read_npy(os.path.join(tmp,'out','core.price.mask.npy'))[2],b'\x01\x00')
+            with self.assertRaises(ValueError):
+                mymod.to_columns(['price'])
+
+
+    def test_archive_mod(self):
+
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp,'test.rwmod')
+            with zipfile.ZipFile(path,'w') as f:
+                f.writestr('test/mod-info.txt','[mod]\ntitle: test',compress_type=zipfile.ZIP_STORED)
+                f.writestr('test/units/a.ini','[core]\ncopyFrom: b.ini\r\nname: a',compress_type=zipfile.ZIP_DEFLATED)
+                f.writestr('test/units/b.ini','[core]\nmaxHp: 3\n',compress_type=zipfile.ZIP_STORED)
+                f.writestr('test/units/a.png',b'\x89PNG',compress_type=zipfile.ZIP_STORED)
+            with openmod(path) as mymod:
+                self.assertIsInstance(mymod,ArchiveMod)
+                self.assertEqual(mymod.root,'test')
+                self.assertEqual(mymod.modinfo.mod['title'].value,'test')
+                self.assertEqual(mymod.getfile('units/a.ini'),os.path.join('units','a.ini'))
+                self.assertIsNone(mymod.getfile('units/c.ini'))
+                self.assertEqual(len(mymod.getfiles('units')),3)
+                self.assertEqual(str(mymod.getini('units/a.ini')),'\n[core]\ncopyFrom: b.ini\nname: a')
+                self.assertEqual(str(mymod.getini('units/b.ini')),str(mymod.getini('units/b.ini',lazy=True)))
+                self.assertEqual(bytes(mymod.read('units/a.png')),b'\x89PNG')
+                self.assertEqual([ini.filename for ini in mymod.getinis('units',workers=2)],
+                [os.path.join(path,'units','a.ini'),os.path.join(path,'units','b.ini')])
+                resolved = CopyFromResolver(mymod).resolve('units/a.ini')
+                self.assertEqual(resolved.core['maxHp'].value,'3')
+                # 未压缩成员的LazyIni直接使用mmap上的数据，关闭压缩包后仍可访问
+                self.assertIsInstance(mymod.read('units/b.ini'),memoryview)
+                lazy = mymod.getini('units/b.ini',lazy=True)
+            self.assertEqual(lazy.core['maxHp'].value,'3')
+            self.assertEqual(str(lazy),str(Ini.create_ini('[core]\nmaxHp: 3\n')))
+            with openmod(path,case_sensitive=False) as mymod:
+                self.assertEqual(mymod.getfile('UNITS/A.INI'),os.path.join('units','a.ini'))
+            with self.assertRaises(TypeError):
+                openmod(path,cache_dir=tmp)
+
+
+    def test_pack(self):
+
+        with tempfile.TemporaryDirectory() as tmp:
+            moddir = os.path.join(tmp,'mod')
+            mkmod(moddir)
+            for i in range(0,5):
+                with open(os.path.join(moddir,'u{0}.ini'.format(i)),'w',encoding='utf-8') as f:
+                    f.write('[core]\nname: u{0}\n'.format(i) + '#padding\n' * 50)
+            with open(os.path.join(moddir,'u0.png'),'wb') as f:
+                f.write(b'\x89PNG' * 100)
+            output = os.path.join(tmp,'mod.rwmod')
+            stats = Mod(moddir).pack(output,workers=2)
+            self.assertEqual((stats.files,stats.reused,stats.compressed,stats.stored),(7,0,6,1))
+            with open(output,'rb') as f:
+                first = f.read()
+            self.assertEqual(Mod(moddir).pack(output).reused,6)
+            with open(output,'rb') as f:
+                self.assertEqual(f.read(),first)
+            with open(os.path.join(moddir,'u1.ini'),'a',encoding='utf-8') as f:
+                f.write('price: 5')
+            stats = Mod(moddir).pack(output)
+            self.assertEqual((stats.reused,stats.compressed),(5,1))
+            with zipfile.ZipFile(output) as f:
+                self.assertIsNone(f.testzip())
+                self.assertEqual(f.getinfo('u0.png').compress_type,zipfile.ZIP_STORED)
+                self.assertEqual(f.getinfo('u1.ini').date_time,(1980,1,1,0,0,0))
+            with ArchiveMod(output) as archive:
+                self.assertEqual(str(archive.getini('u1.ini')),str(Mod(moddir).getini('u1.ini')))
+            # 压缩级别不同时不复用上一次的压缩结果
+            stats = Mod(moddir).pack(output,level=9)
+            self.assertEqual((stats.reused,stats.compressed),(0,6))
+            with zipfile.ZipFile(output) as f:
+                self.assertTrue(f.getinfo('u1.ini').comment.endswith(b':9'))
+                self.assertIsNone(f.testzip())
+            with open(os.path.join(moddir,'big.txt'),'wb') as f:
+                f.write(bytes(range(0,256)) * 20000)
+            stats = Mod(moddir).pack(output,level=9)
+            self.assertEqual((stats.reused,stats.compressed),(6,1))
+            with zipfile.ZipFile(output) as f:
+                self.assertEqual(f.read('big.txt'),bytes(range(0,256)) * 20000)
+
+
+    def test_watch(self):
+
+        with tempfile.TemporaryDirectory() as tmp:
+            moddir = os.path.join(tmp,'mod')
+            mkmod(moddir)
+            with open(os.path.join(moddir,'a.ini'),'w',encoding='utf-8') as f:
+                f.write('[core]\nprice: 1')
+            mymod: Mod = Mod(moddir)
+            index = ModIndex(mymod)
+            watcher = Watcher(mymod,backend='poll')
+            watcher.subscribe(index.apply)
+            self.assertEqual(watcher.poll(),[])
+            with open(os.path.join(moddir,'b.ini'),'w',encoding='utf-8') as f:
+                f.write('[core]\nprice: 500')
+            os.remove(os.path.join(moddir,'a.ini'))
+            changes = watcher.poll()
+            self.assertEqual([(x.kind,x.path) for x in changes],[(REMOVED,'a.ini'),(ADDED,'b.ini')])
+            self.assertEqual(changes[1].ini.core['price'].value,'500')
+            self.assertEqual(index.query('core.price > 0'),['b.ini'])
+            with open(os.path.join(moddir,'b.ini'),'w',encoding='utf-8') as f:
+                f.write('[core]\nx: """')
+            changes = watcher.poll()
+            self.assertEqual(changes[0].kind,CHANGED)
+            self.assertIsInstance(changes[0].error,IniSyntaxError)
+            # 不启动后台线程，逐次调用step；debounce之内的变化合并为一次通知
+            batches = []
+            stepped = Watcher(mymod,backend='poll',debounce=3600)
+            stepped.subscribe(batches.append)
+            for i in range(0,5):
+                with open(os.path.join(moddir,'b.ini'),'w',encoding='utf-8') as f:
+                    f.write('[core]\nprice: {0}'.format(i) + ' ' * i)
+                self.assertEqual(stepped.step(),[])
+            self.assertEqual(batches,[])
+            stepped = Watcher(mymod,backend='poll',debounce=0)
+            stepped.subscribe(batches.append)
+            with open(os.path.join(moddir,'b.ini'),'w',encoding='utf-8') as f:
+                f.write('[core]\nprice: 5     ')
+            with open(os.path.join(moddir,'c.ini'),'w',encoding='utf-8') as f:
+                f.write('[core]\nprice: 6')
+            changes = stepped.step()
+            self.assertEqual(batches,[changes])
+            self.assertEqual([(x.kind,x.path) for x in changes],[(CHANGED,'b.ini'),(ADDED,'c.ini')])
+            self.assertEqual(changes[0].ini.core['price'].value.strip(),'5')
+            self.assertEqual(stepped.step(),[])
+            # inotify队列溢出：溢出期间的事件已丢失，应重新监视并比较全部文件
+            try:
+                overflowed = Watcher(mymod,backend='inotify',debounce=0)
+            except OSError:
+                return
+            inotify = overflowed._Watcher__inotify
+            with open(os.path.join(moddir,'c.ini'),'w',encoding='utf-8') as f:
+                f.write('[core]\nprice: 7')
+            os.makedirs(os.path.join(moddir,'new'))
+            with open(os.path.join(moddir,'new','d.ini'),'w',encoding='utf-8') as f:
+                f.write('[core]\nprice: 8')
+            while inotify.read(0):
+                pass
+            events = inotify.parse(watch._EVENT.pack(-1,watch._IN_Q_OVERFLOW,0,0))
+            self.assertEqual(events,[('','',watch._IN_Q_OVERFLOW)])
+            inotify.read = lambda timeout: events
+            changes = overflowed.step()
+            del inotify.read
+            self.assertEqual([(x.kind,x.path) for x in changes],[(CHANGED,'c.ini'),(ADDED,os.path.join('new','d.ini'))])
+            with open(os.path.join(moddir,'new','d.ini'),'w',encoding='utf-8') as f:
+                f.write('[core]\nprice: 9')
+            changes = overflowed.step(1.0)
+            self.assertEqual([(x.kind,x.path) for x in changes],[(CHANGED,os.path.join('new','d.ini'))])
+            overflowed.close()
+
+
+    def test_minimal_write(self):
+
+        text = '#head\r\n[core]\r\nname:a\r\nprice :  5   \r\n# c\r\n\r\n[attack]\r\nrange:4\r\n'
+        ini = Ini.create_ini(text,keep_source=True)
+        self.assertEqual(''.join(ini.iter_patch_chunks()),text)
+        ini.core['price'].value = '7'
+        ini.attack.name = 'turret'
+        ini.core.remove_attribute('name')
+        self.assertEqual(''.join(ini.iter_patch_chunks()),
+        '#head\r\n[core]\r\nprice :  7   \r\n# c\r\n\r\n[turret]\r\nrange:4\r\n')
+        ini.turret.append(Attribute('hp','3'))
+
+        with tempfile.TemporaryDirectory() as tmp:
+            ini.filename = os.path.join(tmp,'a.ini')
+            ini.write(minimal=True)
+            with open(ini.filename,'rb') as f:
+                self.assertEqual(f.read(),ini.source.encode('utf-8'))
+            self.assertTrue(ini.source.endswith('[turret]\r\nrange:4\r\n\r\nhp: 3'))
+            ini.core['price'].value = '8'
+            self.assertEqual(''.join(ini.iter_patch_chunks()),ini.source.replace('7','8'))
+            ini.turret['range'].key = 'maxRange'
+            ini.write(minimal=True)
+            self.assertTrue(ini.source.endswith('[turret]\r\nmaxRange: 4\r\n\r\nhp: 3'))
+            ini.turret['hp'].value = '10'
+            ini.core['price'].value = '123'
+            ini.turret.name = 'turret_1'
+            ini.write(minimal=True)
+            self.assertEqual(ini.source,
+            '#head\r\n[core]\r\nprice :  123   \r\n# c\r\n\r\n[turret_1]\r\nmaxRange: 4\r\n\r\nhp: 10')
+            ini.turret_1['hp'].value = '3'
+            self.assertEqual(''.join(ini.iter_patch_chunks()),ini.source.replace('10','3'))
+            ini.write()
+            self.assertIsNone(ini.source)
+
+            moddir = os.path.join(tmp,'mod')
+            os.makedirs(moddir)
+            with open(os.path.join(moddir,'u.ini'),'w',encoding='utf-8') as f:
+                f.write('[core]\nname:u\nprice:1\n')
+            with Mod(moddir).transaction() as tx:
+                tx.getini('u.ini').core['price'].value = '2'
+            with open(os.path.join(moddir,'u.ini'),'r',encoding='utf-8') as f:
+                self.assertEqual(f.read(),'[core]\nname:u\nprice:2\n')
+
+
+    def test_transaction(self):
+
+        ini = Ini.create_ini('#head\n[core]\nname: a\nprice: 1\n')
+        self.assertFalse(ini.dirty)
+        ini.core['price'].value = '2'
+        self.assertTrue(ini.dirty)
+        ini.mark_clean()
+        self.assertFalse(ini.dirty)
+        ini.core.append(Attribute('hp','5'))
+        self.assertTrue(ini.dirty)
+        self.assertFalse(Ini.from_compact(ini.to_compact()).dirty)
+
+        with tempfile.TemporaryDirectory() as moddir:
+            for i in range(0,5):
+                with open(os.path.join(moddir,'u{0}.ini'.format(i)),'w',encoding='utf-8') as f:
+                    f.write('[core]\nname: u{0}\nprice: 1\n'.format(i))
+            mod = Mod(moddir)
+            mtime = os.stat(os.path.join(moddir,'u0.ini')).st_mtime_ns
+
+            with mod.transaction(workers=2) as tx:
+                for ini in tx.getinis():
+                    if ini.core['name'].value.strip() in ('u1','u3'):
+                        ini.core['price'].value = '7'
+                self.assertIs(tx.getini('u1.ini'),tx.getini('u1.ini'))
+                tx.newini('u5.ini','[core]\nname: u5\n')
+                self.assertEqual(tx.dirty,['u1.ini','u3.ini','u5.ini'])
+
+            self.assertEqual(tx.dirty,[])
+            self.assertEqual(mod.getini('u3.ini').core['price'].value,'7')
+            self.assertEqual(mod.getini('u5.ini').core['name'].value,'u5')
+            self.assertEqual(os.stat(os.path.join(moddir,'u0.ini')).st_mtime_ns,mtime)
+
+            with self.assertRaises(KeyError):
+                with mod.transaction() as tx:
+                    tx.getini('u2.ini').core['price'].value = '9'
+                    raise KeyError()
+            self.assertEqual(mod.getini('u2.ini').core['price'].value,'1')
+
+            # 替换到文件夹z.ini时失败，已替换的u2.ini应被恢复
+            os.makedirs(os.path.join(moddir,'z.ini','sub'))
+            tx = mod.transaction()
+            tx.getini('u2.ini').core['price'].value = '9'
+            tx.newini('z.ini','[core]\n')
+            with self.assertRaises(OSError):
+                tx.commit()
+            self.assertEqual(mod.getini('u2.ini').core['price'].value,'1')
+            self.assertEqual(sorted(os.listdir(moddir)),['u{0}.ini'.format(i) for i in range(0,6)] + ['z.ini'])
+
+
+    def test_diff(self):
+
+        a = Ini.create_ini('[core]\nname: a\nprice: 1\n')
+        b = Ini.create_ini('[core]\nname:a\nprice:  1\n')
+        self.assertTrue(a.core.same_content(b.core))
+        self.assertNotEqual(a.core,b.core)
+        self.assertEqual(len({a.core,b.core,a.core}),2)
+        self.assertEqual(a.content_hash,b.content_hash)
+        b.core['price'].value = '2'
+        self.assertFalse(a.core.same_content(b.core))
+        b.core['price'].value = '1'
+        self.assertEqual(a.content_hash,b.content_hash)
+        b.core.append(Attribute('hp','3'))
+        self.assertNotEqual(a.core.content_hash,b.core.content_hash)
+        # 哈希缓存到所属段落中的属性被修改为止，与其他ini中的修改无关
+        first: Section = a.core
+        digest: bytes = first.content_hash
+        b.core['hp'].value = '4'
+        self.assertIs(first.content_hash,digest)
+        copy: Section = Section('core')
+        copy.elements.extend(first.elements)
+        self.assertEqual(copy.content_hash,digest)
+        first.elements[1].value = '5'
+        self.assertNotEqual(first.content_hash,digest)
+        self.assertEqual(copy.content_hash,first.content_hash)
+
+        with tempfile.TemporaryDirectory() as tmp:
+            dirs = [os.path.join(tmp,'a'),os.path.join(tmp,'b')]
+            files = {
+            'same.ini': ('[core]\nname: s\n','[core]\nname: s\n'),
+            'unit.ini': ('[core]\nname: u\nprice: 1\nhp: 5\n[graphics]\nimage: u.png\n[attack]\nx: 1\n',
+            '[core]\nname: u\nprice: 2\nspeed: 3\n\n[graphics]\nimage: u.png\n'),
+            'old.ini': ('[core]\n',None),
+            'new.ini': (None,'[core]\n'),
+            'head.ini': ('name:x\n[core]\na: 1\na: 2\n','name:y\n[core]\na: 3\na: 2\n'),
+            'note.ini': ('[core]\n# a\nx: 1\n','[core]\n# b\nx: 1\n')}
+            for i in (0,1):
+                os.makedirs(dirs[i])
+                for name,texts in files.items():
+                    if texts[i] is not None:
+                        with open(os.path.join(dirs[i],name),'w',encoding='utf-8') as f:
+                            f.write(texts[i])
+            result = diff(Mod(dirs[0]),Mod(dirs[1]),workers=2)
+            self.assertEqual([(d.kind,d.file,d.section,d.key) for d in result],[
+            (CHANGED,'head.ini','','name'),
+            (CHANGED,'head.ini','core','a'),
+            (ADDED,'new.ini',None,None),
+            (CHANGED,'note.ini',None,None),
+            (REMOVED,'old.ini',None,None),
+            (CHANGED,'unit.ini','core','price'),
+            (REMOVED,'unit.ini','core','hp'),
+            (ADDED,'unit.ini','core','speed'),
+            (REMOVED,'unit.ini','attack',None)])
+            self.assertEqual((result[0].old,result[0].new),('x','y'))
+            self.assertEqual((result[1].old,result[1].new,result[1].old_line),('1','3',3))
+            self.assertEqual((result[5].old,result[5].new,result[5].old_line,result[5].new_line),('1','2',3,3))
+            self.assertEqual(result[7].new_line,4)
+
+
+    def test_apply_text_edit(self):
+
+        text = '# head\n[core]\nname: a\nx: """\nb\n"""\n[attack]\ncanAttack: true\n[turret_1]\nx: 1\n# end'
+        ini = Ini.create_ini(text,'a.ini',True)
+        lines = text.split('\n')
+        core,attack,turret = ini.sections
+        edits = [(3,4,'name: b\nprice: 1\n'),(1,1,'[graphics]\n'),(9,11,'m: """\n[attack]\ncanAttack: true"""\n'),
+        (1,1,'# top\n')]
+        for start,end,new in edits:
+            lines[start - 1:end - 1] = new.split('\n')[:-1]
+            changed = ini.apply_text_edit(start,end,new)
+            full = Ini.create_ini('\n'.join(lines),'a.ini')
+            self.assertEqual(ini.to_compact(),full.to_compact())
+            self.assertTrue(all(sec in ini.sections for sec in changed))
+        # 跨越[attack]的多行文本结束之后原来的段落对象被沿用，行号随之移动
+        self.assertIs(ini.sections[-1],turret)
+        self.assertEqual((turret.linenum,turret['x'].linenum),(13,14))
+        self.assertEqual([sec.name for sec in ini.sections],['graphics','core','turret_1'])
+        self.assertIs(ini.section_at(5),ini.sections[1])
+        self.assertIsNone(ini.section_at(1))
+        self.assertEqual(ini.source,'\n'.join(lines))
+        ini.core['name'].value = 'c'
+        lines[lines.index('name: b')] = 'name: c'
+        self.assertEqual(''.join(ini.iter_patch_chunks()),'\n'.join(lines))
+        # 文本之外的修改在下一次编辑之前写回文本
+        with self.assertRaises(IniSyntaxError):
+            ini.apply_text_edit(15,16,'y: """\n')
+        self.assertEqual(ini.source,'\n'.join(lines))
+        with self.assertRaises(ValueError):
+            ini.apply_text_edit(3,20,'')
+        ini.append(Section('extra'))
+        ini.turret_1.append(Attribute('y','2'))
+        ini.apply_text_edit(1,1,'# x\n')
+        lines.extend(['y: 2','[extra]'])
+        lines.insert(0,'# x')
+        self.assertEqual(ini.source,'\n'.join(lines))
+        self.assertEqual(ini.to_compact(),Ini.create_ini(ini.source,'a.ini').to_compact())
+        self.assertEqual((turret.linenum,turret['x'].linenum,ini.extra.linenum),(14,15,18))
+        with self.assertRaises(ValueError):
+            Ini.create_ini(text).apply_text_edit(1,1,'')
+
+        ini = Ini.create_ini('[core]\nname: a\nprice: 5\n[graphics]\nimage: u.png\n','t.ini',True)
+        ini.apply_text_edit(5,6,'image: v.png\n')
+        ini.core['price'].value = '99'
+        ini.apply_text_edit(2,3,'name: c\n')
+        self.assertEqual(ini.source,'[core]\nname: c\nprice: 99\n[graphics]\nimage: v.png\n')
+        self.assertEqual(ini.core['price'].value.strip(),'99')
+
+
+    def test_lsp_document(self):
+
+        text = '# head\n[core]\nname: a\nx: """\nb\n"""\n[attack]\ncanAttack: true\n[turret_1]\nx: 1'
+        doc = Document('file:///tmp/a.ini',text)
+        core,attack,turret = doc.ini.sections
+        edits = [((2,6),(2,7),'bb\nprice: 1'),((0,0),(0,0),'[graphics]\n'),((6,0),(6,3),'"""\n'),
+        ((5,0),(5,0),'y: 2\n'),((9,0),(9,1),'[attack'),((1,0),(1,10),'')]
+        for start,end,new in edits:
+            doc.apply_change(start,end,new)
+            full = Ini.create_ini(doc.text)
+            self.assertEqual(str(doc.ini),str(full))
+            self.assertEqual([n for n,sec in doc.iter_sections()],[sec.linenum for sec in full.sections])
+        self.assertIs(doc.ini.sections[-1],turret)
+        self.assertIs(doc.ini.sections[-2],attack)
+        self.assertIsNot(doc.ini.sections[1],core)
+        last = len(doc.text.split('\n')) - 1
+        doc.apply_change((last,3),(last,3),'\nw: """')
+        self.assertIsNotNone(doc.error)
+        doc.apply_change((last,3),(last + 1,6),'')
+        self.assertIsNone(doc.error)
+        self.assertEqual(str(doc.ini),str(Ini.create_ini(doc.text)))
+
+
+    def test_lsp_server(self):
+
+        self.assertEqual(uri_to_path('file:///C:/x',ntpath),'C:\\x')
+        self.assertEqual(uri_to_path('file:///c%3A/mod%20a/%E5%8D%95%E4%BD%8D.ini',ntpath),'c:\\mod a\\单位.ini')
+        self.assertEqual(uri_to_path('file://server/share/a.ini',ntpath),'\\\\server\\share\\a.ini')
+        self.assertEqual(path_to_uri('C:\\x',ntpath),'file:///C:/x')
+        self.assertEqual(path_to_uri('C:\\mod a\\单位.ini',ntpath),'file:///C:/mod%20a/%E5%8D%95%E4%BD%8D.ini')
+        self.assertEqual(uri_to_path(path_to_uri('\\\\server\\share\\a.ini',ntpath),ntpath),'\\\\server\\share\\a.ini')
+        self.assertEqual(uri_to_path(path_to_uri('/tmp/mod a/x.ini',posixpath),posixpath),'/tmp/mod a/x.ini')
+        with tempfile.TemporaryDirectory() as tmp:
+            os.makedirs(os.path.join(tmp,'units'))
+            with open(os.path.join(tmp,'units','base.ini'),'w',encoding='utf-8') as f:
+                f.write('[core]\nname: base\n')
+            path = os.path.join(tmp,'units','a.ini')
+            uri = path_to_uri(path)
+            requests = [
+            {'id': 1,'method': 'initialize','params': {'rootUri': path_to_uri(tmp)}},
+            {'method': 'textDocument/didOpen','params': {'textDocument': {'uri': uri,'version': 1,
+            'text': '[core]\ncopyFrom: base.ini\nbogus: 1\n[projectile_1]\nli'}}},
+            {'method': 'textDocument/didChange','params': {'textDocument': {'uri': uri,'version': 2},
+            'contentChanges': [{'range': {'start': {'line': 2,'character': 0},'end': {'line': 3,'character': 0}},
+            'text': 'price: 1\nfoo: 2\n'}]}},
+            {'id': 2,'method': 'textDocument/completion','params': {'textDocument': {'uri': uri},
+            'position': {'line': 5,'character': 2}}},
+            {'id': 3,'method': 'textDocument/hover','params': {'textDocument': {'uri': uri},
+            'position': {'line': 2,'character': 1}}},
+            {'id': 4,'method': 'textDocument/definition','params': {'textDocument': {'uri': uri},
+            'position': {'line': 1,'character': 12}}},
+            {'id': 5,'method': 'unknown/method'},
+            {'id': 7,'method': 'textDocument/hover','params': {'textDocument': {'uri': uri},
+            'position': {'line': 2,'character': None}}},
+            {'method': 'textDocument/didChange','params': {}},
+            {'id': 6,'method': 'shutdown'},
+            {'method': 'exit'}]
+            reader = io.BytesIO()
+            for request in requests:
+                write_message(reader,dict(request,jsonrpc='2.0'))
+            reader.seek(0)
+            writer = io.BytesIO()
+            with tempfile.TemporaryDirectory() as cache:
+                index = CompletionIndex.load(cache_dir=cache)
+                compiled._loaded.clear()
+            self.assertEqual(Server(reader,writer,index=index).serve(),0)
+            writer.seek(0)
+            replies = {}
+            diagnostics = []
+            logs = []
+            message = read_message(writer)
+            while message is not None:
+                if 'id' in message:
+                    replies[message['id']] = message
+                elif message['method'] == 'window/logMessage':
+                    logs.append(message['params'])
+                else:
+                    diagnostics.append(message['params'])
+                message = read_message(writer)
+            self.assertEqual(replies[1]['result']['capabilities']['textDocumentSync']['change'],2)
+            self.assertEqual([d['range']['start']['line'] for d in diagnostics[-1]['diagnostics']],[3])
+            self.assertEqual(diagnostics[-1]['version'],2)
+            self.assertEqual([x['label'] for x in replies[2]['result']['items']][0:2],['life','lightCastOnGround'])
+            self.assertIn('价格',replies[3]['result']['contents']['value'])
+            self.assertEqual(replies[4]['result'][0]['uri'],path_to_uri(os.path.join(tmp,'units','base.ini')))
+            self.assertEqual(replies[5]['error']['code'],-32601)
+            # 处理时的异常不会终止服务器
+            self.assertEqual(replies[7]['error']['code'],-32603)
+            self.assertIn('TypeError',replies[7]['error']['message'])
+            self.assertEqual([log['type'] for log in logs],[1])
+            self.assertIn('textDocument/didChange',logs[0]['message'])
+            self.assertIn(6,replies)
+
+
+    def test_benchmarks(self):
+
+        self.assertEqual(generate_texts(12,3),generate_texts(12,3))
+        self.assertEqual(generate_texts(12)[unit_path(7)],generate_texts(30)[unit_path(7)])
+        self.assertNotEqual(generate_texts(12,3)[unit_path(7)],generate_texts(12,4)[unit_path(7)])
+        with tempfile.TemporaryDirectory() as tmp:
+            paths = generate_mod(tmp,12)
+            mod = Mod(tmp)
+            self.assertEqual(mod.modinfo.mod['title'].value,'benchmark')
+            inis = [mod.getini(path) for path in paths]
+            self.assertTrue(all(ini.core is not None and ini.attack is not None for ini in inis))
+            self.assertTrue(any(ini.action_1 is not None and ini.projectile_1 is not None for ini in inis))
+            resolved = CopyFromResolver(mod).resolve(unit_path(7))
+            self.assertEqual(resolved.core['techLevel'].value,'4')
+            self.assertEqual(resolved.movement['movementType'].value,'WATER')
+            self.assertEqual(resolved.core['name'].value,'unit_7')
+        results = benchmarks.run(['create_ini','lookup'],[2],2)
+        self.assertEqual([(x['name'],x['size'],x['samples']) for x in results['results']],
+        [('create_ini',2,2),('lookup',2,2)])
+        slower = dict(results,results=[dict(x,best=x['best'] * 2) for x in results['results']])
+        self.assertEqual([x.name for x in benchmarks.compare(results,slower)],['create_ini','lookup'])
+        self.assertEqual(benchmarks.compare(slower,results),[])
+        self.assertEqual(set(x['unit'] for x in results['results']),{'s'})
+        memory = benchmarks.run(['memory'],[2],2)['results'][0]
+        self.assertEqual(memory['unit'],'bytes')
+        self.assertTrue(16 < memory['best'] < 4096)
+        larger = {'results': [dict(memory,best=memory['best'] * 2)]}
+        self.assertEqual(benchmarks.compare({'results': [memory]},larger)[0].unit,'bytes')
+        with tempfile.TemporaryDirectory() as tmp:
+            for name,benchmark in benchmarks.BENCHMARKS.items():
+                benchmark(2,tmp)()
+
+
     def test_mod(self):
         
         if os.path.exists('mymod'):
@@ -50,6 +951,7 @@ class Test(unittest.TestCase):
         mymod: Mod = mkmod('mymod')
         mymod.newini('abc.ini','#这是一个测试！')
         self.assertEqual(isinstance(mymod.getini('abc.ini'),Ini),True,'ini获取失败！')
+        self.assertEqual(str(mymod.getini('abc.ini',lazy=True)),str(mymod.getini('abc.ini')))
         self.assertEqual(str(mymod.getini('abc.ini')).strip(),'#这是一个测试！',\
         'ini文件不匹配，内容竟为{}，而要求内容为{}'.format(str(mymod.getini('abc.ini')).strip(),'#这是一个测试！'))
         mymod.rmini('abc.ini')